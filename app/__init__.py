@@ -5,12 +5,14 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
 from flask_wtf.csrf import CSRFProtect
+from app.sql_monitor import SQLMonitor
 
 db = SQLAlchemy()
 migrate = Migrate()
 login = LoginManager()
 login.login_view = 'main.login'
 csrf = CSRFProtect()
+sql_monitor = SQLMonitor()
 
 def create_app(config_class=Config):
     app = Flask(__name__)
@@ -19,6 +21,7 @@ def create_app(config_class=Config):
     if not os.path.exists(app.instance_path):
         os.makedirs(app.instance_path)
 
+    sql_monitor.init_app(app)
     db.init_app(app)
     migrate.init_app(app, db)
     login.init_app(app)
@@ -0,0 +1,163 @@
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+from app import db
+from app.models import User, License, AuditEntry
+from app.notifications import enqueue_by_message
+from app.user_deletion import delete_users
+from app.user_directory import adjust_counters
+
+
+# Colas de aprobación (funcionarios pendientes y licencias pendientes).
+# Cada acción recibe una lista de ids y se resuelve con una sentencia sobre todas las filas
+# que siguen pendientes y están al alcance de quien actúa, una entrada en audit_entry y los
+# avisos encolados por mensaje (un INSERT ... SELECT por texto distinto).
+# Las acciones de una sola fila usan las mismas funciones con una lista de un elemento.
+
+LICENSE_VALIDITY_DAYS = 30
+
+
+def parse_ids(values):
+    """Ids enteros únicos de una lista de valores de formulario (se ignoran los no numéricos)."""
+    return sorted({int(v) for v in values if str(v).isdigit()})
+
+def record_audit(actor, action, target_ids):
+    """Una fila de audit_entry para la acción completa. El llamador hace commit."""
+    target_ids = sorted(target_ids)
+    entry = AuditEntry(
+        actor_id=actor.id if actor else None,
+        action=action,
+        target_ids=json.dumps(target_ids),
+        target_count=len(target_ids)
+    )
+    db.session.add(entry)
+    return entry
+
+def _update_returning(model, condition, values, *columns):
+    """UPDATE de las filas que cumplen `condition`; devuelve `columns` de las filas afectadas."""
+    stmt = update(model).where(condition).values(**values).execution_options(synchronize_session=False)
+    if db.engine.dialect.update_returning:
+        return db.session.execute(stmt.returning(*columns)).all()
+    rows = db.session.query(*columns).filter(condition).all()
+    db.session.execute(stmt)
+    return rows
+
+
+# --- FUNCIONARIOS ---
+
+def pending_officials_filter(leader):
+    """Solicitudes de funcionario que `leader` puede resolver (Gobierno: todas; resto: su dpto.)."""
+    condition = (User.official_status == 'Pendiente') & (User.badge_id != None)
+    if leader.department != 'Gobierno':
+        condition &= User.department == leader.department
+    return condition
+
+def approve_officials(user_ids, leader):
+    """Aprueba las solicitudes pendientes indicadas. Devuelve los ids aprobados. El llamador hace commit."""
+    if not user_ids:
+        return []
+    rows = _update_returning(
+        User, User.id.in_(user_ids) & pending_officials_filter(leader),
+        {'official_status': 'Aprobado'}, User.id, User.department
+    )
+    approved = [user_id for user_id, _ in rows]
+    if not approved:
+        return []
+
+    # El UPDATE en bloque no pasa por los eventos de User que mantienen los contadores
+    adjust_counters({'status:Pendiente': -len(approved), 'status:Aprobado': len(approved)})
+
+    record_audit(leader, 'official.approve', approved)
+    users_by_message = {}
+    for user_id, department in rows:
+        message = (
+            f"✅ **Solicitud Aprobada**\nTu solicitud de funcionario en **{department}** ha sido aprobada. "
+            "Ya puedes acceder al panel oficial."
+        )
+        users_by_message.setdefault(message, []).append(user_id)
+    enqueue_by_message(users_by_message)
+    return approved
+
+def deny_officials(user_ids, leader):
+    """Deniega y elimina las solicitudes pendientes indicadas. Devuelve los ids eliminados. El llamador hace commit."""
+    if not user_ids:
+        return []
+    denied = [
+        user_id for (user_id,) in
+        db.session.query(User.id).filter(User.id.in_(user_ids), pending_officials_filter(leader))
+    ]
+    if not denied:
+        return []
+
+    # Los avisos copian el discord_id a la outbox, así que se encolan antes de borrar las cuentas
+    enqueue_by_message({
+        "❌ **Solicitud Denegada**\nTu solicitud de funcionario ha sido denegada y la cuenta eliminada.": denied
+    })
+    record_audit(leader, 'official.deny', denied)
+    delete_users(denied)
+    return denied
+
+
+# --- LICENCIAS ---
+
+def _license_message(action, types, expiration_date=None):
+    listed = ', '.join(f"'{t}'" for t in types)
+    if action == 'approve':
+        if len(types) == 1:
+            return (
+                f"✅ **Licencia Aprobada**\nTu licencia {listed} ha sido aprobada "
+                f"y es válida hasta el {expiration_date}."
+            )
+        return (
+            f"✅ **Licencias Aprobadas**\nTus licencias {listed} han sido aprobadas "
+            f"y son válidas hasta el {expiration_date}."
+        )
+    if len(types) == 1:
+        return (
+            f"❌ **Licencia Rechazada**\nTu solicitud para la licencia {listed} ha sido rechazada. "
+            "Contacta a SABES para más información."
+        )
+    return (
+        f"❌ **Licencias Rechazadas**\nTus solicitudes para las licencias {listed} han sido rechazadas. "
+        "Contacta a SABES para más información."
+    )
+
+def _resolve_licenses(license_ids, official, action, values, expiration_date=None):
+    if not license_ids:
+        return []
+    rows = _update_returning(
+        License, License.id.in_(license_ids) & (License.status == 'Pendiente'),
+        values, License.id, License.user_id, License.type
+    )
+    if not rows:
+        return []
+
+    resolved = [license_id for license_id, _, _ in rows]
+    record_audit(official, f'license.{action}', resolved)
+
+    types_by_user = {}
+    for _, user_id, license_type in rows:
+        if user_id is not None:
+            types_by_user.setdefault(user_id, set()).add(license_type)
+    users_by_message = {}
+    for user_id, types in types_by_user.items():
+        message = _license_message(action, sorted(types), expiration_date)
+        users_by_message.setdefault(message, []).append(user_id)
+    enqueue_by_message(users_by_message)
+    return resolved
+
+def approve_licenses(license_ids, official, today=None):
+    """Activa las licencias pendientes indicadas por LICENSE_VALIDITY_DAYS días. Devuelve los ids. El llamador hace commit."""
+    today = today or datetime.utcnow().date()
+    expiration_date = today + timedelta(days=LICENSE_VALIDITY_DAYS)
+    return _resolve_licenses(
+        license_ids, official, 'approve',
+        {'status': 'Activa', 'issue_date': today, 'expiration_date': expiration_date},
+        expiration_date
+    )
+
+def reject_licenses(license_ids, official):
+    """Rechaza las licencias pendientes indicadas. Devuelve los ids. El llamador hace commit."""
+    return _resolve_licenses(license_ids, official, 'reject', {'status': 'Rechazada'})
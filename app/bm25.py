@@ -0,0 +1,368 @@
+import heapq
+import math
+import os
+import re
+import tempfile
+import threading
+import zlib
+
+from flask import current_app
+
+from app import db
+from app.models import CacheVersion, Document
+from app.search import tokenize, spanish_stem
+
+
+# Índice invertido en memoria (BM25) para SAFinder, alternativa a FTS5/tsvector.
+# Se activa con SAFINDER_SEARCH_BACKEND=memory (pensado para despliegues pequeños con SQLite).
+# - Análisis: minúsculas sin acentos, sin stopwords españolas y con spanish_stem().
+#   Las posiciones cuentan todas las palabras (también las stopwords) para las frases "...".
+# - Cada proceso tiene su copia. Al subir/borrar/indexar un documento se incrementa
+#   CacheVersion('documents'); el proceso que lo detecta aplica sólo la diferencia con la
+#   base de datos y guarda una instantánea en disco, que es lo que se carga al arrancar.
+# - Formato en disco: cabecera + zlib de enteros varint (ids y posiciones en deltas). Las
+#   listas de cada término se guardan codificadas y sólo se decodifican al consultarlas.
+
+DOCUMENTS_VERSION = 'documents'
+MAGIC = b'SABM25\x01'
+
+SPANISH_STOPWORDS = frozenset('''
+    a al algo algun alguna algunas alguno algunos ante antes aquel aquella aquellas aquellos
+    asi aun bajo bien cada como con contra cual cuales cuando de del desde donde dos durante
+    e el ella ellas ello ellos en entre era eran eres es esa esas ese eso esos esta estaba
+    estaban estado estan estar estas este esto estos fue fueron ha habia han hasta hay la las
+    le les lo los mas me mi mis mismo mucho muy ni no nos nosotros o os otra otras otro otros
+    para pero poco por porque que quien quienes se sea segun ser si sido siendo sin sobre
+    sois solo son su sus tambien tanto te tiene tienen todo todos tu tus un una unas uno unos
+    vosotros y ya yo
+'''.split())
+
+PHRASE_RE = re.compile(r'"([^"]+)"')
+
+# Separación entre título y cuerpo para que una frase no cruce de uno a otro
+TITLE_GAP = 10
+
+_index = None
+_index_lock = threading.Lock()
+
+
+# --- ANÁLISIS ---
+
+def analyze(value, offset=0):
+    """[(posición, término)] sin stopwords, y el número total de palabras."""
+    tokens = tokenize(value)
+    terms = [
+        (offset + pos, spanish_stem(tok))
+        for pos, tok in enumerate(tokens) if tok not in SPANISH_STOPWORDS
+    ]
+    return terms, len(tokens)
+
+def parse_query(query):
+    """Términos sueltos y frases entre comillas (cada frase como [(posición relativa, término)])."""
+    phrases = []
+    for raw in PHRASE_RE.findall(query or ''):
+        terms, _ = analyze(raw)
+        if len(terms) > 1:
+            start = terms[0][0]
+            phrases.append([(pos - start, term) for pos, term in terms])
+        elif terms:
+            phrases.append(terms)
+    loose, _ = analyze(PHRASE_RE.sub(' ', query or ''))
+    return [term for _, term in loose], phrases
+
+
+# --- CODIFICACIÓN ---
+
+def _put_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def _get_varint(buf, i):
+    result = shift = 0
+    while True:
+        byte = buf[i]
+        i += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, i
+        shift += 7
+
+def _encode_postings(postings):
+    out = bytearray()
+    _put_varint(out, len(postings))
+    prev_doc = 0
+    for doc_id in sorted(postings):
+        positions = postings[doc_id]
+        _put_varint(out, doc_id - prev_doc)
+        _put_varint(out, len(positions))
+        prev_pos = 0
+        for pos in positions:
+            _put_varint(out, pos - prev_pos)
+            prev_pos = pos
+        prev_doc = doc_id
+    return bytes(out)
+
+def _decode_postings(buf, skip=()):
+    postings = {}
+    count, i = _get_varint(buf, 0)
+    doc_id = 0
+    for _ in range(count):
+        delta, i = _get_varint(buf, i)
+        doc_id += delta
+        npos, i = _get_varint(buf, i)
+        positions = []
+        pos = 0
+        for _ in range(npos):
+            delta, i = _get_varint(buf, i)
+            pos += delta
+            positions.append(pos)
+        if doc_id not in skip:
+            postings[doc_id] = positions
+    return postings
+
+
+# --- ÍNDICE ---
+
+class BM25Index:
+    def __init__(self, k1=1.2, b=0.75, title_boost=3):
+        self.k1 = k1
+        self.b = b
+        self.title_boost = title_boost
+        self.version = None
+        self.stamps = {}      # doc_id -> status con el que se indexó (para detectar cambios)
+        self.doc_len = {}     # doc_id -> términos indexados
+        self.body_start = {}  # doc_id -> primera posición del cuerpo (antes: título)
+        self.total_len = 0
+        self._raw = {}        # término -> listas codificadas tal como se cargaron del disco
+        self._postings = {}   # término -> {doc_id: [posiciones]}
+        self._removed = set() # documentos a descartar al decodificar _raw
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.doc_len)
+
+    def _term(self, term, create=False):
+        postings = self._postings.get(term)
+        if postings is not None:
+            return postings
+        raw = self._raw.pop(term, None)
+        postings = _decode_postings(raw, self._removed) if raw is not None else {}
+        if postings or create:
+            self._postings[term] = postings
+        return postings
+
+    def add(self, doc_id, title, body, stamp=None):
+        with self._lock:
+            self.remove(doc_id)
+            title_terms, title_words = analyze(title)
+            body_start = title_words + TITLE_GAP
+            body_terms, _ = analyze(body, offset=body_start)
+
+            grouped = {}
+            for pos, term in title_terms + body_terms:
+                grouped.setdefault(term, []).append(pos)
+            for term, positions in grouped.items():
+                self._term(term, create=True)[doc_id] = positions
+
+            self.doc_len[doc_id] = len(title_terms) + len(body_terms)
+            self.body_start[doc_id] = body_start
+            self.total_len += self.doc_len[doc_id]
+            self.stamps[doc_id] = stamp
+
+    def remove(self, doc_id):
+        with self._lock:
+            if doc_id not in self.doc_len:
+                return False
+            self.total_len -= self.doc_len.pop(doc_id)
+            self.body_start.pop(doc_id, None)
+            self.stamps.pop(doc_id, None)
+            self._removed.add(doc_id)
+            for term in [t for t, postings in self._postings.items() if doc_id in postings]:
+                del self._postings[term][doc_id]
+                if not self._postings[term]:
+                    del self._postings[term]
+            return True
+
+    # --- Búsqueda ---
+
+    @staticmethod
+    def _has_phrase(phrase, positions_by_term):
+        first = positions_by_term[phrase[0][1]]
+        rest = [(offset, set(positions_by_term[term])) for offset, term in phrase[1:]]
+        return any(all(start + offset in positions for offset, positions in rest) for start in first)
+
+    def search(self, query, limit=50, offset=0):
+        """[(doc_id, score)] con todos los términos (y frases) de la consulta, por BM25."""
+        loose, phrases = parse_query(query)
+        required = set(loose) | {term for phrase in phrases for _, term in phrase}
+        if not required:
+            return []
+
+        with self._lock:
+            lists = {term: self._term(term) for term in required}
+            if not all(lists.values()):
+                return []
+
+            # Se parte de la lista más corta: el coste depende de la rareza de los términos, no del corpus
+            ordered = sorted(lists.values(), key=len)
+            candidates = [d for d in ordered[0] if all(d in other for other in ordered[1:])]
+            if phrases:
+                candidates = [
+                    d for d in candidates
+                    if all(self._has_phrase(p, {t: lists[t][d] for _, t in p}) for p in phrases)
+                ]
+            if not candidates:
+                return []
+
+            total_docs = len(self.doc_len)
+            avg_len = self.total_len / total_docs if total_docs else 1
+            idf = {
+                term: math.log(1 + (total_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for term, postings in lists.items()
+            }
+
+            def score(doc_id):
+                norm = self.k1 * (1 - self.b + self.b * self.doc_len[doc_id] / avg_len)
+                body_start = self.body_start[doc_id]
+                total = 0.0
+                for term, postings in lists.items():
+                    positions = postings[doc_id]
+                    in_title = sum(1 for pos in positions if pos < body_start)
+                    tf = len(positions) + (self.title_boost - 1) * in_title
+                    total += idf[term] * tf * (self.k1 + 1) / (tf + norm)
+                return total
+
+            best = heapq.nlargest(offset + limit, ((score(d), d) for d in candidates))
+            return [(doc_id, value) for value, doc_id in best[offset:]]
+
+    # --- Disco ---
+
+    def save(self, path):
+        with self._lock:
+            out = bytearray()
+            _put_varint(out, self.version or 0)
+            _put_varint(out, len(self.doc_len))
+            prev = 0
+            for doc_id in sorted(self.doc_len):
+                stamp = (self.stamps.get(doc_id) or '').encode('utf-8')
+                _put_varint(out, doc_id - prev)
+                _put_varint(out, self.doc_len[doc_id])
+                _put_varint(out, self.body_start[doc_id])
+                _put_varint(out, len(stamp))
+                out += stamp
+                prev = doc_id
+
+            terms = sorted(set(self._postings) | set(self._raw))
+            _put_varint(out, len(terms))
+            for term in terms:
+                if term in self._postings:
+                    encoded = _encode_postings(self._postings[term])
+                elif self._removed:
+                    encoded = _encode_postings(_decode_postings(self._raw[term], self._removed))
+                else:
+                    encoded = self._raw[term]
+                name = term.encode('utf-8')
+                _put_varint(out, len(name))
+                out += name
+                _put_varint(out, len(encoded))
+                out += encoded
+
+            payload = MAGIC + zlib.compress(bytes(out), 6)
+
+        folder = os.path.dirname(path) or '.'
+        os.makedirs(folder, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=folder, prefix='.bm25-')
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(payload)
+        os.replace(tmp_path, path)
+        return len(payload)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as fh:
+            data = fh.read()
+        if not data.startswith(MAGIC):
+            raise ValueError(f"{path} no es un índice BM25 válido")
+        buf = memoryview(zlib.decompress(data[len(MAGIC):]))
+
+        index = cls()
+        index.version, i = _get_varint(buf, 0)
+        count, i = _get_varint(buf, i)
+        doc_id = 0
+        for _ in range(count):
+            delta, i = _get_varint(buf, i)
+            doc_id += delta
+            index.doc_len[doc_id], i = _get_varint(buf, i)
+            index.body_start[doc_id], i = _get_varint(buf, i)
+            size, i = _get_varint(buf, i)
+            index.stamps[doc_id] = bytes(buf[i:i + size]).decode('utf-8') or None
+            i += size
+        index.total_len = sum(index.doc_len.values())
+
+        # Las listas quedan como vistas sobre el buffer y se decodifican al consultarlas
+        count, i = _get_varint(buf, i)
+        for _ in range(count):
+            size, i = _get_varint(buf, i)
+            term = bytes(buf[i:i + size]).decode('utf-8')
+            i += size
+            size, i = _get_varint(buf, i)
+            index._raw[term] = buf[i:i + size]
+            i += size
+        return index
+
+
+# --- SINCRONIZACIÓN CON LA BASE DE DATOS ---
+
+SYNC_CHUNK = 200
+
+def index_path():
+    return current_app.config.get('SAFINDER_INDEX_PATH') or os.path.join(current_app.instance_path, 'safinder_bm25.idx')
+
+def sync_from_db(index):
+    """Aplica al índice los documentos nuevos, modificados (cambio de status) o borrados."""
+    current = dict(db.session.query(Document.id, Document.status).all())
+    removed = [doc_id for doc_id in index.stamps if doc_id not in current]
+    changed = [doc_id for doc_id, status in current.items() if doc_id not in index.stamps or index.stamps[doc_id] != status]
+
+    for doc_id in removed:
+        index.remove(doc_id)
+    for start in range(0, len(changed), SYNC_CHUNK):
+        docs = (
+            Document.query
+            .options(db.load_only(Document.id, Document.title, Document.text_content, Document.status))
+            .filter(Document.id.in_(changed[start:start + SYNC_CHUNK]))
+            .all()
+        )
+        for doc in docs:
+            index.add(doc.id, doc.title, doc.text_content, doc.status)
+    return len(removed) + len(changed)
+
+def get_index():
+    """Índice de este proceso, al día con la base de datos."""
+    global _index
+    version = CacheVersion.current(DOCUMENTS_VERSION)
+    with _index_lock:
+        path = index_path()
+        if _index is None:
+            _index = BM25Index()
+            if os.path.exists(path):
+                try:
+                    _index = BM25Index.load(path)
+                except Exception as e:
+                    current_app.logger.warning(f"Índice BM25 ilegible, se reconstruye: {e}")
+
+        if _index.version != version:
+            changed = sync_from_db(_index)
+            _index.version = version
+            if changed:
+                try:
+                    _index.save(path)
+                except Exception as e:
+                    current_app.logger.warning(f"No se pudo guardar el índice BM25: {e}")
+    return _index
+
+def mark_changed():
+    """Avisa a todos los procesos de que deben sincronizar su índice. El llamador hace commit."""
+    CacheVersion.bump(DOCUMENTS_VERSION)
@@ -0,0 +1,367 @@
+import sqlite3
+from types import SimpleNamespace
+
+from flask import current_app
+from sqlalchemy import bindparam, event, inspect, text
+from sqlalchemy.engine import Engine
+
+from app import db
+from app.models import User
+from app.search import strip_accents, TOKEN_RE
+
+
+# Búsqueda de ciudadanos por nombre, apellido o DNI (typeahead y Base de Datos).
+# - Postgres: índices GIN pg_trgm sobre lower(nombre completo) y lower(dni); LIKE '%q%' y el
+#   operador de similitud '%' se resuelven con el índice en lugar de recorrer la tabla.
+# - SQLite: tabla auxiliar 'user_search_gram' (trigrama normalizado -> user_id) y su contador
+#   de usuarios por trigrama 'user_search_gram_df', mantenidas con eventos del ORM sobre User.
+# Orden de resultados: DNI exacto, luego prefijo de nombre/apellido/DNI, luego coincidencias
+# parciales o aproximadas (por similitud).
+
+TIER_EXACT_DNI = 0
+TIER_PREFIX = 1
+TIER_FUZZY = 2
+
+# Fracción mínima de trigramas de la consulta que debe compartir un candidato (SQLite)
+MIN_GRAM_SHARE = 0.5
+# Entradas máximas que se recorren para buscar candidatos: se usan primero los trigramas
+# más raros (p.ej. '42x' antes que '100' en un DNI) hasta llegar a este presupuesto
+GRAM_POSTINGS_BUDGET = 20000
+# Resultados alcanzables en SQLite: los candidatos se ordenan en SQL por la misma relevancia
+# que se muestra y se pagina sobre ese orden; más allá de esta posición no se muestran y el
+# total se informa como "más de SQLITE_CANDIDATE_LIMIT"
+SQLITE_CANDIDATE_LIMIT = 300
+# Total máximo que se cuenta en Postgres y otros motores (count_citizens)
+COUNT_CAP = 1000
+
+PG_NAME_EXPR = "lower(coalesce(first_name, '') || ' ' || coalesce(last_name, ''))"
+
+# URLs de las bases de datos SQLite en las que ya existe user_search_gram
+_gram_tables = set()
+
+
+# --- NORMALIZACIÓN ---
+
+def normalize(value):
+    return ' '.join(TOKEN_RE.findall(strip_accents((value or '').lower())))
+
+def word_grams(word):
+    """Trigramas con relleno al estilo pg_trgm: '  ju', ' jua', 'jua', 'uan', 'an '."""
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def user_grams(first_name, last_name, dni):
+    grams = set()
+    for word in normalize(f"{first_name or ''} {last_name or ''} {dni or ''}").split():
+        grams |= word_grams(word)
+    return grams
+
+def query_grams(query):
+    """
+    Trigramas que se buscan para la consulta. Las palabras de 3+ letras usan sus trigramas
+    interiores (sirven para subcadenas) más el de inicio de palabra, que hace subir a los
+    prefijos; las más cortas sólo el de inicio de palabra.
+    """
+    grams = set()
+    for word in normalize(query).split():
+        grams.add(f" {word[:2]}" if len(word) >= 2 else f"  {word}")
+        if len(word) >= 3:
+            grams |= {word[i:i + 3] for i in range(len(word) - 2)}
+    return grams
+
+
+# --- ESQUEMA ---
+
+def _dialect():
+    return db.engine.dialect.name
+
+def _ensure_pg_index():
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    except Exception as e:
+        current_app.logger.warning(f"No se pudo activar pg_trgm: {e}")
+        return
+
+    with db.engine.begin() as conn:
+        conn.execute(text(
+            f'CREATE INDEX IF NOT EXISTS ix_user_name_trgm ON "user" USING GIN (({PG_NAME_EXPR}) gin_trgm_ops)'
+        ))
+        conn.execute(text(
+            'CREATE INDEX IF NOT EXISTS ix_user_dni_trgm ON "user" USING GIN (lower(dni) gin_trgm_ops)'
+        ))
+
+def _ensure_sqlite_index():
+    db.session.execute(text(
+        "CREATE TABLE IF NOT EXISTS user_search_gram ("
+        "gram TEXT NOT NULL, user_id INTEGER NOT NULL, PRIMARY KEY (gram, user_id)"
+        ") WITHOUT ROWID"
+    ))
+    db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_user_search_gram_user ON user_search_gram (user_id)"))
+    db.session.execute(text(
+        "CREATE TABLE IF NOT EXISTS user_search_gram_df ("
+        "gram TEXT PRIMARY KEY, users INTEGER NOT NULL"
+        ") WITHOUT ROWID"
+    ))
+    _gram_tables.add(str(db.engine.url))
+
+    # Backfill de usuarios que aún no están en la tabla; los contadores se recalculan al final
+    missing = db.session.execute(text(
+        'SELECT id, first_name, last_name, dni FROM "user" '
+        'WHERE id NOT IN (SELECT DISTINCT user_id FROM user_search_gram)'
+    )).fetchall()
+    for row in missing:
+        _sqlite_upsert(db.session, row.id, row.first_name, row.last_name, row.dni, count=False)
+    if missing or not db.session.execute(text("SELECT 1 FROM user_search_gram_df LIMIT 1")).first():
+        db.session.execute(text("DELETE FROM user_search_gram_df"))
+        db.session.execute(text(
+            "INSERT INTO user_search_gram_df (gram, users) "
+            "SELECT gram, COUNT(*) FROM user_search_gram GROUP BY gram"
+        ))
+    db.session.commit()
+    return len(missing)
+
+def ensure_citizen_search_index():
+    """Crea (si falta) el índice de búsqueda de ciudadanos del dialecto actual. Se llama al arrancar."""
+    if _dialect() == 'postgresql':
+        _ensure_pg_index()
+    elif _dialect() == 'sqlite':
+        indexed = _ensure_sqlite_index()
+        if indexed:
+            print(f"✅ {indexed} ciudadano(s) añadidos al índice de búsqueda.")
+
+
+# --- SINCRONIZACIÓN (SQLite) ---
+
+def _sqlite_delete(conn, user_id, count=True):
+    if count:
+        conn.execute(text(
+            "UPDATE user_search_gram_df SET users = users - 1 "
+            "WHERE gram IN (SELECT gram FROM user_search_gram WHERE user_id = :id)"
+        ), {'id': user_id})
+    conn.execute(text("DELETE FROM user_search_gram WHERE user_id = :id"), {'id': user_id})
+
+def _sqlite_upsert(conn, user_id, first_name, last_name, dni, count=True):
+    _sqlite_delete(conn, user_id, count)
+    grams = user_grams(first_name, last_name, dni)
+    if not grams:
+        return
+    rows = [{'gram': g, 'id': user_id} for g in grams]
+    conn.execute(text("INSERT INTO user_search_gram (gram, user_id) VALUES (:gram, :id)"), rows)
+    if count:
+        conn.execute(text(
+            "INSERT INTO user_search_gram_df (gram, users) VALUES (:gram, 1) "
+            "ON CONFLICT(gram) DO UPDATE SET users = users + 1"
+        ), rows)
+
+def _gram_table_exists(conn):
+    key = str(conn.engine.url)
+    if key not in _gram_tables and conn.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_search_gram'"
+    )).first() is not None:
+        _gram_tables.add(key)
+    return key in _gram_tables
+
+def remove_users_from_index(conn, user_ids):
+    """Quita del índice a varios usuarios de una vez (borrados en bloque sin eventos del mapper)."""
+    if conn.dialect.name != 'sqlite' or not user_ids or not _gram_table_exists(conn):
+        return
+    ids = bindparam('ids', expanding=True)
+    conn.execute(text(
+        "UPDATE user_search_gram_df SET users = users - ("
+        "SELECT COUNT(*) FROM user_search_gram g "
+        "WHERE g.gram = user_search_gram_df.gram AND g.user_id IN :ids"
+        ") WHERE gram IN (SELECT gram FROM user_search_gram WHERE user_id IN :ids)"
+    ).bindparams(ids), {'ids': list(user_ids)})
+    conn.execute(text("DELETE FROM user_search_gram WHERE user_id IN :ids").bindparams(ids), {'ids': list(user_ids)})
+
+@event.listens_for(User, 'after_insert')
+def _index_new_user(mapper, connection, target):
+    if connection.dialect.name == 'sqlite' and _gram_table_exists(connection):
+        _sqlite_upsert(connection, target.id, target.first_name, target.last_name, target.dni)
+
+@event.listens_for(User, 'after_update')
+def _reindex_user(mapper, connection, target):
+    if connection.dialect.name != 'sqlite' or not _gram_table_exists(connection):
+        return
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in ('first_name', 'last_name', 'dni')):
+        _sqlite_upsert(connection, target.id, target.first_name, target.last_name, target.dni)
+
+@event.listens_for(User, 'after_delete')
+def _remove_user_grams(mapper, connection, target):
+    if connection.dialect.name == 'sqlite' and _gram_table_exists(connection):
+        _sqlite_delete(connection, target.id)
+
+
+# --- BÚSQUEDA ---
+
+def _like_escape(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def match_tier(user, query, normalized):
+    """Nivel de coincidencia (TIER_*) de un usuario o de cualquier objeto con first_name/last_name/dni."""
+    dni = (user.dni or '').lower()
+    if dni == query.lower():
+        return TIER_EXACT_DNI
+    name = normalize(f"{user.first_name or ''} {user.last_name or ''}")
+    if name.startswith(normalized) or f" {normalized}" in f" {name}" or normalize(dni).startswith(normalized):
+        return TIER_PREFIX
+    return TIER_FUZZY
+
+PG_MATCH_WHERE = (
+    "lower(dni) = :q "
+    f"OR {PG_NAME_EXPR} LIKE :contains OR lower(dni) LIKE :contains "
+    f"OR {PG_NAME_EXPR} % :q"
+)
+
+def _pg_params(query):
+    q = query.strip().lower()
+    return {
+        'q': q,
+        'prefix': f"{_like_escape(q)}%",
+        'word_prefix': f"% {_like_escape(q)}%",
+        'contains': f"%{_like_escape(q)}%",
+    }
+
+def _pg_ranked_ids(query, limit, offset):
+    rows = db.session.execute(text(
+        "SELECT id, "
+        "CASE WHEN lower(dni) = :q THEN 0 "
+        f"WHEN {PG_NAME_EXPR} LIKE :prefix OR {PG_NAME_EXPR} LIKE :word_prefix OR lower(dni) LIKE :prefix THEN 1 "
+        "ELSE 2 END AS tier, "
+        f"greatest(similarity({PG_NAME_EXPR}, :q), similarity(lower(dni), :q)) AS score "
+        f'FROM "user" WHERE {PG_MATCH_WHERE} '
+        "ORDER BY tier, score DESC, id LIMIT :limit OFFSET :offset"
+    ), dict(_pg_params(query), limit=limit, offset=offset)).fetchall()
+    return [row.id for row in rows]
+
+def _selective_grams(grams):
+    """Trigramas más raros de la consulta cuyo total de entradas cabe en el presupuesto."""
+    params = {f'g{i}': g for i, g in enumerate(grams)}
+    placeholders = ', '.join(f':{name}' for name in params)
+    df = dict(db.session.execute(
+        text(f"SELECT gram, users FROM user_search_gram_df WHERE gram IN ({placeholders})"), params
+    ).fetchall())
+
+    selected, postings = [], 0
+    for gram in sorted(grams, key=lambda g: df.get(g, 0)):
+        postings += df.get(gram, 0)
+        if selected and postings > GRAM_POSTINGS_BUDGET:
+            break
+        selected.append(gram)
+    return selected
+
+def _sql_match_tier(first_name, last_name, dni, query, normalized):
+    return match_tier(SimpleNamespace(first_name=first_name, last_name=last_name, dni=dni), query, normalized)
+
+@event.listens_for(Engine, 'connect')
+def _register_sqlite_functions(dbapi_connection, connection_record):
+    # match_tier() disponible en SQL para ordenar los candidatos igual que se muestran
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.create_function('citizen_match_tier', 5, _sql_match_tier, deterministic=True)
+
+def _sqlite_candidates(query, grams):
+    """
+    SQL (y parámetros) de los ids candidatos: usuarios que comparten suficientes trigramas
+    (de los más selectivos) con la consulta, más el DNI exacto.
+    """
+    selected = _selective_grams(grams)
+    min_hits = max(1, int(len(selected) * MIN_GRAM_SHARE + 0.5))
+    params = {f's{i}': g for i, g in enumerate(selected)}
+    placeholders = ', '.join(f':{name}' for name in params)
+    # El DNI se guarda tal cual lo escribió el usuario; se prueba también en mayúsculas (usa el índice de dni)
+    sql = (
+        f"SELECT user_id FROM user_search_gram WHERE gram IN ({placeholders}) "
+        "GROUP BY user_id HAVING COUNT(*) >= :min_hits "
+        'UNION SELECT id FROM "user" WHERE dni IN (:q, :q_upper)'
+    )
+    return sql, dict(params, min_hits=min_hits, q=query, q_upper=query.upper())
+
+def _sqlite_ranked_users(query, limit, offset, columns):
+    grams = query_grams(query)
+    limit = min(limit, SQLITE_CANDIDATE_LIMIT - offset)
+    if not grams or limit <= 0:
+        return []
+
+    # Orden: nivel (DNI exacto / prefijo / aproximado), trigramas compartidos con la consulta,
+    # longitud del nombre e id. Es total, así que cada página es un trozo del mismo orden
+    candidates, params = _sqlite_candidates(query, grams)
+    params.update({f'g{i}': g for i, g in enumerate(grams)})
+    placeholders = ', '.join(f':g{i}' for i in range(len(grams)))
+    ids = [row.id for row in db.session.execute(text(
+        f'SELECT u.id FROM "user" u JOIN ({candidates}) c ON c.user_id = u.id ORDER BY '
+        "citizen_match_tier(u.first_name, u.last_name, u.dni, :q, :normalized), "
+        f"(SELECT COUNT(*) FROM user_search_gram g WHERE g.user_id = u.id AND g.gram IN ({placeholders})) DESC, "
+        "length(coalesce(u.first_name, '')) + length(coalesce(u.last_name, '')), u.id "
+        "LIMIT :limit OFFSET :offset"
+    ), dict(params, normalized=normalize(query), limit=limit, offset=offset)).fetchall()]
+    if not ids:
+        return []
+
+    users = User.query.options(db.load_only(*columns)).filter(User.id.in_(ids)).all()
+    position = {user_id: i for i, user_id in enumerate(ids)}
+    return sorted(users, key=lambda u: position[u.id])
+
+def search_citizens(query, limit=10, offset=0, columns=None):
+    """
+    Ciudadanos que coinciden con `query` (nombre, apellido o DNI), ordenados por relevancia.
+    `columns` limita las columnas cargadas (p.ej. para el typeahead).
+    """
+    query = (query or '').strip()
+    if not query:
+        return []
+    columns = columns or (User.id, User.first_name, User.last_name, User.dni)
+
+    if _dialect() == 'postgresql':
+        ids = _pg_ranked_ids(query, limit, offset)
+        users = User.query.options(db.load_only(*columns)).filter(User.id.in_(ids)).all() if ids else []
+        position = {user_id: i for i, user_id in enumerate(ids)}
+        return sorted(users, key=lambda u: position[u.id])
+
+    if _dialect() == 'sqlite':
+        return _sqlite_ranked_users(query, limit, offset, columns)
+
+    # Otros motores: búsqueda por subcadena sin índice
+    search = f"%{query}%"
+    users = (
+        User.query.options(db.load_only(*columns))
+        .filter(User.first_name.ilike(search) | User.last_name.ilike(search) | User.dni.ilike(search))
+        .order_by(User.id).limit(limit).offset(offset).all()
+    )
+    normalized = normalize(query)
+    return sorted(users, key=lambda u: match_tier(u, query, normalized))
+
+def count_citizens(query):
+    """
+    Total de ciudadanos que coinciden con `query`: (número, exacto). En SQLite se cuenta
+    hasta SQLITE_CANDIDATE_LIMIT (los resultados alcanzables) y en el resto hasta COUNT_CAP.
+    """
+    query = (query or '').strip()
+    if not query:
+        return 0, True
+
+    if _dialect() == 'postgresql':
+        cap = COUNT_CAP
+        count = db.session.execute(text(
+            f'SELECT COUNT(*) FROM (SELECT 1 FROM "user" WHERE {PG_MATCH_WHERE} LIMIT :cap) AS matches'
+        ), dict(_pg_params(query), cap=cap + 1)).scalar()
+    elif _dialect() == 'sqlite':
+        cap = SQLITE_CANDIDATE_LIMIT
+        grams = query_grams(query)
+        if not grams:
+            return 0, True
+        candidates, params = _sqlite_candidates(query, grams)
+        count = db.session.execute(text(
+            f"SELECT COUNT(*) FROM ({candidates} LIMIT :cap)"
+        ), dict(params, cap=cap + 1)).scalar()
+    else:
+        cap = COUNT_CAP
+        search = f"%{query}%"
+        matches = (
+            db.session.query(User.id)
+            .filter(User.first_name.ilike(search) | User.last_name.ilike(search) | User.dni.ilike(search))
+            .limit(cap + 1).subquery()
+        )
+        count = db.session.query(db.func.count()).select_from(matches).scalar()
+    return min(count, cap), count <= cap
@@ -0,0 +1,223 @@
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from flask import current_app
+
+
+# Timeouts (connect, read) por tipo de llamada saliente
+ENDPOINT_TIMEOUTS = {
+    'discord_oauth': (3, 10),
+    'discord_api': (3, 5),
+    'bot': (1, 3),
+    'default': (3, 10),
+}
+
+# Reintentos por tipo de llamada. El intercambio del código OAuth no se reintenta
+# (el código es de un solo uso) y las llamadas al bot tampoco: la outbox ya reintenta.
+ENDPOINT_RETRIES = {
+    'discord_oauth': 0,
+    'discord_api': 2,
+    'bot': 0,
+    'default': 1,
+}
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def retry_after(resp):
+    """Segundos que pide esperar un 429 (Retry-After o X-RateLimit-Reset-After de Discord), o None."""
+    for header in ('Retry-After', 'X-RateLimit-Reset-After'):
+        try:
+            return max(float(resp.headers[header]), 0.0)
+        except (KeyError, TypeError, ValueError):
+            continue
+    return None
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Se lanza sin tocar la red cuando el circuito del host está abierto."""
+
+
+class CircuitBreaker:
+    """
+    Circuito por host: tras `failure_threshold` fallos seguidos se abre durante
+    `reset_timeout` segundos y las llamadas fallan al instante. Pasado ese tiempo deja
+    pasar una llamada de prueba (half-open); si va bien, se cierra.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'half-open':
+                # Sólo una llamada de prueba; las demás siguen fallando rápido.
+                self.opened_at = time.monotonic()
+                return True
+            return state == 'closed'
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class OutboundClient:
+    """
+    Cliente HTTP saliente compartido por proceso: una Session con pool keep-alive por
+    host, timeouts por endpoint, reintentos con jitter, circuit breaker por host y
+    registro de latencias. Un 429 se reintenta tras el Retry-After del servidor si no pasa
+    de `max_retry_after` segundos; si pide más, se devuelve la respuesta sin esperar.
+    """
+
+    def __init__(self, pool_maxsize=10, breaker_threshold=5, breaker_reset=30, retry_backoff=0.3,
+                 max_retry_after=5):
+        self.pool_maxsize = pool_maxsize
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self.retry_backoff = retry_backoff
+        self.max_retry_after = max_retry_after
+        self._sessions = {}
+        self._breakers = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    # --- Pools y circuitos por host ---
+
+    def _host(self, url):
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def _session(self, host):
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize)
+                session.mount(host, adapter)
+                self._sessions[host] = session
+            return session
+
+    def breaker(self, url):
+        host = self._host(url)
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = CircuitBreaker(self.breaker_threshold, self.breaker_reset)
+                self._breakers[host] = breaker
+            return breaker
+
+    # --- Métricas ---
+
+    def _record(self, endpoint, elapsed_ms, ok):
+        with self._lock:
+            stat = self._stats.setdefault(endpoint, {'calls': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            stat['calls'] += 1
+            stat['total_ms'] += elapsed_ms
+            stat['max_ms'] = max(stat['max_ms'], elapsed_ms)
+            if not ok:
+                stat['errors'] += 1
+
+    def stats(self):
+        with self._lock:
+            result = {}
+            for endpoint, stat in self._stats.items():
+                result[endpoint] = dict(stat, avg_ms=stat['total_ms'] / stat['calls'] if stat['calls'] else 0.0)
+            result['circuits'] = {host: b.state for host, b in self._breakers.items()}
+            return result
+
+    # --- Peticiones ---
+
+    def request(self, method, url, endpoint='default', timeout=None, retries=None, **kwargs):
+        timeout = timeout or ENDPOINT_TIMEOUTS.get(endpoint, ENDPOINT_TIMEOUTS['default'])
+        retries = ENDPOINT_RETRIES.get(endpoint, ENDPOINT_RETRIES['default']) if retries is None else retries
+        breaker = self.breaker(url)
+        session = self._session(self._host(url))
+
+        attempt = 0
+        while True:
+            delay = None
+            if not breaker.allow():
+                self._record(endpoint, 0.0, False)
+                raise CircuitOpenError(f"Circuito abierto para {self._host(url)}")
+
+            start = time.perf_counter()
+            try:
+                resp = session.request(method, url, timeout=timeout, **kwargs)
+            except requests.exceptions.RequestException:
+                self._record(endpoint, (time.perf_counter() - start) * 1000, False)
+                breaker.record_failure()
+                if attempt >= retries:
+                    raise
+            else:
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                server_error = resp.status_code >= 500
+                self._record(endpoint, elapsed_ms, not server_error)
+                if server_error:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                if resp.status_code not in RETRY_STATUSES or attempt >= retries:
+                    return resp
+                if resp.status_code == 429:
+                    # Reintentar antes de que acabe la ventana del rate limit sólo gasta el reintento
+                    delay = retry_after(resp)
+                    if delay is not None and delay > self.max_retry_after:
+                        return resp
+
+            attempt += 1
+            if delay is None:
+                # Backoff exponencial con jitter completo
+                delay = random.uniform(0, self.retry_backoff * (2 ** attempt))
+            time.sleep(delay)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_http_client():
+    """Devuelve el cliente compartido del proceso (se crea en la primera llamada)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                config = current_app.config
+                _client = OutboundClient(
+                    pool_maxsize=config.get('HTTP_POOL_MAXSIZE', 10),
+                    breaker_threshold=config.get('HTTP_BREAKER_THRESHOLD', 5),
+                    breaker_reset=config.get('HTTP_BREAKER_RESET_SECONDS', 30),
+                    max_retry_after=config.get('HTTP_MAX_RETRY_AFTER_SECONDS', 5)
+                )
+    return _client
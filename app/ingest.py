@@ -0,0 +1,117 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import current_app
+from pypdf import PdfReader
+
+from app import db
+from app.models import Document
+from app.search import index_document, build_snippet
+from app.storage import file_path
+
+
+# Ingesta de PDFs de SAFinder fuera de la petición web.
+# safinder_upload guarda el archivo y crea el Document con status='Pendiente';
+# el proceso 'ingest' (ver Procfile) extrae el texto por bloques de páginas en un
+# ProcessPoolExecutor, va actualizando pages_done y al terminar indexa el documento.
+
+def count_pages(path):
+    return len(PdfReader(path).pages)
+
+def extract_pages(path, start, end):
+    """Se ejecuta en un proceso del pool: devuelve el texto de las páginas [start, end)."""
+    reader = PdfReader(path)
+    parts = []
+    for number in range(start, end):
+        try:
+            parts.append(reader.pages[number].extract_text() or '')
+        except Exception as e:
+            parts.append('')
+            print(f"⚠️ Error extrayendo página {number} de {path}: {e}")
+    return parts
+
+def document_path(doc):
+    return file_path(doc.filename, 'docs')
+
+def _claim_next():
+    """Marca como 'Indexando' el documento pendiente más antiguo. Devuelve su id o None."""
+    candidate = (
+        db.session.query(Document.id)
+        .filter(Document.status == 'Pendiente')
+        .order_by(Document.id)
+        .first()
+    )
+    if not candidate:
+        return None
+
+    claimed = (
+        Document.query
+        .filter(Document.id == candidate.id, Document.status == 'Pendiente')
+        .update({Document.status: 'Indexando'}, synchronize_session=False)
+    )
+    db.session.commit()
+    return candidate.id if claimed else None
+
+def ingest_document(doc_id, pool):
+    doc = db.session.get(Document, doc_id)
+    if not doc:
+        return
+
+    path = document_path(doc)
+    chunk = current_app.config['INGEST_CHUNK_PAGES']
+
+    try:
+        total = count_pages(path)
+        doc.pages_total = total
+        doc.pages_done = 0
+        db.session.commit()
+
+        # Cada bloque se extrae en paralelo; el progreso se guarda según van terminando en orden
+        futures = [pool.submit(extract_pages, path, start, min(start + chunk, total)) for start in range(0, total, chunk)]
+        parts = []
+        for future in futures:
+            parts.extend(future.result())
+            doc.pages_done = len(parts)
+            db.session.commit()
+
+        doc.text_content = "\n".join(parts)
+        doc.snippet = build_snippet(doc.text_content)
+        doc.status = 'Listo'
+        index_document(doc)
+        db.session.commit()
+        print(f"✅ Documento {doc.id} indexado ({total} páginas).")
+
+    except Exception as e:
+        db.session.rollback()
+        doc = db.session.get(Document, doc_id)
+        if doc:
+            doc.status = 'Error'
+            doc.text_content = "Error leyendo contenido."
+            db.session.commit()
+        print(f"❌ Error procesando PDF {doc_id}: {e}")
+
+def run_ingest_worker():
+    """Bucle principal del proceso `ingest` (ver Procfile). Requiere app context."""
+    workers = current_app.config['INGEST_WORKERS']
+    poll_interval = current_app.config['INGEST_POLL_INTERVAL']
+
+    # Un solo proceso 'ingest': lo que quedó a medias en un reinicio vuelve a la cola
+    stuck = Document.query.filter_by(status='Indexando').update({Document.status: 'Pendiente'})
+    db.session.commit()
+    print(f"📚 Ingesta de documentos iniciada ({workers} procesos, {stuck} documento(s) reanudados)")
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            try:
+                doc_id = _claim_next()
+                if doc_id:
+                    ingest_document(doc_id, pool)
+            except Exception as e:
+                db.session.rollback()
+                print(f"❌ Error en ingesta: {e}")
+                doc_id = None
+            finally:
+                db.session.remove()
+
+            if not doc_id:
+                time.sleep(poll_interval)
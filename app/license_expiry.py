@@ -0,0 +1,80 @@
+import time
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import update
+
+from app import db
+from app.models import License
+from app.notifications import enqueue_by_message
+
+
+# Caducidad de licencias (proceso `sweeper`, ver Procfile).
+# Un único UPDATE por pasada pasa a 'Vencida' todas las licencias 'Activa' cuya fecha de
+# expiración ya pasó; lo resuelve el índice (status, expiration_date). Los avisos se encolan
+# en la outbox agrupando a los titulares con el mismo mensaje en un solo INSERT ... SELECT,
+# de modo que el dispatcher los entrega juntos en una llamada a /notify_batch.
+
+
+def _expiry_message(types):
+    if len(types) == 1:
+        return (
+            f"⚠️ **Licencia Vencida**\nTu licencia '{types[0]}' ha vencido. "
+            "Renuévala desde el portal de licencias."
+        )
+    listed = "\n".join(f"• {t}" for t in types)
+    return (
+        f"⚠️ **Licencias Vencidas**\nLas siguientes licencias han vencido:\n{listed}\n"
+        "Renuévalas desde el portal de licencias."
+    )
+
+def expire_licenses(today=None):
+    """
+    Marca como 'Vencida' las licencias activas caducadas y encola los avisos.
+    Devuelve (licencias vencidas, avisos encolados). El llamador hace commit.
+    """
+    today = today or datetime.utcnow().date()
+    expired = (License.status == 'Activa') & (License.expiration_date < today)
+
+    if db.engine.dialect.update_returning:
+        rows = db.session.execute(
+            update(License).where(expired).values(status='Vencida')
+            .returning(License.user_id, License.type)
+            .execution_options(synchronize_session=False)
+        ).all()
+    else:
+        rows = db.session.query(License.user_id, License.type).filter(expired).all()
+        License.query.filter(expired).update({License.status: 'Vencida'}, synchronize_session=False)
+
+    types_by_user = {}
+    for user_id, license_type in rows:
+        if user_id is not None:
+            types_by_user.setdefault(user_id, set()).add(license_type)
+
+    # Un mensaje por combinación de licencias: los titulares que comparten mensaje van juntos
+    users_by_message = {}
+    for user_id, types in types_by_user.items():
+        users_by_message.setdefault(_expiry_message(sorted(types)), []).append(user_id)
+
+    return len(rows), enqueue_by_message(users_by_message)
+
+def run_license_sweeper(once=False):
+    """Bucle principal del proceso `sweeper` (ver Procfile). Requiere app context."""
+    interval = current_app.config['LICENSE_SWEEP_INTERVAL_SECONDS']
+    print(f"🗓️ Barrido de licencias vencidas iniciado (cada {interval}s)")
+
+    while True:
+        try:
+            expired, queued = expire_licenses()
+            db.session.commit()
+            if expired:
+                print(f"🗓️ {expired} licencia(s) vencida(s), {queued} aviso(s) encolado(s).")
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Error en el barrido de licencias: {e}")
+        finally:
+            db.session.remove()
+
+        if once:
+            return
+        time.sleep(interval)
@@ -2,6 +2,8 @@ from app import db
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -26,6 +28,7 @@ class User(UserMixin, db.Model):
     # Status & Settings
     on_duty = db.Column(db.Boolean, default=False)
     receive_notifications = db.Column(db.Boolean, default=True)
+    notification_digest = db.Column(db.Boolean, default=False) # Resumen periódico en lugar de un DM por evento
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
@@ -51,6 +54,18 @@ class User(UserMixin, db.Model):
     appointments_made = db.relationship('Appointment', foreign_keys='Appointment.citizen_id', backref='citizen', lazy=True, cascade="all, delete-orphan")
     appointments_received = db.relationship('Appointment', foreign_keys='Appointment.official_id', backref='official', lazy=True, cascade="all, delete-orphan")
 
+    # Suscripciones a avisos por departamento
+    subscriptions = db.relationship('NotificationSubscription', backref='user', lazy='dynamic', cascade="all, delete-orphan")
+
+    __table_args__ = (
+        # Funcionarios por departamento y estado (official_dashboard, my_fines, government_users)
+        db.Index('ix_user_department_status', 'department', 'official_status'),
+        # Solicitudes de funcionario pendientes: índice parcial, sólo cubre esas filas
+        db.Index('ix_user_pending_officials', 'badge_id',
+                 sqlite_where=text("official_status = 'Pendiente' AND badge_id IS NOT NULL"),
+                 postgresql_where=text("official_status = 'Pendiente' AND badge_id IS NOT NULL")),
+    )
+
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
 
@@ -79,7 +94,7 @@ class BusinessFine(db.Model):
     reason = db.Column(db.String(200))
     date = db.Column(db.DateTime, default=datetime.utcnow)
     status = db.Column(db.String(20), default='Pendiente') # Pendiente, Pagada
-    business_id = db.Column(db.Integer, db.ForeignKey('business.id'))
+    business_id = db.Column(db.Integer, db.ForeignKey('business.id'), index=True)
     author_id = db.Column(db.Integer, db.ForeignKey('user.id'))
 
     author = db.relationship('User', foreign_keys=[author_id])
@@ -91,7 +106,12 @@ class License(db.Model):
     issue_date = db.Column(db.Date, nullable=True)
     expiration_date = db.Column(db.Date, nullable=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
-    business_id = db.Column(db.Integer, db.ForeignKey('business.id'), nullable=True)
+    business_id = db.Column(db.Integer, db.ForeignKey('business.id'), nullable=True, index=True)
+
+    __table_args__ = (
+        # Barrido de licencias vencidas (app/license_expiry.py)
+        db.Index('ix_license_status_expiration', 'status', 'expiration_date'),
+    )
 
 class TrafficFine(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -103,6 +123,11 @@ class TrafficFine(db.Model):
 
     author = db.relationship('User', foreign_keys=[author_id])
 
+    __table_args__ = (
+        # Multas de un ciudadano por estado (my_fines)
+        db.Index('ix_traffic_fine_user_status', 'user_id', 'status'),
+    )
+
 class Comment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text)
@@ -148,12 +173,124 @@ class Appointment(db.Model):
 class Document(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), index=True)
-    filename = db.Column(db.String(200))
+    filename = db.Column(db.String(200), index=True) # Ruta en el almacén por hash (app/storage.py)
     text_content = db.Column(db.Text)
+    snippet = db.Column(db.String(400), nullable=True) # Inicio del texto precalculado para los listados
+
+    # Ingesta en segundo plano (app/ingest.py)
+    status = db.Column(db.String(20), default='Listo') # Pendiente, Indexando, Listo, Error
+    pages_total = db.Column(db.Integer, nullable=True)
+    pages_done = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     uploader_id = db.Column(db.Integer, db.ForeignKey('user.id'))
 
     uploader = db.relationship('User', backref=db.backref('uploaded_documents', lazy=True))
 
+    __table_args__ = (
+        # Listado de SAFinder por fecha con cursor (created_at, id)
+        db.Index('ix_document_created_at', 'created_at', 'id'),
+    )
+
     def __repr__(self):
         return f'<Document {self.title}>'
+
+class StoredFile(db.Model):
+    # Archivo subido guardado por su SHA-256 (app/storage.py). ref_count = filas que lo usan.
+    sha256 = db.Column(db.String(64), primary_key=True)
+    path = db.Column(db.String(120), nullable=False) # cas/ab/cd/<sha256>.<ext>, relativo a UPLOAD_FOLDER
+    size = db.Column(db.Integer, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=1)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<StoredFile {self.sha256[:12]} x{self.ref_count}>'
+
+class CacheVersion(db.Model):
+    # Contador compartido entre procesos para invalidar cachés locales (p.ej. 'citizens' en app/typeahead.py)
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    @classmethod
+    def current(cls, name):
+        return db.session.query(cls.version).filter_by(name=name).scalar() or 0
+
+    @classmethod
+    def bump(cls, name):
+        """Invalida las cachés locales de `name` en todos los procesos. El llamador hace commit."""
+        increment = {cls.version: cls.version + 1}
+        if cls.query.filter_by(name=name).update(increment, synchronize_session=False):
+            return
+        try:
+            with db.session.begin_nested():
+                db.session.add(cls(name=name, version=1))
+        except IntegrityError:
+            cls.query.filter_by(name=name).update(increment, synchronize_session=False)
+
+    def __repr__(self):
+        return f'<CacheVersion {self.name}={self.version}>'
+
+class UserCounter(db.Model):
+    # Totales de usuarios por grupo ('total', 'role:citizen', 'dept:SABES', ...), mantenidos por
+    # eventos de User en app/user_directory.py para no hacer COUNT(*) sobre toda la tabla
+    name = db.Column(db.String(80), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<UserCounter {self.name}={self.value}>'
+
+class AuditEntry(db.Model):
+    # Registro de acciones administrativas (p.ej. aprobación en bloque de licencias):
+    # una fila por acción con los ids afectados, no una por fila modificada
+    id = db.Column(db.Integer, primary_key=True)
+    actor_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    action = db.Column(db.String(50), nullable=False) # p.ej. 'license.approve', 'official.deny'
+    target_ids = db.Column(db.Text, nullable=False) # Lista JSON de ids
+    target_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    actor = db.relationship('User', foreign_keys=[actor_id])
+
+    def __repr__(self):
+        return f'<AuditEntry {self.action} x{self.target_count}>'
+
+class NotificationOutbox(db.Model):
+    # Cola persistente de mensajes para el bot. El dispatcher (dispatcher.py) la drena por lotes.
+    id = db.Column(db.Integer, primary_key=True)
+    discord_id = db.Column(db.String(50), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), default='Pendiente') # Pendiente, Enviada, Fallida, Agrupada
+
+    # Eventos agrupables (p.ej. category='duty', event='on', subject='Nombre Apellido (SABES)').
+    # Las filas con category se fusionan por destinatario en un único DM resumen.
+    category = db.Column(db.String(30), nullable=True)
+    event = db.Column(db.String(30), nullable=True)
+    subject = db.Column(db.String(200), nullable=True)
+    attempts = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.String(255), nullable=True)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_notification_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
+    def __repr__(self):
+        return f'<NotificationOutbox {self.id} {self.status}>'
+
+class NotificationSubscription(db.Model):
+    # Un usuario suscrito a un tipo de evento (p.ej. 'duty') de un departamento concreto
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    department = db.Column(db.String(64), nullable=False)
+    event_type = db.Column(db.String(30), nullable=False, default='duty')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'department', 'event_type', name='uq_subscription_user_department_event'),
+        # Cubre la búsqueda de destinatarios: department + event_type -> user_id
+        db.Index('ix_subscription_department_event_user', 'department', 'event_type', 'user_id'),
+    )
+
+    def __repr__(self):
+        return f'<NotificationSubscription {self.user_id} {self.department}/{self.event_type}>'
@@ -0,0 +1,329 @@
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import insert, select, literal, case
+
+from app import db
+from app.http_client import get_http_client
+from app.models import User, NotificationOutbox, NotificationSubscription
+
+
+# Departamentos que emiten avisos de servicio (los que pueden usar toggle_duty)
+NOTIFICATION_DEPARTMENTS = ['SABES', 'Gobierno', 'Ejecutivo', 'Legislativo', 'Judicial']
+
+# --- SUSCRIPCIONES ---
+
+def subscribed_to(department, event_type='duty'):
+    """
+    Filtro sobre User: usuarios suscritos a `event_type` de `department`.
+    Se resuelve con el índice (department, event_type, user_id) de la tabla de suscripciones.
+    """
+    return User.id.in_(
+        select(NotificationSubscription.user_id).where(
+            NotificationSubscription.department == department,
+            NotificationSubscription.event_type == event_type
+        )
+    )
+
+def set_subscriptions(user, departments, event_type='duty'):
+    """Deja al usuario suscrito exactamente a `departments` para `event_type`. El llamador hace commit."""
+    wanted = {d for d in departments if d in NOTIFICATION_DEPARTMENTS}
+    current = {s.department: s for s in user.subscriptions.filter_by(event_type=event_type)}
+
+    for department, sub in current.items():
+        if department not in wanted:
+            db.session.delete(sub)
+    for department in wanted - current.keys():
+        db.session.add(NotificationSubscription(user_id=user.id, department=department, event_type=event_type))
+
+# --- ENCOLADO (lado web) ---
+
+def enqueue_notification(discord_id, message):
+    """
+    Guarda un mensaje en la outbox. No habla con el bot: el dispatcher lo enviará.
+    El llamador es responsable del commit.
+    """
+    if not discord_id:
+        return None
+
+    entry = NotificationOutbox(discord_id=str(discord_id), message=message)
+    db.session.add(entry)
+    return entry
+
+def _next_digest_at(now):
+    """Siguiente corte del modo resumen, alineado a NOTIFY_DIGEST_INTERVAL_SECONDS."""
+    interval = current_app.config['NOTIFY_DIGEST_INTERVAL_SECONDS']
+    epoch = datetime(1970, 1, 1)
+    elapsed = (now - epoch).total_seconds()
+    return epoch + timedelta(seconds=(int(elapsed // interval) + 1) * interval)
+
+def enqueue_broadcast(message, user_filter, category=None, event=None, subject=None):
+    """
+    Encola `message` para todos los usuarios que cumplan `user_filter` con un único
+    INSERT ... SELECT, de modo que el coste de la petición no depende del número de
+    destinatarios. Se deduplica por discord_id.
+
+    Si se indica `category` el aviso es agrupable: se retiene durante la ventana de
+    agrupación (o hasta el siguiente corte para quien tenga el modo resumen activo) y
+    el dispatcher lo fusiona con los demás eventos de la misma categoría del destinatario.
+    Devuelve el número de filas encoladas.
+    """
+    now = datetime.utcnow()
+    send_at = literal(now)
+    if category:
+        window_end = now + timedelta(seconds=current_app.config['NOTIFY_COALESCE_WINDOW_SECONDS'])
+        send_at = case(
+            (User.notification_digest == True, literal(_next_digest_at(now))),
+            else_=literal(window_end)
+        )
+
+    recipients = (
+        select(
+            User.discord_id,
+            literal(message),
+            literal('Pendiente'),
+            literal(0),
+            send_at,
+            literal(now),
+            literal(category),
+            literal(event),
+            literal(subject)
+        )
+        .where(User.discord_id.isnot(None), user_filter)
+        .distinct()
+    )
+
+    stmt = insert(NotificationOutbox).from_select(
+        ['discord_id', 'message', 'status', 'attempts', 'next_attempt_at', 'created_at',
+         'category', 'event', 'subject'],
+        recipients
+    )
+    result = db.session.execute(stmt)
+    return result.rowcount
+
+def enqueue_by_message(users_by_message, chunk=500):
+    """
+    Encola {mensaje: [user_id, ...]}: un enqueue_broadcast por mensaje (y bloque de `chunk`
+    usuarios), así los destinatarios de un mismo texto viajan juntos a /notify_batch.
+    Devuelve el número de filas encoladas. El llamador hace commit.
+    """
+    queued = 0
+    for message, user_ids in users_by_message.items():
+        user_ids = list(user_ids)
+        for start in range(0, len(user_ids), chunk):
+            queued += enqueue_broadcast(message, User.id.in_(user_ids[start:start + chunk]))
+    return queued
+
+# --- AGRUPACIÓN ---
+
+DUTY_EVENT_LABELS = {
+    'on': ('🟢', 'entró en servicio', 'entraron en servicio'),
+    'off': ('🔴', 'salió de servicio', 'salieron de servicio'),
+}
+
+def _format_duty_digest(entries):
+    # Por funcionario cuenta sólo su último cambio de estado dentro de la ventana
+    latest = {}
+    for entry in sorted(entries, key=lambda e: (e.created_at, e.id)):
+        latest[entry.subject] = entry.event
+
+    lines = ["📋 **Resumen de servicio**"]
+    for event, (icon, singular, plural) in DUTY_EVENT_LABELS.items():
+        names = [name for name, ev in latest.items() if ev == event]
+        if names:
+            if len(names) == 1:
+                lines.append(f"{icon} 1 funcionario {singular}: {names[0]}")
+            else:
+                lines.append(f"{icon} {len(names)} funcionarios {plural}: {', '.join(names)}")
+
+    link = f"{current_app.config['WEB_APP_URL']}/settings/notifications"
+    lines.append(f"\nGestionar notificaciones: {link}")
+    return "\n".join(lines)
+
+DIGEST_FORMATTERS = {
+    'duty': _format_duty_digest,
+}
+
+def _coalesce(batch):
+    """
+    Fusiona las filas agrupables del lote con el resto de filas pendientes del mismo
+    destinatario y categoría. La fila más antigua pasa a llevar el resumen y las demás
+    quedan como 'Agrupada'. Devuelve el lote resultante.
+    En Postgres sólo se tocan filas que este dispatcher consigue bloquear: las que otro
+    dispatcher tiene reclamadas (y quizá enviando) se saltan y no se reescriben.
+    """
+    groupable = [e for e in batch if e.category]
+    if not groupable:
+        return batch
+
+    recipients = {e.discord_id for e in groupable}
+    categories = {e.category for e in groupable}
+    pending = (
+        NotificationOutbox.query
+        .filter(
+            NotificationOutbox.status == 'Pendiente',
+            NotificationOutbox.discord_id.in_(recipients),
+            NotificationOutbox.category.in_(categories)
+        )
+        .order_by(NotificationOutbox.id)
+    )
+    if db.engine.dialect.name == 'postgresql':
+        # Las filas del propio lote ya están bloqueadas por esta transacción y vuelven igual
+        pending = pending.with_for_update(skip_locked=True)
+    pending = pending.all()
+
+    groups = {}
+    for entry in pending:
+        groups.setdefault((entry.discord_id, entry.category), []).append(entry)
+
+    merged_away = set()
+    for (discord_id, category), entries in groups.items():
+        if len(entries) < 2:
+            continue
+        head = entries[0]
+        if head not in groupable:
+            # La primera fila del grupo aún no vence: se procesará cuando lo haga
+            continue
+        formatter = DIGEST_FORMATTERS.get(category)
+        if formatter:
+            head.message = formatter(entries)
+        for entry in entries[1:]:
+            entry.status = 'Agrupada'
+            merged_away.add(entry.id)
+
+    return [e for e in batch if e.id not in merged_away]
+
+# --- DESPACHO (proceso dispatcher) ---
+
+def _backoff_delay(attempts):
+    base = current_app.config['OUTBOX_RETRY_BASE_SECONDS']
+    cap = current_app.config['OUTBOX_RETRY_MAX_SECONDS']
+    return min(cap, base * (2 ** max(attempts - 1, 0)))
+
+def _claim_batch(batch_size):
+    query = (
+        NotificationOutbox.query
+        .filter(
+            NotificationOutbox.status == 'Pendiente',
+            NotificationOutbox.next_attempt_at <= datetime.utcnow()
+        )
+        .order_by(NotificationOutbox.next_attempt_at, NotificationOutbox.id)
+        .limit(batch_size)
+    )
+    # En Postgres permite varios dispatchers en paralelo sin enviar dos veces el mismo mensaje.
+    if db.engine.dialect.name == 'postgresql':
+        query = query.with_for_update(skip_locked=True)
+    return query.all()
+
+# 'queued' significa que el bot lo guardó en su cola persistente y se encarga de reintentarlo
+DELIVERED_STATUSES = {'sent', 'queued'}
+# Estados del bot que no tiene sentido reintentar
+PERMANENT_FAILURES = {'not_found', 'forbidden', 'invalid'}
+
+def _deliver_batch(http, bot_url, message, entries):
+    """
+    Envía un grupo de entradas con el mismo mensaje en una sola llamada a /notify_batch.
+    Devuelve {discord_id: status} según la respuesta del bot.
+    """
+    payload = {
+        'message': message,
+        'recipients': [{'discord_id': e.discord_id} for e in entries]
+    }
+    timeout = (1, current_app.config['OUTBOX_HTTP_TIMEOUT'])
+    resp = http.post(f"{bot_url}/notify_batch", endpoint='bot', json=payload, timeout=timeout)
+    resp.raise_for_status()
+    return {r.get('discord_id'): r.get('status') for r in resp.json().get('results', [])}
+
+def _mark_retry(entry, error, max_attempts):
+    entry.last_error = str(error)[:255]
+    if entry.attempts >= max_attempts:
+        entry.status = 'Fallida'
+        return False
+    entry.next_attempt_at = datetime.utcnow() + timedelta(seconds=_backoff_delay(entry.attempts))
+    return True
+
+def dispatch_pending(http=None, batch_size=None):
+    """
+    Envía un lote de notificaciones pendientes al bot.
+    Las entradas con el mismo mensaje (p.ej. un aviso de servicio) viajan juntas en
+    llamadas a /notify_batch de hasta OUTBOX_RECIPIENTS_PER_CALL destinatarios. Los fallos se reprograman con backoff exponencial
+    hasta OUTBOX_MAX_ATTEMPTS.
+    Devuelve (enviadas, reintentadas, fallidas).
+    """
+    bot_url = current_app.config.get('BOT_URL')
+    batch_size = batch_size or current_app.config['OUTBOX_BATCH_SIZE']
+    max_attempts = current_app.config['OUTBOX_MAX_ATTEMPTS']
+    http = http or get_http_client()
+
+    sent = retried = failed = 0
+    batch = _coalesce(_claim_batch(batch_size))
+
+    groups = {}
+    for entry in batch:
+        entry.attempts = (entry.attempts or 0) + 1
+        groups.setdefault(entry.message, []).append(entry)
+
+    # Grupos grandes en varias llamadas para que cada una termine dentro de OUTBOX_HTTP_TIMEOUT
+    per_call = current_app.config['OUTBOX_RECIPIENTS_PER_CALL']
+    calls = [
+        (message, entries[i:i + per_call])
+        for message, entries in groups.items()
+        for i in range(0, len(entries), per_call)
+    ]
+
+    for message, entries in calls:
+        try:
+            statuses = _deliver_batch(http, bot_url, message, entries)
+        except Exception as e:
+            for entry in entries:
+                if _mark_retry(entry, e, max_attempts):
+                    retried += 1
+                else:
+                    failed += 1
+            continue
+
+        for entry in entries:
+            status = statuses.get(entry.discord_id)
+            if status in DELIVERED_STATUSES:
+                entry.status = 'Enviada'
+                entry.sent_at = datetime.utcnow()
+                entry.last_error = None
+                sent += 1
+            elif status in PERMANENT_FAILURES:
+                entry.status = 'Fallida'
+                entry.last_error = status
+                failed += 1
+            elif _mark_retry(entry, status or 'sin respuesta del bot', max_attempts):
+                retried += 1
+            else:
+                failed += 1
+
+    db.session.commit()
+    return sent, retried, failed
+
+def run_dispatcher():
+    """Bucle principal del proceso `dispatcher` (ver Procfile). Requiere app context."""
+    poll_interval = current_app.config['OUTBOX_POLL_INTERVAL']
+    http = get_http_client()
+    print(f"📨 Dispatcher de notificaciones iniciado (bot: {current_app.config.get('BOT_URL')})")
+
+    while True:
+        try:
+            sent, retried, failed = dispatch_pending(http)
+            processed = sent + retried + failed
+            if processed:
+                print(f"📨 Outbox: {sent} enviadas, {retried} reprogramadas, {failed} fallidas.")
+            if retried or failed:
+                # Latencias y circuito del bot para diagnosticar los reintentos
+                print(f"📨 Cliente HTTP: {http.stats()}")
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Error en dispatcher: {e}")
+            processed = 0
+        finally:
+            db.session.remove()
+
+        # Si el lote vino lleno seguimos drenando sin esperar.
+        if processed < current_app.config['OUTBOX_BATCH_SIZE']:
+            time.sleep(poll_interval)
@@ -1,5 +1,6 @@
 import os
 import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 from flask import render_template, flash, redirect, url_for, request, current_app, jsonify, make_response, session
 from app import db
@@ -14,17 +15,40 @@ from app.models import (
     CriminalRecordSubjectPhoto, CriminalRecordEvidencePhoto,
     Appointment, Business, BusinessFine, Document as DocModel
 )
-from sqlalchemy import func, text, inspect
+from app.notifications import (
+    enqueue_notification, enqueue_broadcast, subscribed_to, set_subscriptions,
+    NOTIFICATION_DEPARTMENTS
+)
+from app.http_client import get_http_client
+from app.search import (
+    search_document_ids, index_document, remove_document, highlight_snippets
+)
+from app.citizen_search import search_citizens, count_citizens
+from app.typeahead import citizen_typeahead, invalidate_citizens, typeahead_stats
+from app.approvals import (
+    approve_officials, deny_officials, approve_licenses, reject_licenses, parse_ids,
+    LICENSE_VALIDITY_DAYS
+)
+from app.user_deletion import delete_users
+from app.user_directory import (
+    parse_filters, list_users, count_users, user_counts, department_choices,
+    ROLE_CHOICES, STATUS_CHOICES, DISCORD_CHOICES
+)
+from app.storage import (
+    store_file, release_file, file_path, file_url, STORE_DIR, STORED_NAME_RE, IMMUTABLE_MAX_AGE
+)
+from sqlalchemy import case, func
+from sqlalchemy.orm import defer, joinedload, load_only, selectinload
 from flask_login import current_user, login_user, logout_user, login_required
 from flask import Blueprint
 from werkzeug.utils import secure_filename
 from fpdf import FPDF
 from docx import Document
-from pypdf import PdfReader
 import io
-from flask import send_file
+from flask import send_file, send_from_directory, abort
 
 bp = Blueprint('main', __name__)
+bp.add_app_template_global(file_url)
 
 # --- CONFIGURACIÓN DISCORD OAUTH2 ---
 DISCORD_CLIENT_ID = os.environ.get('DISCORD_CLIENT_ID')
@@ -36,194 +60,18 @@ DISCORD_API_ENDPOINT = 'https://discord.com/api/v10'
 # --- HELPER FUNCTIONS ---
 
 def notify_discord_bot(user, message):
-    if not user.discord_id:
-        return
-    
-    bot_url = os.environ.get('BOT_URL')
-    if not bot_url:
-        print("ADVERTENCIA: Variable 'BOT_URL' no configurada en la Web.")
-        return
-
-    try:
-        payload = {
-            'discord_id': user.discord_id,
-            'message': message
-        }
-        requests.post(f"{bot_url}/notify", json=payload, timeout=2)
-    except Exception as e:
-        print(f"Error enviando notificación a Discord: {e}")
-
-def _build_dependency_map(inspector):
-    """
-    Scans the database to build a map of table dependencies:
-    { 'parent_table': [ {'table': 'child_table', 'col': 'child_col', 'ref_col': 'parent_col'}, ... ] }
-    """
-    dep_map = {}
-    try:
-        tables = inspector.get_table_names()
-        for table_name in tables:
-            try:
-                fks = inspector.get_foreign_keys(table_name)
-                for fk in fks:
-                    ref_table = fk.get('referred_table')
-                    if ref_table:
-                        if ref_table not in dep_map:
-                            dep_map[ref_table] = []
-
-                        constrained = fk.get('constrained_columns')
-                        referred = fk.get('referred_columns')
-
-                        if constrained and referred:
-                            dep_map[ref_table].append({
-                                'table': table_name,
-                                'col': constrained[0], # Assume single col FK for simplicity
-                                'ref_col': referred[0]
-                            })
-            except Exception as e:
-                current_app.logger.warning(f"Error inspecting table {table_name}: {e}")
-    except Exception as e:
-        current_app.logger.error(f"Error building dependency map: {e}")
-    return dep_map
-
-def _cascade_delete(inspector, table_name, id_list, dep_map):
     """
-    Recursively deletes rows in dependent tables.
+    Encola la notificación en la outbox y vuelve de inmediato. El llamador hace commit, así
+    que el aviso se guarda en la misma transacción que el cambio que lo origina.
+    El envío real al bot lo hace el proceso dispatcher (ver app/notifications.py).
     """
-    if not id_list:
-        return 0
-
-    count = 0
-    dependents = dep_map.get(table_name, [])
-
-    # Use tuples for SQL IN clause
-    ids_str = ', '.join(map(str, id_list))
-
-    for dep in dependents:
-        child_table = dep['table']
-        child_col = dep['col']
-        # We need to find IDs of rows in child_table that reference these parents
-        # so we can recurse on THEM.
-        # Assuming child table has a primary key named 'id'. If not, we skip recursion and just delete.
-        try:
-            # Check for PK
-            pk = inspector.get_pk_constraint(child_table)
-            pk_col = pk.get('constrained_columns', ['id'])[0] if pk and pk.get('constrained_columns') else None
-
-            if pk_col:
-                # Find child IDs
-                query_ids = text(f"SELECT {pk_col} FROM {child_table} WHERE {child_col} IN ({ids_str})")
-                child_ids_result = db.session.execute(query_ids)
-                child_ids = [row[0] for row in child_ids_result]
-
-                if child_ids:
-                    current_app.logger.info(f"Recursing delete for {child_table} (dependent of {table_name}) IDs: {len(child_ids)}")
-                    _cascade_delete(inspector, child_table, child_ids, dep_map)
-
-            # Delete the rows
-            query_del = text(f"DELETE FROM {child_table} WHERE {child_col} IN ({ids_str})")
-            result = db.session.execute(query_del)
-            current_app.logger.info(f"Deleted {result.rowcount} rows from {child_table} (dependent of {table_name})")
-            count += result.rowcount
-            db.session.flush() # Ensure deletions are processed
-
-        except Exception as e:
-            current_app.logger.error(f"Error cascading delete for {child_table}: {e}")
-
-    # Note: The caller is responsible for deleting the rows in 'table_name' itself
-    return count
-
-def _cleanup_financial_records(user_id):
-    """
-    Dynamically inspects and cleans up legacy financial tables (bank_account, payroll_item)
-    and their dependencies recursively to prevent Foreign Key errors.
-    """
-    try:
-        inspector = inspect(db.engine)
-        all_tables = inspector.get_table_names()
-        dep_map = _build_dependency_map(inspector)
-
-        # --- A. Clean 'payroll_item' (Direct references to User) ---
-        if 'payroll_item' in all_tables:
-            try:
-                # Find payroll items linked to this user
-                # Assuming 'user_id' is the column name based on the error "payroll_item_user_id_fkey"
-                pi_ids_res = db.session.execute(text("SELECT id FROM payroll_item WHERE user_id = :uid"), {'uid': user_id})
-                pi_ids = [row[0] for row in pi_ids_res]
-
-                if pi_ids:
-                    current_app.logger.info(f"Found payroll_item IDs for user {user_id}: {pi_ids}")
-                    # Cascade delete dependents of these payroll items
-                    _cascade_delete(inspector, 'payroll_item', pi_ids, dep_map)
-
-                    # Delete the items themselves
-                    ids_str = ', '.join(map(str, pi_ids))
-                    result = db.session.execute(text(f"DELETE FROM payroll_item WHERE id IN ({ids_str})"))
-                    current_app.logger.info(f"Deleted {result.rowcount} payroll_item rows")
-                    db.session.flush()
-            except Exception as e:
-                current_app.logger.warning(f"Error cleaning payroll_item for user {user_id}: {e}")
-
-        # --- B. Clean 'bank_account' (Direct references to User) ---
-        if 'bank_account' in all_tables:
-            try:
-                ba_ids_result = db.session.execute(text("SELECT id FROM bank_account WHERE user_id = :uid"), {'uid': user_id})
-                ba_ids = [row[0] for row in ba_ids_result]
-
-                if ba_ids:
-                    current_app.logger.info(f"Found bank_account IDs for user {user_id}: {ba_ids}")
-                    # Cascade delete dependencies
-                    _cascade_delete(inspector, 'bank_account', ba_ids, dep_map)
-
-                    # Delete Bank Accounts
-                    ids_str = ', '.join(map(str, ba_ids))
-                    result = db.session.execute(text(f"DELETE FROM bank_account WHERE id IN ({ids_str})"))
-                    current_app.logger.info(f"Deleted {result.rowcount} bank_account rows")
-                    db.session.flush()
-            except Exception as e:
-                current_app.logger.warning(f"Error cleaning bank_account for user {user_id}: {e}")
-
-        # --- C. Clean 'lottery_ticket' (Direct references to User) ---
-        if 'lottery_ticket' in all_tables:
-            try:
-                # Find lottery tickets linked to this user
-                lt_ids_result = db.session.execute(text("SELECT id FROM lottery_ticket WHERE user_id = :uid"), {'uid': user_id})
-                lt_ids = [row[0] for row in lt_ids_result]
-
-                if lt_ids:
-                    current_app.logger.info(f"Found lottery_ticket IDs for user {user_id}: {lt_ids}")
-
-                    # Cascade delete dependencies (though unlikely for lottery tickets, keeping pattern)
-                    _cascade_delete(inspector, 'lottery_ticket', lt_ids, dep_map)
-
-                    # Delete Lottery Tickets
-                    ids_str = ', '.join(map(str, lt_ids))
-                    result = db.session.execute(text(f"DELETE FROM lottery_ticket WHERE id IN ({ids_str})"))
-                    current_app.logger.info(f"Deleted {result.rowcount} lottery_ticket rows")
-                    db.session.flush()
-            except Exception as e:
-                current_app.logger.warning(f"Error cleaning lottery_ticket for user {user_id}: {e}")
-
-    except Exception as e:
-        current_app.logger.warning(f"Failed to clean up financial records for user {user_id}: {e}")
-
-def _perform_user_deletion(user):
-    # 0. Clean up potential orphaned financial records (from removed system)
-    _cleanup_financial_records(user.id)
-
-    # 1. Nullify author_id in related records to avoid deletion or integrity errors
-    TrafficFine.query.filter_by(author_id=user.id).update({TrafficFine.author_id: None})
-    CriminalRecord.query.filter_by(author_id=user.id).update({CriminalRecord.author_id: None})
-    Comment.query.filter_by(author_id=user.id).update({Comment.author_id: None})
-    DocModel.query.filter_by(uploader_id=user.id).update({DocModel.uploader_id: None})
-
-    # 2. Delete user (Cascade will handle owned records)
-    db.session.delete(user)
+    if user:
+        enqueue_notification(user.discord_id, message)
 
 @bp.route('/official/toggle_duty', methods=['POST'])
 @login_required
 def official_toggle_duty():
-    allowed_departments = ['SABES', 'Gobierno', 'Ejecutivo', 'Legislativo', 'Judicial']
-    if current_user.department not in allowed_departments:
+    if current_user.department not in NOTIFICATION_DEPARTMENTS:
         flash('Acceso denegado.')
         return redirect(url_for('main.official_dashboard'))
 
@@ -233,13 +81,9 @@ def official_toggle_duty():
     status_msg = "EN SERVICIO" if current_user.on_duty else "FUERA DE SERVICIO"
     flash(f'Estado actualizado: {status_msg}')
 
-    # Notificar a usuarios suscritos (Tanto Entrada como Salida)
-    subscribed_users = User.query.filter(User.discord_id.isnot(None), User.receive_notifications == True).all()
-
-    # En un entorno real, esto debería ser una tarea en segundo plano (Celery/Redis)
-    # para no bloquear la respuesta HTTP si hay muchos usuarios.
-    # Aquí simulamos enviando solo a los primeros 50 para evitar timeouts en este MVP.
-    count = 0
+    # Notificar a usuarios suscritos a este departamento (Tanto Entrada como Salida)
+    # Se encola con un único INSERT ... SELECT; el dispatcher agrupa los cambios de servicio
+    # por destinatario y hace el envío en segundo plano.
     link = url_for('main.settings_notifications', _external=True)
 
     if current_user.on_duty:
@@ -255,22 +99,19 @@ def official_toggle_duty():
             f"Gestionar notificaciones: {link}"
         )
 
-    sent_discord_ids = set()
-
-    # Iteramos sobre todos los usuarios suscritos (o un limite razonable)
-    # y usamos el set para evitar duplicados si hay usuarios con mismo discord_id
-    for user in subscribed_users:
-        if count >= 50: # Limite de seguridad MVP
-            break
-
-        if user.discord_id in sent_discord_ids:
-            continue
-
-        notify_discord_bot(user, message)
-        sent_discord_ids.add(user.discord_id)
-        count += 1
-
-    print(f"Notificación de servicio ({status_msg}) enviada a {count} usuarios únicos via Discord.")
+    try:
+        count = enqueue_broadcast(
+            message,
+            (User.receive_notifications == True) & subscribed_to(current_user.department, 'duty'),
+            category='duty',
+            event='on' if current_user.on_duty else 'off',
+            subject=f"{current_user.first_name} {current_user.last_name} ({current_user.department})"
+        )
+        db.session.commit()
+        print(f"Notificación de servicio ({status_msg}) encolada para {count} usuarios únicos via Discord.")
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error encolando notificación de servicio: {e}")
 
     return redirect(url_for('main.official_dashboard'))
 
@@ -281,11 +122,16 @@ def settings_notifications():
         # Simple toggle via form submit or check
         enable = request.form.get('receive_notifications') == 'on'
         current_user.receive_notifications = enable
+        current_user.notification_digest = request.form.get('notification_digest') == 'on'
+        set_subscriptions(current_user, request.form.getlist('departments'), 'duty')
         db.session.commit()
         flash('Preferencias de notificación actualizadas.')
         return redirect(url_for('main.index'))
 
-    return render_template('settings.html')
+    subscribed_departments = {s.department for s in current_user.subscriptions.filter_by(event_type='duty')}
+    return render_template('settings.html',
+                           departments=NOTIFICATION_DEPARTMENTS,
+                           subscribed_departments=subscribed_departments)
 
 # --- API ROUTES FOR DISCORD BOT ---
 
@@ -321,16 +167,26 @@ def api_search_users():
     if not query or len(query) < 2:
         return jsonify([])
 
-    search = f"%{query}%"
-    users = User.query.filter(
-        (User.first_name.ilike(search)) |
-        (User.last_name.ilike(search)) |
-        (User.dni.ilike(search))
-    ).limit(10).all()
+    users = citizen_typeahead(query, limit=10)
 
     results = [{'dni': u.dni, 'name': f"{u.first_name} {u.last_name}"} for u in users]
     return jsonify(results)
 
+@bp.route('/api/search_users/stats')
+@login_required
+def api_search_users_stats():
+    if not current_user.badge_id:
+        return jsonify({'error': 'forbidden'}), 403
+    return jsonify(typeahead_stats())
+
+@bp.route('/api/http_client/stats')
+@login_required
+def api_http_client_stats():
+    """Latencias, errores y estado de los circuitos del cliente HTTP saliente de este proceso."""
+    if not current_user.badge_id:
+        return jsonify({'error': 'forbidden'}), 403
+    return jsonify(get_http_client().stats())
+
 # --- DISCORD OAUTH2 ROUTES ---
 
 @bp.route('/discord/login')
@@ -362,12 +218,13 @@ def discord_callback():
     headers = {'Content-Type': 'application/x-www-form-urlencoded'}
     
     try:
-        token_resp = requests.post(f'{DISCORD_API_ENDPOINT}/oauth2/token', data=data, headers=headers)
+        http = get_http_client()
+        token_resp = http.post(f'{DISCORD_API_ENDPOINT}/oauth2/token', endpoint='discord_oauth', data=data, headers=headers)
         token_resp.raise_for_status()
         access_token = token_resp.json().get('access_token')
 
         user_headers = {'Authorization': f'Bearer {access_token}'}
-        user_resp = requests.get(f'{DISCORD_API_ENDPOINT}/users/@me', headers=user_headers)
+        user_resp = http.get(f'{DISCORD_API_ENDPOINT}/users/@me', endpoint='discord_api', headers=user_headers)
         user_resp.raise_for_status()
 
         discord_user_data = user_resp.json()
@@ -386,6 +243,25 @@ def discord_callback():
         flash('Hubo un error al conectar con Discord. Inténtalo de nuevo.')
         return redirect(url_for('main.citizen_dashboard'))
 
+def _join_guild(http, guild_id, discord_id, bot_token, access_token):
+    """Añade al usuario al servidor con el Bot Token + el Access Token del usuario."""
+    url = f"{DISCORD_API_ENDPOINT}/guilds/{guild_id}/members/{discord_id}"
+    headers = {
+        "Authorization": f"Bot {bot_token}",
+        "Content-Type": "application/json"
+    }
+    payload = {"access_token": access_token}
+
+    try:
+        resp = http.put(url, endpoint='discord_api', headers=headers, json=payload)
+        # 201: Joined, 204: Already joined
+        if resp.status_code in [201, 204]:
+            return True
+        print(f"Failed to join guild {guild_id}: {resp.status_code} {resp.text}")
+    except Exception as e:
+        print(f"Error contacting Discord API: {e}")
+    return False
+
 @bp.route('/discord/select_servers', methods=['GET', 'POST'])
 @login_required
 def discord_select_servers():
@@ -411,30 +287,23 @@ def discord_select_servers():
         if 'gobierno' not in selected_guilds:
             selected_guilds.append('gobierno')
 
+        http = get_http_client()
+
+        # Unirse a todos los servidores en paralelo (una llamada PUT por servidor)
+        joins = {key: guild_map.get(key) for key in selected_guilds if guild_map.get(key)}
         success_count = 0
 
-        for key in selected_guilds:
-            guild_id = guild_map.get(key)
-            if guild_id and bot_token:
-                # Add User to Guild using Bot Token + User Access Token
-                url = f"https://discord.com/api/v10/guilds/{guild_id}/members/{current_user.discord_id}"
-                headers = {
-                    "Authorization": f"Bot {bot_token}",
-                    "Content-Type": "application/json"
+        if joins and bot_token:
+            with ThreadPoolExecutor(max_workers=len(joins)) as pool:
+                futures = {
+                    pool.submit(_join_guild, http, guild_id, current_user.discord_id, bot_token, access_token): key
+                    for key, guild_id in joins.items()
                 }
-                payload = {"access_token": access_token}
-
-                try:
-                    resp = requests.put(url, headers=headers, json=payload, timeout=5)
-                    # 201: Joined, 204: Already joined
-                    if resp.status_code in [201, 204]:
+                for future in as_completed(futures):
+                    if future.result():
                         success_count += 1
-                    else:
-                        print(f"Failed to join guild {key} ({guild_id}): {resp.status_code} {resp.text}")
-                except Exception as e:
-                    print(f"Error contacting Discord API: {e}")
 
-        # Trigger Bot for Roles & Nicknames
+        # Trigger Bot for Roles & Nicknames (el bot responde 202 y avisa por DM al terminar)
         bot_url = os.environ.get('BOT_URL')
         if bot_url:
             try:
@@ -444,7 +313,7 @@ def discord_select_servers():
                     'last_name': current_user.last_name,
                     'guilds': selected_guilds
                 }
-                requests.post(f"{bot_url}/setup_account", json=payload, timeout=5)
+                http.post(f"{bot_url}/setup_account", endpoint='bot', json=payload)
             except Exception as e:
                 print(f"Bot setup error: {e}")
 
@@ -510,6 +379,11 @@ def register():
         )
         user.set_password(form.password.data)
         db.session.add(user)
+        db.session.flush()
+
+        # Suscripción inicial a todos los departamentos (se puede ajustar en Ajustes)
+        set_subscriptions(user, NOTIFICATION_DEPARTMENTS, 'duty')
+        invalidate_citizens()
         db.session.commit()
 
         # Auto login and redirect to Discord flow
@@ -570,10 +444,9 @@ def book_appointment(official_id):
             status='Pending'
         )
         db.session.add(appt)
-        db.session.commit()
-        
         notify_discord_bot(current_user, f"📅 **Cita Solicitada**\nTu cita con el oficial {official.last_name} ha sido registrada para el {combined_dt}.")
         notify_discord_bot(official, f"📅 **Nueva Cita Recibida**\nEl ciudadano {current_user.first_name} {current_user.last_name} solicita cita para el {combined_dt}.\nMotivo: {form.description.data}")
+        db.session.commit()
         
         flash('Cita solicitada con éxito.')
     else:
@@ -605,9 +478,8 @@ def update_my_photo():
     form = UserPhotoForm()
     if form.validate_on_submit():
         if form.photo.data:
-            f = form.photo.data
-            filename = secure_filename(f.filename)
-            f.save(os.path.join(current_app.config['UPLOAD_FOLDER'], filename))
+            filename, _ = store_file(form.photo.data)
+            release_file(current_user.selfie_filename)
             current_user.selfie_filename = filename
             db.session.commit()
             flash('Foto de perfil actualizada.')
@@ -804,15 +676,27 @@ def licenses():
     # Usamos .all() para tener la lista y poder iterar varias veces sin re-ejecutar query
     user_licenses = current_user.licenses.all()
 
-    # Check for expired licenses
-    expired_count = 0
-    for lic in user_licenses:
-        if lic.status == 'Activa' and lic.expiration_date and lic.expiration_date < datetime.utcnow().date():
-            lic.status = 'Vencida'
-            expired_count += 1
+    # Aviso de licencias vencidas. Sólo lectura: el cambio de estado a 'Vencida' lo hace el
+    # proceso sweeper (app/license_expiry.py); una 'Activa' ya caducada que aún no ha alcanzado
+    # el barrido cuenta como vencida. Las vencidas con una solicitud o licencia vigente más
+    # reciente del mismo tipo ya están renovadas y no se avisan.
+    today = datetime.utcnow().date()
+
+    def is_overdue(lic):
+        return lic.status == 'Activa' and lic.expiration_date is not None and lic.expiration_date < today
+
+    def is_current(lic):
+        return lic.status == 'Pendiente' or (lic.status == 'Activa' and not is_overdue(lic))
 
-    if expired_count > 0:
-        db.session.commit() # Commit para guardar el cambio de estado a Vencida
+    latest_current = {}
+    for lic in user_licenses:
+        if is_current(lic):
+            latest_current[lic.type] = max(latest_current.get(lic.type, 0), lic.id)
+    expired_count = sum(
+        1 for lic in user_licenses
+        if (is_overdue(lic) or lic.status == 'Vencida') and latest_current.get(lic.type, 0) < lic.id
+    )
+    if expired_count > 0 and request.method == 'GET':
         flash(f'¡Atención! Tienes {expired_count} licencia(s) vencida(s). Renuevalas cuanto antes.', 'warning')
 
     if request.method == 'POST':
@@ -829,8 +713,8 @@ def licenses():
                     lic_info = PERSONAL_LICENSES[key]
 
                     # Verificar si ya tiene una pendiente o activa de este tipo para evitar duplicados
-                    # (Opcional, pero buena práctica)
-                    existing = next((l for l in user_licenses if l.type == lic_info['name'] and l.status in ['Pendiente', 'Activa']), None)
+                    # (Opcional, pero buena práctica). Las activas ya caducadas cuentan como vencidas
+                    existing = next((l for l in user_licenses if l.type == lic_info['name'] and is_current(l)), None)
 
                     if not existing:
                         new_license = License(
@@ -887,9 +771,7 @@ def register_business():
         # Guardar Foto
         photo_filename = None
         if form.photo.data:
-            f = form.photo.data
-            photo_filename = secure_filename(f.filename)
-            f.save(os.path.join(current_app.config['UPLOAD_FOLDER'], photo_filename))
+            photo_filename, _ = store_file(form.photo.data)
 
         # Crear Negocio
         new_business = Business(
@@ -983,14 +865,8 @@ def official_register():
             flash('Esa Placa ID ya está registrada.')
             return redirect(url_for('main.official_register'))
 
-        photo_file = form.photo.data
-        photo_filename = secure_filename(photo_file.filename)
-
-        if not os.path.exists(current_app.config['UPLOAD_FOLDER']):
-            os.makedirs(current_app.config['UPLOAD_FOLDER'])
-
-        photo_path = os.path.join(current_app.config['UPLOAD_FOLDER'], photo_filename)
-        photo_file.save(photo_path)
+        photo_filename, _ = store_file(form.photo.data)
+        release_file(citizen.selfie_filename)
 
         citizen.badge_id = form.badge_id.data
         citizen.department = form.department.data
@@ -1015,9 +891,11 @@ def official_dashboard():
 
     pending_users = []
     if current_user.department == 'Gobierno' and current_user.official_rank == 'Lider':
-         pending_users = User.query.filter_by(official_status='Pendiente').all()
+         pending_users = User.query.filter(User.official_status == 'Pendiente', User.badge_id != None).all()
     elif current_user.official_rank == 'Lider':
-        pending_users = User.query.filter_by(department=current_user.department, official_status='Pendiente').all()
+        pending_users = User.query.filter(
+            User.department == current_user.department, User.official_status == 'Pendiente', User.badge_id != None
+        ).all()
 
     return render_template('official_dashboard.html', pending_users=pending_users)
 
@@ -1034,12 +912,42 @@ def official_action(user_id, action):
         flash('No tienes permiso para gestionar este usuario.')
         return redirect(url_for('main.official_dashboard'))
 
+    name = f"{target_user.first_name} {target_user.last_name}"
     if action == 'approve':
-        target_user.official_status = 'Aprobado'
-        flash(f'Usuario {target_user.first_name} {target_user.last_name} aprobado.')
+        if approve_officials([user_id], current_user):
+            flash(f'Usuario {name} aprobado.')
+        else:
+            flash(f'La solicitud de {name} ya no está pendiente.')
     elif action == 'deny':
-        db.session.delete(target_user)
-        flash(f'Usuario {target_user.first_name} {target_user.last_name} denegado y eliminado.')
+        if deny_officials([user_id], current_user):
+            invalidate_citizens()
+            flash(f'Usuario {name} denegado y eliminado.')
+        else:
+            flash(f'La solicitud de {name} ya no está pendiente.')
+
+    db.session.commit()
+    return redirect(url_for('main.official_dashboard'))
+
+@bp.route('/official/action/bulk', methods=['POST'])
+@login_required
+def official_bulk_action():
+    if not current_user.badge_id or current_user.official_rank != 'Lider':
+        return redirect(url_for('main.citizen_dashboard'))
+
+    # Sólo se resuelven las solicitudes pendientes al alcance del líder (app/approvals.py)
+    user_ids = parse_ids(request.form.getlist('user_ids'))
+    action = request.form.get('action')
+    if action == 'approve':
+        done = approve_officials(user_ids, current_user)
+        flash(f'{len(done)} solicitud(es) aprobada(s).')
+    elif action == 'deny':
+        done = deny_officials(user_ids, current_user)
+        if done:
+            invalidate_citizens()
+        flash(f'{len(done)} solicitud(es) denegada(s) y eliminada(s).')
+    else:
+        flash('Acción no válida.')
+        return redirect(url_for('main.official_dashboard'))
 
     db.session.commit()
     return redirect(url_for('main.official_dashboard'))
@@ -1051,7 +959,12 @@ def official_licenses_pending():
         flash('Acceso denegado. Solo personal de SABES.')
         return redirect(url_for('main.official_dashboard'))
 
-    pending_licenses = License.query.filter_by(status='Pendiente').all()
+    pending_licenses = (
+        License.query.filter_by(status='Pendiente')
+        .options(joinedload(License.holder), joinedload(License.business))
+        .order_by(License.id)
+        .all()
+    )
     return render_template('manage_licenses.html', licenses=pending_licenses)
 
 @bp.route('/official/licenses/action/<int:license_id>/<action>', methods=['POST'])
@@ -1062,19 +975,41 @@ def official_license_action(license_id, action):
         return redirect(url_for('main.official_dashboard'))
 
     lic = License.query.get_or_404(license_id)
+    label, holder = lic.type, lic.holder
 
     if action == 'approve':
-        lic.status = 'Activa'
-        lic.issue_date = datetime.utcnow().date()
-        lic.expiration_date = datetime.utcnow().date() + timedelta(days=30)
-        flash(f'Licencia {lic.type} aprobada para {lic.holder.first_name} {lic.holder.last_name}. Expira en 30 días.')
+        if approve_licenses([license_id], current_user):
+            flash(f'Licencia {label} aprobada para {holder.first_name} {holder.last_name}. '
+                  f'Expira en {LICENSE_VALIDITY_DAYS} días.')
+        else:
+            flash(f'La licencia {label} ya no está pendiente.')
+    elif action == 'reject':
+        if reject_licenses([license_id], current_user):
+            flash(f'Licencia {label} rechazada.')
+        else:
+            flash(f'La licencia {label} ya no está pendiente.')
 
-        notify_discord_bot(lic.holder, f"✅ **Licencia Aprobada**\nTu licencia '{lic.type}' ha sido aprobada y es válida hasta el {lic.expiration_date}.")
+    db.session.commit()
+    return redirect(url_for('main.official_licenses_pending'))
+
+@bp.route('/official/licenses/bulk', methods=['POST'])
+@login_required
+def official_licenses_bulk_action():
+    if not current_user.badge_id or current_user.department != 'SABES':
+        flash('Acceso denegado.')
+        return redirect(url_for('main.official_dashboard'))
 
+    license_ids = parse_ids(request.form.getlist('license_ids'))
+    action = request.form.get('action')
+    if action == 'approve':
+        done = approve_licenses(license_ids, current_user)
+        flash(f'{len(done)} licencia(s) aprobada(s). Expiran en {LICENSE_VALIDITY_DAYS} días.')
     elif action == 'reject':
-        lic.status = 'Rechazada'
-        flash(f'Licencia {lic.type} rechazada.')
-        notify_discord_bot(lic.holder, f"❌ **Licencia Rechazada**\nTu solicitud para la licencia '{lic.type}' ha sido rechazada. Contacta a SABES para más información.")
+        done = reject_licenses(license_ids, current_user)
+        flash(f'{len(done)} licencia(s) rechazada(s).')
+    else:
+        flash('Acción no válida.')
+        return redirect(url_for('main.official_licenses_pending'))
 
     db.session.commit()
     return redirect(url_for('main.official_licenses_pending'))
@@ -1089,12 +1024,12 @@ def government_dashboard():
 
     create_leader_form = CreateLeaderForm()
 
-    # Obtener lista de todos los usuarios ciudadanos (no funcionarios)
-    all_users = User.query.filter(User.badge_id == None).all()
+    # Totales desde los contadores mantenidos; el listado de usuarios está paginado en government_users
+    counts = user_counts()
 
     return render_template('government_dashboard.html',
                            create_leader_form=create_leader_form,
-                           all_users=all_users)
+                           counts=counts)
 
 @bp.route('/government/create_leader', methods=['POST'])
 @login_required
@@ -1127,6 +1062,7 @@ def government_create_leader():
         user.set_password(form.password.data)
 
         db.session.add(user)
+        invalidate_citizens()
         db.session.commit()
 
         flash(f'Líder de {form.department.data} creado con éxito.')
@@ -1144,8 +1080,16 @@ def government_users():
         flash('Acceso denegado.')
         return redirect(url_for('main.official_dashboard'))
 
-    users = User.query.all()
-    return render_template('government_users.html', users=users)
+    filters = parse_filters(request.args)
+    after = request.args.get('after', type=int)
+    users, next_after = list_users(filters, after)
+    total, total_exact = count_users(filters)
+
+    return render_template('government_users.html', users=users, filters=filters,
+                           after=after, next_after=next_after,
+                           total=total, total_exact=total_exact,
+                           departments=department_choices(), role_choices=ROLE_CHOICES,
+                           status_choices=STATUS_CHOICES, discord_choices=DISCORD_CHOICES)
 
 @bp.route('/government/users/<int:user_id>/unlink', methods=['POST'])
 @login_required
@@ -1172,11 +1116,34 @@ def government_user_delete(user_id):
         flash('No puedes eliminar tu propia cuenta desde aquí.')
         return redirect(url_for('main.government_users'))
 
-    _perform_user_deletion(user)
+    name = f"{user.first_name} {user.last_name}"
+    delete_users([user.id])
+    invalidate_citizens()
     db.session.commit()
-    flash(f'Usuario {user.first_name} {user.last_name} eliminado permanentemente.')
+    flash(f'Usuario {name} eliminado permanentemente.')
     return redirect(url_for('main.government_users'))
 
+@bp.route('/government/users/delete', methods=['POST'])
+@login_required
+def government_users_delete():
+    if current_user.department != 'Gobierno':
+        flash('Acceso denegado.')
+        return redirect(url_for('main.official_dashboard'))
+
+    user_ids = {int(v) for v in request.form.getlist('user_ids') if v.isdigit()}
+    user_ids.discard(current_user.id)
+    if not user_ids:
+        flash('No se seleccionó ningún usuario.')
+        return redirect(request.referrer or url_for('main.government_users'))
+
+    # Todas las cuentas en una sola transacción (app/user_deletion.py)
+    existing = [uid for (uid,) in db.session.query(User.id).filter(User.id.in_(user_ids))]
+    delete_users(existing)
+    invalidate_citizens()
+    db.session.commit()
+    flash(f'{len(existing)} usuario(s) eliminado(s) permanentemente.')
+    return redirect(request.referrer or url_for('main.government_users'))
+
 @bp.route('/official/kick_member/<int:user_id>', methods=['POST'])
 @login_required
 def kick_member(user_id):
@@ -1208,6 +1175,8 @@ def kick_member(user_id):
 
 # --- CITIZEN DATABASE ROUTES ---
 
+CITIZEN_PAGE_SIZE = 25
+
 @bp.route('/official/database', methods=['GET'])
 @login_required
 def official_database():
@@ -1215,18 +1184,82 @@ def official_database():
         return redirect(url_for('main.citizen_dashboard'))
 
     form = SearchUserForm(request.args)
+    page = request.args.get('page', 1, type=int) or 1
+    page = max(page, 1)
     users = []
+    has_next = False
+    total, total_exact = 0, True
     if form.query.data:
-        query = form.query.data
-        users = User.query.filter(
-            (
-                User.first_name.contains(query) |
-                User.last_name.contains(query) |
-                User.dni.contains(query)
-            )
-        ).all()
+        # Se pide uno más de la cuenta para saber si hay página siguiente
+        users = search_citizens(
+            form.query.data, limit=CITIZEN_PAGE_SIZE + 1, offset=(page - 1) * CITIZEN_PAGE_SIZE
+        )
+        has_next = len(users) > CITIZEN_PAGE_SIZE
+        users = users[:CITIZEN_PAGE_SIZE]
+        total, total_exact = count_citizens(form.query.data)
 
-    return render_template('official_database.html', form=form, users=users)
+    return render_template('official_database.html', form=form, users=users, page=page, has_next=has_next,
+                           total=total, total_exact=total_exact)
+
+def _load_citizen_profile(user_id):
+    """
+    Carga el perfil completo en un número fijo de consultas (una por colección, con los
+    autores y fotos precargados) y devuelve listas normales para la plantilla. Las
+    relaciones lazy='dynamic' de User no admiten carga anticipada, por eso se consulta
+    cada colección por separado en lugar de recorrerlas desde `citizen`.
+    """
+    citizen = db.session.get(User, user_id)
+    if citizen is None:
+        abort(404)
+
+    licenses = License.query.filter_by(user_id=user_id, business_id=None).order_by(License.id).all()
+    businesses = Business.query.filter_by(owner_id=user_id).order_by(Business.id).all()
+
+    business_licenses = {}
+    if businesses:
+        for lic in (
+            License.query
+            .filter(License.business_id.in_([b.id for b in businesses]))
+            .order_by(License.id)
+            .all()
+        ):
+            business_licenses.setdefault(lic.business_id, []).append(lic)
+
+    comments = (
+        Comment.query
+        .options(joinedload(Comment.author))
+        .filter_by(user_id=user_id)
+        .order_by(Comment.id)
+        .all()
+    )
+    criminal_records = (
+        CriminalRecord.query
+        .options(
+            joinedload(CriminalRecord.author),
+            selectinload(CriminalRecord.subject_photos),
+            selectinload(CriminalRecord.evidence_photos),
+        )
+        .filter_by(user_id=user_id)
+        .order_by(CriminalRecord.id)
+        .all()
+    )
+    traffic_fines = (
+        TrafficFine.query
+        .options(joinedload(TrafficFine.author))
+        .filter_by(user_id=user_id)
+        .order_by(TrafficFine.id)
+        .all()
+    )
+
+    return {
+        'citizen': citizen,
+        'licenses': licenses,
+        'businesses': businesses,
+        'business_licenses': business_licenses,
+        'comments': comments,
+        'criminal_records': criminal_records,
+        'traffic_fines': traffic_fines,
+    }
 
 @bp.route('/official/citizen/<int:user_id>')
 @login_required
@@ -1234,7 +1267,8 @@ def citizen_profile(user_id):
     if not current_user.badge_id:
         return redirect(url_for('main.citizen_dashboard'))
 
-    citizen = User.query.get_or_404(user_id)
+    profile = _load_citizen_profile(user_id)
+    citizen = profile['citizen']
 
     can_edit_reports = current_user.department in ['SABES', 'Gobierno']
 
@@ -1248,12 +1282,13 @@ def citizen_profile(user_id):
     # NUEVO: Formulario cambio de contraseña para admin
     change_password_form = ChangePasswordForm()
 
-    return render_template('citizen_profile.html', citizen=citizen,
+    return render_template('citizen_profile.html',
                            can_edit=can_edit_reports,
                            comment_form=comment_form, fine_form=fine_form,
                            criminal_form=criminal_form,
                            edit_info_form=edit_info_form, edit_photos_form=edit_photos_form,
-                           change_password_form=change_password_form)
+                           change_password_form=change_password_form,
+                           **profile)
 
 @bp.route('/official/citizen/<int:user_id>/add_comment', methods=['POST'])
 @login_required
@@ -1279,6 +1314,18 @@ def add_comment(user_id):
 
 # --- SA FINDER ROUTES ---
 
+SAFINDER_PAGE_SIZE = 20
+
+def _doc_cursor(doc):
+    return f"{doc.created_at.strftime('%Y%m%d%H%M%S%f')}-{doc.id}"
+
+def _parse_doc_cursor(value):
+    try:
+        stamp, doc_id = value.split('-')
+        return datetime.strptime(stamp, '%Y%m%d%H%M%S%f'), int(doc_id)
+    except (AttributeError, ValueError):
+        return None
+
 @bp.route('/official/safinder', methods=['GET'])
 def safinder():
     # Public access allowed for viewing/search
@@ -1286,19 +1333,64 @@ def safinder():
 
     query = request.args.get('q', '')
 
+    # Listados sin el texto completo (puede ser enorme) y con el autor en la misma consulta
+    listing = DocModel.query.options(defer(DocModel.text_content), joinedload(DocModel.uploader))
+    snippets = {}
+    next_cursor = None
+    next_page = None
+    page = max(request.args.get('page', 1, type=int), 1)
+
     if query:
-        search = f"%{query}%"
-        results = DocModel.query.filter(
-            (DocModel.title.ilike(search)) |
-            (DocModel.text_content.ilike(search))
-        ).order_by(DocModel.created_at.desc()).all()
+        # Búsqueda: orden por relevancia, paginado por número de página
+        offset = (page - 1) * SAFINDER_PAGE_SIZE
+        ranked = None
+        try:
+            ranked = search_document_ids(query, limit=SAFINDER_PAGE_SIZE + 1, offset=offset)
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.warning(f"Índice de texto completo no disponible: {e}")
+
+        if ranked is not None:
+            page_ids = [doc_id for doc_id, _ in ranked[:SAFINDER_PAGE_SIZE]]
+            docs_by_id = {d.id: d for d in listing.filter(DocModel.id.in_(page_ids)).all()}
+            results = [docs_by_id[doc_id] for doc_id in page_ids if doc_id in docs_by_id]
+            has_more = len(ranked) > SAFINDER_PAGE_SIZE
+        else:
+            search = f"%{query}%"
+            rows = listing.filter(
+                (DocModel.title.ilike(search)) |
+                (DocModel.text_content.ilike(search))
+            ).order_by(DocModel.created_at.desc(), DocModel.id.desc()).offset(offset).limit(SAFINDER_PAGE_SIZE + 1).all()
+            results = rows[:SAFINDER_PAGE_SIZE]
+            has_more = len(rows) > SAFINDER_PAGE_SIZE
+
+        if has_more:
+            next_page = page + 1
+        snippets = highlight_snippets([doc.id for doc in results], query)
     else:
-        # If no search, return all documents ordered by date
-        results = DocModel.query.order_by(DocModel.created_at.desc()).all()
-
-    recent_docs = DocModel.query.order_by(DocModel.created_at.desc()).limit(5).all()
+        # Sin búsqueda: todos los documentos por fecha, paginados por cursor (created_at, id)
+        docs = listing.order_by(DocModel.created_at.desc(), DocModel.id.desc())
+        cursor = _parse_doc_cursor(request.args.get('cursor'))
+        if cursor:
+            cursor_date, cursor_id = cursor
+            docs = docs.filter(
+                (DocModel.created_at < cursor_date) |
+                ((DocModel.created_at == cursor_date) & (DocModel.id < cursor_id))
+            )
+        rows = docs.limit(SAFINDER_PAGE_SIZE + 1).all()
+        results = rows[:SAFINDER_PAGE_SIZE]
+        if len(rows) > SAFINDER_PAGE_SIZE:
+            next_cursor = _doc_cursor(results[-1])
+
+    recent_docs = (
+        DocModel.query
+        .options(load_only(DocModel.id, DocModel.title, DocModel.filename))
+        .order_by(DocModel.created_at.desc())
+        .limit(5).all()
+    )
 
-    return render_template('safinder.html', results=results, recent_docs=recent_docs)
+    return render_template('safinder.html', results=results, recent_docs=recent_docs,
+                           snippets=snippets, next_cursor=next_cursor, next_page=next_page, page=page)
 
 @bp.route('/official/safinder/upload', methods=['POST'])
 @login_required
@@ -1318,41 +1410,81 @@ def safinder_upload():
         return redirect(url_for('main.safinder'))
 
     if file and file.filename.lower().endswith('.pdf'):
-        import uuid
-        filename = f"{uuid.uuid4().hex}_{secure_filename(file.filename)}"
-        docs_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], 'docs')
-
-        if not os.path.exists(docs_folder):
-            os.makedirs(docs_folder)
-
-        file_path = os.path.join(docs_folder, filename)
-        file.save(file_path)
+        filename, duplicate = store_file(file)
+
+        # Si el mismo PDF ya se subió y se procesó, se reutiliza su texto sin volver a extraerlo
+        source = None
+        if duplicate:
+            source = (
+                DocModel.query
+                .options(load_only(DocModel.text_content, DocModel.snippet, DocModel.pages_total))
+                .filter(DocModel.filename == filename, DocModel.status == 'Listo')
+                .first()
+            )
 
-        # Extract Text
-        try:
-            reader = PdfReader(file_path)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-        except Exception as e:
-            print(f"Error parsing PDF: {e}")
-            text = "Error leyendo contenido."
-
-        new_doc = DocModel(
-            title=title,
-            filename=filename,
-            text_content=text,
-            uploader_id=current_user.id
-        )
+        if source:
+            new_doc = DocModel(
+                title=title,
+                filename=filename,
+                text_content=source.text_content,
+                snippet=source.snippet,
+                status='Listo',
+                pages_total=source.pages_total,
+                pages_done=source.pages_total or 0,
+                uploader_id=current_user.id
+            )
+        else:
+            # La extracción del texto la hace el proceso 'ingest' (app/ingest.py);
+            # de momento el documento sólo es localizable por título.
+            new_doc = DocModel(
+                title=title,
+                filename=filename,
+                text_content='',
+                status='Pendiente',
+                pages_done=0,
+                uploader_id=current_user.id
+            )
         db.session.add(new_doc)
+        db.session.flush()
+        index_document(new_doc)
         db.session.commit()
 
-        flash('Documento subido e indexado correctamente.')
+        if source:
+            flash('Documento subido. Ya existía una copia idéntica, el contenido está disponible para búsqueda.')
+        else:
+            flash('Documento subido. El contenido se está indexando y estará disponible en breve.')
     else:
         flash('Solo se permiten archivos PDF.')
 
     return redirect(url_for('main.safinder'))
 
+@bp.route('/files/<path:name>')
+def stored_file(name):
+    # Archivos del almacén por hash: el contenido de una URL no cambia nunca
+    if not STORED_NAME_RE.match(name):
+        abort(404)
+    response = send_from_directory(
+        os.path.join(current_app.config['UPLOAD_FOLDER'], STORE_DIR), name, max_age=IMMUTABLE_MAX_AGE
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+@bp.route('/official/safinder/status', methods=['GET'])
+def safinder_status():
+    # Progreso de ingesta de los documentos indicados (?ids=1,2,3) para la barra de progreso
+    ids = [int(i) for i in request.args.get('ids', '').split(',') if i.isdigit()][:SAFINDER_PAGE_SIZE]
+    docs = (
+        DocModel.query
+        .options(load_only(DocModel.id, DocModel.status, DocModel.pages_done, DocModel.pages_total))
+        .filter(DocModel.id.in_(ids))
+        .all()
+    )
+    return jsonify({
+        str(d.id): {'status': d.status, 'pages_done': d.pages_done or 0, 'pages_total': d.pages_total}
+        for d in docs
+    })
+
 @bp.route('/official/safinder/delete/<int:doc_id>', methods=['POST'])
 @login_required
 def safinder_delete(doc_id):
@@ -1361,15 +1493,17 @@ def safinder_delete(doc_id):
 
     doc = DocModel.query.get_or_404(doc_id)
 
-    # Delete physical file
-    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'docs', doc.filename)
-    if os.path.exists(file_path):
-        try:
-            os.remove(file_path)
-        except Exception as e:
-            print(f"Error deleting file {file_path}: {e}")
+    # Delete physical file (los del almacén por hash se borran al quedarse sin referencias)
+    if not release_file(doc.filename):
+        legacy_path = file_path(doc.filename, 'docs')
+        if os.path.exists(legacy_path):
+            try:
+                os.remove(legacy_path)
+            except Exception as e:
+                print(f"Error deleting file {legacy_path}: {e}")
 
     # Delete database record
+    remove_document(doc.id)
     db.session.delete(doc)
     db.session.commit()
 
@@ -1391,9 +1525,8 @@ def add_traffic_fine(user_id):
             author_id=current_user.id
         )
         db.session.add(fine)
-        db.session.commit()
-        
         notify_discord_bot(citizen, f"🚨 **Has recibido una Multa**\nRazón: {form.reason.data}\nAgente: {current_user.first_name} {current_user.last_name} ({current_user.department})")
+        db.session.commit()
 
         flash(f'Multa impuesta.')
     else:
@@ -1425,26 +1558,20 @@ def add_criminal_record(user_id):
         db.session.add(record)
         db.session.commit() # Commit inicial para tener el ID del record
 
-        if not os.path.exists(current_app.config['UPLOAD_FOLDER']):
-            os.makedirs(current_app.config['UPLOAD_FOLDER'])
-
         for file in form.subject_photos.data:
             if file and file.filename != '':
-                filename = secure_filename(file.filename)
-                file.save(os.path.join(current_app.config['UPLOAD_FOLDER'], filename))
+                filename, _ = store_file(file)
                 photo = CriminalRecordSubjectPhoto(filename=filename, record_id=record.id)
                 db.session.add(photo)
 
         for file in form.evidence_photos.data:
              if file and file.filename != '':
-                filename = secure_filename(file.filename)
-                file.save(os.path.join(current_app.config['UPLOAD_FOLDER'], filename))
+                filename, _ = store_file(file)
                 photo = CriminalRecordEvidencePhoto(filename=filename, record_id=record.id)
                 db.session.add(photo)
 
-        db.session.commit()
-        
         notify_discord_bot(citizen, f"⚖️ **Nuevo Antecedente Penal**\nDelito: {form.crime.data}\nCódigo Penal: {form.penal_code.data}\nAgente: {current_user.first_name} {current_user.last_name}")
+        db.session.commit()
         
         flash('Antecedente penal registrado.')
     else:
@@ -1468,6 +1595,7 @@ def edit_citizen_info(user_id):
         user.first_name = form.first_name.data
         user.last_name = form.last_name.data
         user.dni = form.dni.data
+        invalidate_citizens()
         db.session.commit()
         flash('Información personal actualizada exitosamente.')
     else:
@@ -1487,15 +1615,13 @@ def update_citizen_photos(user_id):
 
     if form.validate_on_submit():
         if form.selfie.data:
-            f = form.selfie.data
-            filename = secure_filename(f.filename)
-            f.save(os.path.join(current_app.config['UPLOAD_FOLDER'], filename))
+            filename, _ = store_file(form.selfie.data)
+            release_file(user.selfie_filename)
             user.selfie_filename = filename
         
         if form.dni_photo.data:
-            f = form.dni_photo.data
-            filename = secure_filename(f.filename)
-            f.save(os.path.join(current_app.config['UPLOAD_FOLDER'], filename))
+            filename, _ = store_file(form.dni_photo.data)
+            release_file(user.dni_photo_filename)
             user.dni_photo_filename = filename
             
         db.session.commit()
@@ -1560,11 +1686,13 @@ def delete_citizen_account(user_id):
         return redirect(url_for('main.citizen_profile', user_id=user_id))
 
     user = User.query.get_or_404(user_id)
+    name = f"{user.first_name} {user.last_name}"
 
-    _perform_user_deletion(user)
+    delete_users([user.id])
+    invalidate_citizens()
     db.session.commit()
 
-    flash(f'Usuario {user.first_name} {user.last_name} eliminado permanentemente.')
+    flash(f'Usuario {name} eliminado permanentemente.')
     return redirect(url_for('main.official_dashboard'))
 
 @bp.route('/licenses/business/<int:business_id>/transfer', methods=['POST'])
@@ -1594,10 +1722,9 @@ def transfer_business(business_id):
     for lic in business.licenses:
         lic.user_id = new_owner.id
 
-    db.session.commit()
-
     notify_discord_bot(new_owner, f"🏢 **Nuevo Negocio Recibido**\n{current_user.first_name} {current_user.last_name} te ha transferido el negocio '{business.name}'.")
     notify_discord_bot(current_user, f"🏢 **Negocio Transferido**\nHas transferido '{business.name}' a {new_owner.first_name} {new_owner.last_name}.")
+    db.session.commit()
 
     flash(f'Negocio "{business.name}" transferido exitosamente a {new_owner.first_name} {new_owner.last_name}.', 'success')
     return redirect(url_for('main.licenses'))
@@ -1646,6 +1773,74 @@ def renew_business_license(business_id, license_id):
 
 # --- OFFICIAL BUSINESS ROUTES ---
 
+BUSINESS_PAGE_SIZE = 25
+
+def _business_registry_page(query, after=None):
+    """
+    Una página del registro de negocios (paginación por id, uno más de la cuenta para saber
+    si hay siguiente) en una sola consulta: el dueño y los contadores de multas y licencias
+    por estado salen de subconsultas agrupadas restringidas a los ids de la página.
+    """
+    page = db.session.query(Business.id)
+    if query:
+        page = page.filter(Business.name.ilike(f"%{query}%"))
+    if after:
+        page = page.filter(Business.id > after)
+    page = page.order_by(Business.id).limit(BUSINESS_PAGE_SIZE + 1).cte('business_page')
+    page_ids = db.session.query(page.c.id)
+
+    def count_status(column, status):
+        return func.sum(case((column == status, 1), else_=0))
+
+    fine_stats = (
+        db.session.query(
+            BusinessFine.business_id.label('business_id'),
+            func.count(BusinessFine.id).label('fines_total'),
+            count_status(BusinessFine.status, 'Pendiente').label('fines_pending')
+        )
+        .filter(BusinessFine.business_id.in_(page_ids))
+        .group_by(BusinessFine.business_id)
+        .subquery()
+    )
+    license_stats = (
+        db.session.query(
+            License.business_id.label('business_id'),
+            func.count(License.id).label('licenses_total'),
+            count_status(License.status, 'Pendiente').label('licenses_pending'),
+            count_status(License.status, 'Activa').label('licenses_active')
+        )
+        .filter(License.business_id.in_(page_ids))
+        .group_by(License.business_id)
+        .subquery()
+    )
+
+    rows = (
+        db.session.query(
+            Business,
+            func.coalesce(fine_stats.c.fines_total, 0),
+            func.coalesce(fine_stats.c.fines_pending, 0),
+            func.coalesce(license_stats.c.licenses_total, 0),
+            func.coalesce(license_stats.c.licenses_pending, 0),
+            func.coalesce(license_stats.c.licenses_active, 0)
+        )
+        .join(page, page.c.id == Business.id)
+        .outerjoin(fine_stats, fine_stats.c.business_id == Business.id)
+        .outerjoin(license_stats, license_stats.c.business_id == Business.id)
+        .options(joinedload(Business.owner))
+        .order_by(Business.id)
+        .all()
+    )
+
+    businesses = []
+    for business, fines_total, fines_pending, licenses_total, licenses_pending, licenses_active in rows:
+        business.fines_total = fines_total
+        business.fines_pending = fines_pending
+        business.licenses_total = licenses_total
+        business.licenses_pending = licenses_pending
+        business.licenses_active = licenses_active
+        businesses.append(business)
+    return businesses
+
 @bp.route('/official/businesses')
 @login_required
 def official_businesses():
@@ -1655,13 +1850,50 @@ def official_businesses():
         return redirect(url_for('main.official_dashboard'))
 
     query = request.args.get('q', '')
-    if query:
-        search = f"%{query}%"
-        businesses = Business.query.filter(Business.name.ilike(search)).all()
-    else:
-        businesses = Business.query.all()
+    after = request.args.get('after', type=int)
+    businesses = _business_registry_page(query, after)
+    next_after = None
+    if len(businesses) > BUSINESS_PAGE_SIZE:
+        businesses = businesses[:BUSINESS_PAGE_SIZE]
+        next_after = businesses[-1].id
 
-    return render_template('official_businesses.html', businesses=businesses)
+    return render_template('official_businesses.html', businesses=businesses,
+                           next_after=next_after, after=after)
+
+@bp.route('/official/businesses/<int:business_id>/details')
+@login_required
+def official_business_details(business_id):
+    """Multas y licencias de un negocio; se piden al abrir su ficha en el registro."""
+    if current_user.department not in ['SABES', 'Gobierno']:
+        return jsonify({'error': 'forbidden'}), 403
+
+    business = Business.query.get_or_404(business_id)
+    fines = (
+        BusinessFine.query
+        .options(joinedload(BusinessFine.author))
+        .filter_by(business_id=business.id)
+        .order_by(BusinessFine.date.desc())
+        .all()
+    )
+    licenses = License.query.filter_by(business_id=business.id).order_by(License.id).all()
+
+    return jsonify({
+        'fines': [{
+            'id': fine.id,
+            'reason': fine.reason,
+            'date': fine.date.strftime('%d/%m') if fine.date else '',
+            'author': fine.author.last_name if fine.author else '',
+            'status': fine.status,
+            'pay_url': url_for('main.pay_business_fine', business_id=business.id, fine_id=fine.id),
+        } for fine in fines],
+        'licenses': [{
+            'id': lic.id,
+            'type': lic.type,
+            'status': lic.status,
+            'approve_url': url_for('main.official_license_action', license_id=lic.id, action='approve'),
+            'reject_url': url_for('main.official_license_action', license_id=lic.id, action='reject'),
+        } for lic in licenses]
+    })
 
 @bp.route('/official/business/<int:business_id>/fine', methods=['POST'])
 @login_required
@@ -1685,9 +1917,8 @@ def official_business_fine(business_id):
         status='Pendiente'
     )
     db.session.add(fine)
-    db.session.commit()
-
     notify_discord_bot(business.owner, f"🚨 **Multa a Negocio**\nTu negocio '{business.name}' ha recibido una multa.\nRazón: {reason}\nAgente: {current_user.first_name} {current_user.last_name}")
+    db.session.commit()
 
     flash(f'Multa aplicada a "{business.name}".', 'success')
     return redirect(url_for('main.official_businesses'))
@@ -1711,9 +1942,8 @@ def official_approve_business_registration(business_id):
             lic.issue_date = datetime.utcnow().date()
             lic.expiration_date = datetime.utcnow().date() + timedelta(days=30)
 
-    db.session.commit()
-
     notify_discord_bot(business.owner, f"✅ **Negocio Aprobado**\nTu negocio '{business.name}' ha sido registrado y aprobado exitosamente.")
+    db.session.commit()
 
     flash(f'Negocio "{business.name}" aprobado.', 'success')
     return redirect(url_for('main.official_businesses'))
@@ -0,0 +1,113 @@
+import os
+from functools import lru_cache
+
+from alembic.config import Config as AlembicConfig
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from flask_migrate import stamp, upgrade
+from sqlalchemy import inspect
+
+from app import db
+
+
+# Esquema de la base de datos.
+# Los cambios se aplican una sola vez por despliegue con `python release.py` (fase release del
+# Procfile): migraciones de Alembic, índices de búsqueda y usuario admin.
+# Los workers de Gunicorn sólo comparan la revisión de la base de datos con la del código
+# (check_schema, una consulta a alembic_version) y avisan si falta aplicar la release.
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+# Revisión de las bases de datos creadas antes de introducir las migraciones (run.py hacía create_all)
+BASELINE_REVISION = 'b8fb3476761c'
+
+
+@lru_cache(maxsize=1)
+def head_revision():
+    """Última revisión de migrations/versions (se lee una vez por proceso)."""
+    config = AlembicConfig()
+    config.set_main_option('script_location', MIGRATIONS_DIR)
+    return ScriptDirectory.from_config(config).get_current_head()
+
+def current_revision():
+    with db.engine.connect() as conn:
+        return MigrationContext.configure(conn).get_current_revision()
+
+def check_schema():
+    """
+    Comprobación de arranque de los workers: True si la base de datos está en la última
+    revisión. No modifica nada. Requiere app context.
+    """
+    try:
+        current, head = current_revision(), head_revision()
+    except Exception as e:
+        print(f"⚠️ No se pudo comprobar la versión del esquema: {e}")
+        return False
+    if current != head:
+        print(f"⚠️ Esquema en la revisión {current or 'ninguna'} (el código espera {head}). "
+              "Ejecuta `python release.py`.")
+        return False
+    return True
+
+
+# --- RELEASE ---
+
+def _ensure_admin():
+    from app.models import User
+    if User.query.filter_by(badge_id="000").first():
+        return False
+    admin = User(
+        first_name="Admin",
+        last_name="Gobierno",
+        dni="00000000A",
+        badge_id="000",
+        department="Gobierno",
+        official_rank="Lider",
+        official_status="Aprobado",
+        selfie_filename="default.jpg",
+        dni_photo_filename="default.jpg"
+    )
+    admin.set_password("000")
+    db.session.add(admin)
+    db.session.commit()
+    return True
+
+def run_release():
+    """
+    Prepara la base de datos para la versión desplegada. Idempotente; requiere app context.
+    """
+    from app.search import ensure_search_index
+    from app.citizen_search import ensure_citizen_search_index
+    from app.user_directory import ensure_user_counters
+
+    print("🔄 Preparando la base de datos...")
+
+    if current_revision() is None:
+        # Las tablas anteriores a las migraciones no tienen revisión propia: una base de datos
+        # vacía se crea desde los modelos. Tanto ésta como una anterior a las migraciones se
+        # marcan en la revisión base y se les aplican todas las siguientes: algunas crean
+        # objetos que no están en los modelos (p.ej. pg_trgm e ix_business_name_trgm en
+        # Postgres). Las migraciones comprueban el esquema antes de tocarlo, así que sobre
+        # tablas recién creadas por create_all() no repiten nada.
+        if not inspect(db.engine).get_table_names():
+            db.create_all()
+        stamp(directory=MIGRATIONS_DIR, revision=BASELINE_REVISION)
+    upgrade(directory=MIGRATIONS_DIR)
+    print(f"✅ Esquema en la revisión {current_revision()}.")
+
+    # Índice de texto completo de SAFinder (tsvector + GIN en Postgres, FTS5 en SQLite)
+    ensure_search_index()
+    print("✅ Índice de búsqueda de documentos verificado.")
+
+    # Índice de búsqueda de ciudadanos (pg_trgm en Postgres, tabla de trigramas en SQLite)
+    ensure_citizen_search_index()
+    print("✅ Índice de búsqueda de ciudadanos verificado.")
+
+    # Contadores de usuarios por grupo para los totales del panel de Gobierno (app/user_directory.py)
+    if ensure_user_counters():
+        print("✅ Contadores de usuarios inicializados.")
+
+    if _ensure_admin():
+        print("✅ Usuario Admin (000/000) creado.")
+
+    print("✨ Base de datos lista.")
@@ -0,0 +1,270 @@
+import re
+import unicodedata
+
+from markupsafe import Markup, escape
+
+from flask import current_app
+from sqlalchemy import text
+
+from app import db
+from app.models import Document
+
+
+# Índice de texto completo para SAFinder.
+# - Postgres: columna tsvector generada (título con peso A, contenido con peso B) + índice GIN.
+#   Usa la configuración 'es_unaccent' (spanish + unaccent) si se puede crear, si no 'spanish'.
+# - SQLite: tabla FTS5 'document_fts' (rowid = document.id) con el texto ya normalizado
+#   y reducido a raíces por spanish_stem().
+# - Con SAFINDER_SEARCH_BACKEND='memory' se usa en su lugar el índice BM25 de app/bm25.py.
+
+PG_CONFIG_NAME = 'es_unaccent'
+_pg_config = None
+
+SPANISH_SUFFIXES = (
+    'amientos', 'imientos', 'aciones', 'uciones', 'amiento', 'imiento', 'idades',
+    'adoras', 'adores', 'ancias', 'encias', 'amente', 'acion', 'ucion', 'adora',
+    'ador', 'ancia', 'encia', 'mente', 'idad', 'ables', 'ibles', 'able', 'ible',
+    'ivas', 'ivos', 'osas', 'osos', 'iva', 'ivo', 'osa', 'oso', 'es', 'as', 'os',
+    'a', 'o', 'e', 's',
+)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+# --- NORMALIZACIÓN (SQLite) ---
+
+def strip_accents(value):
+    normalized = unicodedata.normalize('NFKD', value)
+    return ''.join(c for c in normalized if not unicodedata.combining(c))
+
+def spanish_stem(word):
+    """Stemmer ligero para español: quita sufijos flexivos/derivativos frecuentes."""
+    if len(word) <= 4:
+        return word
+    for suffix in SPANISH_SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+def tokenize(value):
+    return TOKEN_RE.findall(strip_accents((value or '').lower()))
+
+def normalize_text(value):
+    return ' '.join(spanish_stem(tok) for tok in tokenize(value))
+
+
+# --- ESQUEMA ---
+
+def _dialect():
+    return db.engine.dialect.name
+
+def _use_memory_index():
+    return current_app.config.get('SAFINDER_SEARCH_BACKEND') == 'memory'
+
+def _pg_text_config():
+    global _pg_config
+    if _pg_config is None:
+        exists = db.session.execute(
+            text("SELECT 1 FROM pg_ts_config WHERE cfgname = :name"), {'name': PG_CONFIG_NAME}
+        ).first()
+        _pg_config = PG_CONFIG_NAME if exists else 'spanish'
+    return _pg_config
+
+def _ensure_pg_index():
+    global _pg_config
+    # Configuración española sin acentos (requiere la extensión unaccent)
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS unaccent"))
+            exists = conn.execute(text("SELECT 1 FROM pg_ts_config WHERE cfgname = :name"), {'name': PG_CONFIG_NAME}).first()
+            if not exists:
+                conn.execute(text(f"CREATE TEXT SEARCH CONFIGURATION {PG_CONFIG_NAME} ( COPY = spanish )"))
+                conn.execute(text(
+                    f"ALTER TEXT SEARCH CONFIGURATION {PG_CONFIG_NAME} "
+                    "ALTER MAPPING FOR hword, hword_part, word WITH unaccent, spanish_stem"
+                ))
+    except Exception as e:
+        current_app.logger.warning(f"unaccent no disponible, se usa 'spanish': {e}")
+    _pg_config = None
+    config = _pg_text_config()
+
+    with db.engine.begin() as conn:
+        conn.execute(text(
+            "ALTER TABLE document ADD COLUMN IF NOT EXISTS search_vector tsvector "
+            "GENERATED ALWAYS AS ("
+            f"setweight(to_tsvector('{config}'::regconfig, coalesce(title, '')), 'A') || "
+            f"setweight(to_tsvector('{config}'::regconfig, coalesce(text_content, '')), 'B')"
+            ") STORED"
+        ))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_document_search_vector ON document USING GIN (search_vector)"
+        ))
+
+def _ensure_sqlite_index():
+    db.session.execute(text(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS document_fts "
+        "USING fts5(title, body, tokenize='unicode61 remove_diacritics 2')"
+    ))
+    # Backfill de documentos que aún no están en el índice
+    missing = db.session.execute(text(
+        "SELECT id, title, text_content FROM document "
+        "WHERE id NOT IN (SELECT rowid FROM document_fts)"
+    )).fetchall()
+    for row in missing:
+        _sqlite_upsert(row.id, row.title, row.text_content)
+    db.session.commit()
+    return len(missing)
+
+def ensure_search_index():
+    """Crea (si falta) el índice de texto completo del dialecto actual. Se llama al arrancar."""
+    if _use_memory_index():
+        from app import bm25
+        index = bm25.get_index()
+        print(f"✅ Índice BM25 en memoria cargado ({len(index)} documentos).")
+    elif _dialect() == 'postgresql':
+        _ensure_pg_index()
+    elif _dialect() == 'sqlite':
+        indexed = _ensure_sqlite_index()
+        if indexed:
+            print(f"✅ {indexed} documento(s) añadidos al índice FTS5.")
+
+
+# --- SINCRONIZACIÓN ---
+
+def _sqlite_upsert(doc_id, title, content):
+    db.session.execute(text("DELETE FROM document_fts WHERE rowid = :id"), {'id': doc_id})
+    db.session.execute(
+        text("INSERT INTO document_fts (rowid, title, body) VALUES (:id, :title, :body)"),
+        {'id': doc_id, 'title': normalize_text(title), 'body': normalize_text(content)}
+    )
+
+def index_document(doc):
+    """
+    Añade/actualiza el documento en el índice. En Postgres la columna es generada y no hay
+    nada que hacer. Requiere que `doc.id` exista (flush previo). El llamador hace commit.
+    """
+    if _use_memory_index():
+        from app import bm25
+        bm25.mark_changed()
+    elif _dialect() == 'sqlite':
+        _sqlite_upsert(doc.id, doc.title, doc.text_content)
+
+def remove_document(doc_id):
+    if _use_memory_index():
+        from app import bm25
+        bm25.mark_changed()
+    elif _dialect() == 'sqlite':
+        db.session.execute(text("DELETE FROM document_fts WHERE rowid = :id"), {'id': doc_id})
+
+
+# --- BÚSQUEDA ---
+
+def _sqlite_match_expr(query):
+    terms = [spanish_stem(tok) for tok in tokenize(query)]
+    if not terms:
+        return ''
+    # El último término admite prefijo para que una palabra a medio escribir también encuentre
+    parts = [f'"{t}"' for t in terms[:-1]] + [f'"{terms[-1]}"*']
+    return ' AND '.join(parts)
+
+def search_document_ids(query, limit=50, offset=0):
+    """
+    Devuelve [(doc_id, score)] ordenados por relevancia (mayor score primero).
+    Devuelve None si el dialecto no tiene índice de texto completo.
+    """
+    if _use_memory_index():
+        from app import bm25
+        return bm25.get_index().search(query, limit=limit, offset=offset)
+
+    if _dialect() == 'postgresql':
+        rows = db.session.execute(text(
+            "SELECT id, ts_rank_cd(search_vector, q) AS score "
+            "FROM document, websearch_to_tsquery(CAST(:config AS regconfig), :q) AS q "
+            "WHERE search_vector @@ q "
+            "ORDER BY score DESC, created_at DESC LIMIT :limit OFFSET :offset"
+        ), {'config': _pg_text_config(), 'q': query, 'limit': limit, 'offset': offset}).fetchall()
+        return [(row.id, row.score) for row in rows]
+
+    if _dialect() == 'sqlite':
+        match = _sqlite_match_expr(query)
+        if not match:
+            return []
+        # bm25 devuelve valores negativos: más negativo = más relevante. Título pesa 10x.
+        rows = db.session.execute(text(
+            "SELECT rowid AS id, -bm25(document_fts, 10.0, 1.0) AS score "
+            "FROM document_fts WHERE document_fts MATCH :match "
+            "ORDER BY bm25(document_fts, 10.0, 1.0) LIMIT :limit OFFSET :offset"
+        ), {'match': match, 'limit': limit, 'offset': offset}).fetchall()
+        return [(row.id, row.score) for row in rows]
+
+    return None
+
+
+# --- SNIPPETS ---
+
+SNIPPET_LENGTH = 300
+SNIPPET_CONTEXT = 140
+
+# Marcadores que no aparecen en texto normal; se sustituyen por <mark> tras escapar el HTML
+_HL_START = '\x02'
+_HL_STOP = '\x03'
+
+def build_snippet(content, length=SNIPPET_LENGTH):
+    """Resumen corto que se guarda en Document.snippet al indexar."""
+    content = ' '.join((content or '').split())
+    if len(content) <= length:
+        return content
+    return content[:length].rsplit(' ', 1)[0] + '…'
+
+def _to_markup(raw):
+    return Markup(str(escape(raw)).replace(_HL_START, '<mark>').replace(_HL_STOP, '</mark>'))
+
+def _python_highlight(content, query):
+    stems = {spanish_stem(tok) for tok in tokenize(query)}
+    content = ' '.join((content or '').split())
+    matches = [
+        m for m in TOKEN_RE.finditer(content)
+        if spanish_stem(strip_accents(m.group(0).lower())) in stems
+    ]
+    if not matches:
+        return _to_markup(build_snippet(content))
+
+    start = max(0, matches[0].start() - SNIPPET_CONTEXT)
+    end = min(len(content), matches[0].end() + SNIPPET_CONTEXT)
+    pieces, cursor = [], start
+    for m in matches:
+        if m.start() < start or m.end() > end:
+            continue
+        pieces.append(content[cursor:m.start()])
+        pieces.append(_HL_START + m.group(0) + _HL_STOP)
+        cursor = m.end()
+    pieces.append(content[cursor:end])
+    raw = ''.join(pieces)
+    return _to_markup(('…' if start > 0 else '') + raw + ('…' if end < len(content) else ''))
+
+def highlight_snippets(doc_ids, query):
+    """
+    {doc_id: Markup} con fragmentos del texto alrededor de los términos buscados,
+    resaltados con <mark>. Sólo lee el contenido de los documentos de la página actual.
+    """
+    if not doc_ids or not query:
+        return {}
+
+    if _dialect() == 'postgresql' and not _use_memory_index():
+        rows = db.session.execute(text(
+            "SELECT id, ts_headline(CAST(:config AS regconfig), text_content, "
+            "websearch_to_tsquery(CAST(:config AS regconfig), :q), :opts) AS headline "
+            "FROM document WHERE id = ANY(:ids)"
+        ), {
+            'config': _pg_text_config(), 'q': query, 'ids': list(doc_ids),
+            'opts': f'StartSel={_HL_START}, StopSel={_HL_STOP}, MaxWords=40, MinWords=20, MaxFragments=2'
+        }).fetchall()
+        return {row.id: _to_markup(row.headline or '') for row in rows}
+
+    docs = (
+        Document.query
+        .options(db.load_only(Document.id, Document.text_content))
+        .filter(Document.id.in_(doc_ids))
+        .all()
+    )
+    return {doc.id: _python_highlight(doc.text_content, query) for doc in docs}
@@ -0,0 +1,197 @@
+import json
+import logging
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+
+from flask import current_app, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# Instrumentación SQL por petición.
+# - Cuenta las sentencias y el tiempo en base de datos de cada petición (eventos del Engine).
+# - Agrupa las sentencias por forma (SQL normalizado, sin literales) y marca como posible
+#   N+1 las formas que se repiten SQL_N_PLUS_ONE_THRESHOLD veces o más en la misma petición.
+# - Publica el resultado en la cabecera X-SQL-Queries / Server-Timing (modo debug o
+#   SQL_MONITOR_HEADER), en el log (una línea JSON por petición) y en assert_max_queries().
+
+_active = ContextVar('sql_monitor_recorders', default=())
+
+# Logger propio con su handler: el de Flask queda en WARNING fuera del modo debug y las
+# líneas 'sql_request' (INFO) se perderían
+logger = logging.getLogger('app.sql_monitor')
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+_PLACEHOLDER_RE = re.compile(r'%\(\w+\)s|%s|(?<!:):\w+')
+_IN_LIST_RE = re.compile(r'\bIN \((?: ?\?,?)+\)', re.IGNORECASE)
+_SPACE_RE = re.compile(r'\s+')
+_SELECT_LIST_RE = re.compile(r'^SELECT .+? FROM ')
+
+
+@lru_cache(maxsize=2048)
+def normalize_sql(statement):
+    """Forma de una sentencia: sin literales, parámetros como ? y listas IN colapsadas."""
+    sql = _SPACE_RE.sub(' ', statement).strip()
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _PLACEHOLDER_RE.sub('?', sql)
+    return _IN_LIST_RE.sub('IN (...)', sql)
+
+def short_sql(shape, limit=300):
+    """Versión abreviada para logs: sin la lista de columnas del SELECT."""
+    return _SELECT_LIST_RE.sub('SELECT ... FROM ', shape, count=1)[:limit]
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = {}
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        shape = normalize_sql(statement)
+        entry = self.statements.get(shape)
+        if entry is None:
+            self.statements[shape] = entry = {'count': 0, 'duration': 0.0}
+        entry['count'] += 1
+        entry['duration'] += duration
+
+    def repeated(self, threshold):
+        """Formas ejecutadas `threshold` veces o más, de la más repetida a la menos."""
+        shapes = [(shape, entry) for shape, entry in self.statements.items() if entry['count'] >= threshold]
+        return sorted(shapes, key=lambda item: item[1]['count'], reverse=True)
+
+    def summary(self, threshold):
+        return {
+            'queries': self.count,
+            'db_ms': round(self.duration * 1000, 2),
+            'shapes': len(self.statements),
+            'n_plus_one': [
+                {'sql': short_sql(shape), 'count': entry['count'], 'db_ms': round(entry['duration'] * 1000, 2)}
+                for shape, entry in self.repeated(threshold)
+            ],
+        }
+
+
+@contextmanager
+def record_queries():
+    """Registra las sentencias ejecutadas dentro del bloque (en este hilo/contexto)."""
+    recorder = QueryRecorder()
+    token = _active.set(_active.get() + (recorder,))
+    try:
+        yield recorder
+    finally:
+        _active.reset(token)
+
+
+@contextmanager
+def assert_max_queries(limit, threshold=None):
+    """
+    Falla si el bloque ejecuta más de `limit` sentencias o alguna forma se repite
+    `threshold` veces o más (por defecto no se comprueba). Uso en pruebas:
+
+        with assert_max_queries(12):
+            client.get('/official/citizen/1')
+    """
+    with record_queries() as recorder:
+        yield recorder
+    problems = []
+    if recorder.count > limit:
+        problems.append(f"{recorder.count} sentencias (máximo {limit})")
+    if threshold:
+        problems.extend(
+            f"posible N+1: {entry['count']}x {shape}" for shape, entry in recorder.repeated(threshold)
+        )
+    if problems:
+        detail = '\n'.join(
+            f"  {entry['count']}x {shape}"
+            for shape, entry in sorted(recorder.statements.items(), key=lambda item: -item[1]['count'])
+        )
+        raise AssertionError('; '.join(problems) + '\n' + detail)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _active.get():
+        conn.info.setdefault('sql_monitor_start', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    recorders = _active.get()
+    starts = conn.info.get('sql_monitor_start')
+    if not recorders or not starts:
+        return
+    duration = time.perf_counter() - starts.pop()
+    for recorder in recorders:
+        recorder.record(statement, duration)
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(exception_context):
+    starts = exception_context.connection.info.get('sql_monitor_start') if exception_context.connection else None
+    if starts:
+        starts.pop()
+
+
+class SQLMonitor:
+    """Extensión Flask: sql_monitor.init_app(app) activa el registro en cada petición."""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SQL_MONITOR', 1)
+        app.config.setdefault('SQL_MONITOR_HEADER', 0)
+        app.config.setdefault('SQL_N_PLUS_ONE_THRESHOLD', 5)
+        if not app.config['SQL_MONITOR']:
+            return
+        if not logger.handlers:
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter('[%(asctime)s] %(levelname)s in sql_monitor: %(message)s'))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._teardown)
+
+    def _start(self):
+        g._sql_recorder = QueryRecorder()
+        g._sql_token = _active.set(_active.get() + (g._sql_recorder,))
+
+    def _stop(self):
+        token = g.pop('_sql_token', None)
+        if token is not None:
+            _active.reset(token)
+        return g.pop('_sql_recorder', None)
+
+    def _finish(self, response):
+        recorder = self._stop()
+        if recorder is None:
+            return response
+
+        summary = recorder.summary(current_app.config['SQL_N_PLUS_ONE_THRESHOLD'])
+        if current_app.debug or current_app.config['SQL_MONITOR_HEADER']:
+            response.headers['X-SQL-Queries'] = (
+                f"count={summary['queries']}; db_ms={summary['db_ms']}; n_plus_one={len(summary['n_plus_one'])}"
+            )
+            response.headers.add('Server-Timing', f"db;dur={summary['db_ms']};desc=\"{summary['queries']} queries\"")
+
+        if summary['queries']:
+            record = dict(summary, endpoint=request.endpoint, method=request.method,
+                          path=request.path, status=response.status_code)
+            if summary['n_plus_one']:
+                logger.warning(f"sql_n_plus_one {json.dumps(record, ensure_ascii=False)}")
+            else:
+                logger.info(f"sql_request {json.dumps(record, ensure_ascii=False)}")
+        return response
+
+    def _teardown(self, exc):
+        # Si la petición falló antes de after_request, se suelta el registro igualmente
+        self._stop()
@@ -0,0 +1,184 @@
+import hashlib
+import os
+import re
+import tempfile
+
+from flask import current_app, url_for
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from werkzeug.utils import secure_filename
+
+from app import db
+from app.models import StoredFile
+
+
+# Almacén de archivos subidos direccionado por contenido.
+# Cada archivo se guarda una sola vez en UPLOAD_FOLDER/cas/ab/cd/<sha256>.<ext> y la tabla
+# stored_file lleva la cuenta de cuántas filas lo usan. El nombre devuelto ('cas/...') es
+# el que se guarda en las columnas *_filename; los nombres antiguos (sin 'cas/') siguen
+# resolviéndose como antes.
+
+STORE_DIR = 'cas'
+CHUNK_SIZE = 64 * 1024
+# El contenido de una URL nunca cambia (el nombre es su hash): se puede cachear un año
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+STORED_NAME_RE = re.compile(r'^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.[a-z0-9]{1,10})?$')
+
+_PENDING_REMOVALS = 'storage_pending_removals'
+
+
+def is_stored(name):
+    return bool(name) and name.startswith(STORE_DIR + '/')
+
+def stored_name(sha256, ext=''):
+    return f"{STORE_DIR}/{sha256[:2]}/{sha256[2:4]}/{sha256}{ext}"
+
+def file_path(name, legacy_folder=''):
+    """Ruta en disco de un archivo subido (almacén por hash o nombre antiguo en legacy_folder)."""
+    root = current_app.config['UPLOAD_FOLDER']
+    if is_stored(name):
+        return os.path.join(root, name)
+    return os.path.join(root, legacy_folder, name)
+
+def file_url(name, legacy_folder=''):
+    """URL pública del archivo. Los del almacén van por main.stored_file con caché inmutable."""
+    if is_stored(name):
+        return url_for('main.stored_file', name=name[len(STORE_DIR) + 1:])
+    return url_for('static', filename='/'.join(p for p in ('img', legacy_folder, name) if p))
+
+def _extension(filename):
+    ext = os.path.splitext(secure_filename(filename or ''))[1].lower()
+    return ext if re.fullmatch(r'\.[a-z0-9]{1,10}', ext) else ''
+
+
+# --- ALTA ---
+
+def _write_temp(upload, root):
+    """Copia el archivo a un temporal dentro del almacén calculando el hash por bloques."""
+    tmp_dir = os.path.join(root, STORE_DIR, 'tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = upload.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                size += len(chunk)
+                out.write(chunk)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    return tmp_path, digest.hexdigest(), size
+
+def _place(tmp_path, full_path):
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    os.replace(tmp_path, full_path)
+
+def store_file(upload):
+    """
+    Guarda un FileStorage en el almacén y suma una referencia.
+    Devuelve (nombre, duplicado): duplicado=True si ese contenido ya estaba guardado y no
+    se ha escrito nada nuevo. El llamador hace commit.
+    """
+    root = current_app.config['UPLOAD_FOLDER']
+    tmp_path, sha256, size = _write_temp(upload, root)
+
+    bumped = (
+        StoredFile.query
+        .filter_by(sha256=sha256)
+        .update({StoredFile.ref_count: StoredFile.ref_count + 1}, synchronize_session=False)
+    )
+    if bumped:
+        name = db.session.query(StoredFile.path).filter_by(sha256=sha256).scalar()
+        full_path = os.path.join(root, name)
+        if os.path.exists(full_path):
+            os.remove(tmp_path)
+        else:
+            # La fila existe pero el archivo se perdió: se restaura con este mismo contenido
+            _place(tmp_path, full_path)
+        return name, True
+
+    name = stored_name(sha256, _extension(upload.filename))
+    _place(tmp_path, os.path.join(root, name))
+    try:
+        with db.session.begin_nested():
+            db.session.add(StoredFile(sha256=sha256, path=name, size=size, ref_count=1))
+    except IntegrityError:
+        # Otra petición ha registrado el mismo contenido a la vez
+        StoredFile.query.filter_by(sha256=sha256).update(
+            {StoredFile.ref_count: StoredFile.ref_count + 1}, synchronize_session=False
+        )
+        name = db.session.query(StoredFile.path).filter_by(sha256=sha256).scalar()
+        return name, True
+    return name, False
+
+
+# --- BAJA ---
+
+def release_file(name):
+    """
+    Resta una referencia. Si era la última, borra la fila y (tras el commit) el archivo.
+    Los nombres antiguos fuera del almacén se ignoran. El llamador hace commit.
+    """
+    if not is_stored(name):
+        return False
+
+    sha256 = os.path.splitext(os.path.basename(name))[0]
+    StoredFile.query.filter_by(sha256=sha256).update(
+        {StoredFile.ref_count: StoredFile.ref_count - 1}, synchronize_session=False
+    )
+    remaining = db.session.query(StoredFile.ref_count).filter_by(sha256=sha256).scalar()
+    if remaining is not None and remaining <= 0:
+        StoredFile.query.filter_by(sha256=sha256).delete(synchronize_session=False)
+        db.session.info.setdefault(_PENDING_REMOVALS, []).append(file_path(name))
+    return True
+
+def release_files(names):
+    """
+    release_file para muchos nombres a la vez: un UPDATE por número de referencias a restar
+    (normalmente uno) y un DELETE de los que quedan a cero. Devuelve cuántos eran del almacén.
+    El llamador hace commit.
+    """
+    counts = {}
+    for name in names:
+        if is_stored(name):
+            sha256 = os.path.splitext(os.path.basename(name))[0]
+            counts[sha256] = counts.get(sha256, 0) + 1
+    if not counts:
+        return 0
+
+    by_count = {}
+    for sha256, count in counts.items():
+        by_count.setdefault(count, []).append(sha256)
+    for count, hashes in by_count.items():
+        StoredFile.query.filter(StoredFile.sha256.in_(hashes)).update(
+            {StoredFile.ref_count: StoredFile.ref_count - count}, synchronize_session=False
+        )
+
+    exhausted = StoredFile.sha256.in_(list(counts)) & (StoredFile.ref_count <= 0)
+    paths = [path for (path,) in db.session.query(StoredFile.path).filter(exhausted)]
+    if paths:
+        StoredFile.query.filter(exhausted).delete(synchronize_session=False)
+        db.session.info.setdefault(_PENDING_REMOVALS, []).extend(file_path(path) for path in paths)
+    return sum(counts.values())
+
+@event.listens_for(Session, 'after_commit')
+def _remove_released_files(session):
+    for path in session.info.pop(_PENDING_REMOVALS, []):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error deleting file {path}: {e}")
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_released_files(session):
+    session.info.pop(_PENDING_REMOVALS, None)
@@ -0,0 +1,181 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from flask import current_app
+
+from app.models import CacheVersion, User
+from app.citizen_search import search_citizens, normalize, match_tier
+
+
+# Caché por proceso del typeahead de ciudadanos (GET /api/search_users).
+# - LRU acotada con TTL: consulta normalizada -> resultados (tuplas, sin objetos del ORM).
+# - Cada consulta se resuelve pidiendo TYPEAHEAD_FILL resultados; si vienen menos, el conjunto
+#   está completo y sirve para contestar consultas más largas con el mismo prefijo filtrando
+#   en memoria, sin ir a la base de datos.
+# - Invalidación: el contador CacheVersion('citizens') se incrementa en la misma transacción
+#   que crea, edita o borra ciudadanos; cada proceso lo lee y vacía su caché si ha cambiado.
+
+CITIZENS_VERSION = 'citizens'
+MIN_QUERY_LENGTH = 2
+
+Citizen = namedtuple('Citizen', 'dni first_name last_name')
+
+
+def invalidate_citizens():
+    """Invalida el typeahead en todos los procesos. El llamador hace commit."""
+    CacheVersion.bump(CITIZENS_VERSION)
+
+
+class TypeaheadCache:
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.prefix_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+        self.miss_ms = 0.0
+        self.saved_ms = 0.0
+
+    def sync_version(self, version):
+        with self._lock:
+            if version != self.version:
+                if self.version is not None:
+                    self.invalidations += 1
+                self._entries.clear()
+                self.version = version
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry['expires_at'] < time.monotonic():
+            del self._entries[key]
+            self.evictions += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def get(self, key):
+        with self._lock:
+            entry = self._lookup(key)
+            return entry['results'] if entry else None
+
+    def get_prefix(self, key):
+        """Resultados completos del prefijo más largo en caché que permita filtrar `key`."""
+        with self._lock:
+            for end in range(len(key) - 1, MIN_QUERY_LENGTH - 1, -1):
+                prefix = key[:end]
+                # Sólo prefijos cuyas palabras tengan 3+ letras: con menos, la búsqueda exige
+                # inicio de palabra y no contendría todas las coincidencias de la consulta larga
+                if any(len(word) < 3 for word in normalize(prefix).split()):
+                    continue
+                entry = self._lookup(prefix)
+                if entry and entry['complete']:
+                    return entry['results']
+        return None
+
+    def put(self, key, results, complete):
+        with self._lock:
+            self._entries[key] = {
+                'results': results,
+                'complete': complete,
+                'expires_at': time.monotonic() + self.ttl
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def record(self, kind, elapsed_ms):
+        with self._lock:
+            if kind == 'miss':
+                self.misses += 1
+                self.miss_ms += elapsed_ms
+                return
+            if kind == 'hit':
+                self.hits += 1
+            else:
+                self.prefix_hits += 1
+            # Ahorro estimado: latencia media de un fallo menos lo que ha costado el acierto
+            avg_miss = self.miss_ms / self.misses if self.misses else 0.0
+            self.saved_ms += max(avg_miss - elapsed_ms, 0.0)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.prefix_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'version': self.version,
+                'lookups': lookups,
+                'hits': self.hits,
+                'prefix_hits': self.prefix_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.hits + self.prefix_hits) / lookups, 4) if lookups else 0.0,
+                'invalidations': self.invalidations,
+                'evictions': self.evictions,
+                'avg_miss_ms': round(self.miss_ms / self.misses, 3) if self.misses else 0.0,
+                'saved_ms': round(self.saved_ms, 1),
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_typeahead_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = TypeaheadCache(
+                    current_app.config['TYPEAHEAD_CACHE_SIZE'],
+                    current_app.config['TYPEAHEAD_CACHE_TTL']
+                )
+    return _cache
+
+def _filter_prefix_results(results, query, normalized):
+    matches = [
+        c for c in results
+        if normalized in normalize(f"{c.first_name or ''} {c.last_name or ''}") or normalized in normalize(c.dni)
+    ]
+    return sorted(matches, key=lambda c: match_tier(c, query, normalized))
+
+def citizen_typeahead(query, limit=10):
+    """Sugerencias [Citizen] para el typeahead, servidas desde la caché del proceso si es posible."""
+    query = (query or '').strip()
+    key = query.lower()
+    if len(key) < MIN_QUERY_LENGTH:
+        return []
+
+    start = time.perf_counter()
+    cache = get_typeahead_cache()
+    cache.sync_version(CacheVersion.current(CITIZENS_VERSION))
+
+    results = cache.get(key)
+    if results is not None:
+        cache.record('hit', (time.perf_counter() - start) * 1000)
+        return results[:limit]
+
+    prefix_results = cache.get_prefix(key)
+    if prefix_results is not None:
+        results = _filter_prefix_results(prefix_results, query, normalize(query))
+        # Sin coincidencias exactas se consulta la base de datos (búsqueda aproximada)
+        if results:
+            cache.put(key, results, complete=True)
+            cache.record('prefix', (time.perf_counter() - start) * 1000)
+            return results[:limit]
+
+    fill = max(current_app.config['TYPEAHEAD_FILL'], limit)
+    users = search_citizens(query, limit=fill, columns=(User.id, User.dni, User.first_name, User.last_name))
+    results = [Citizen(u.dni, u.first_name, u.last_name) for u in users]
+    cache.put(key, results, complete=len(results) < fill)
+    cache.record('miss', (time.perf_counter() - start) * 1000)
+    return results[:limit]
+
+def typeahead_stats():
+    return get_typeahead_cache().stats()
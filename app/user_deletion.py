@@ -0,0 +1,150 @@
+import threading
+from graphlib import TopologicalSorter
+
+from flask import current_app
+from sqlalchemy import Integer, MetaData, any_, bindparam, delete, or_, select, update
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from app import db
+from app.citizen_search import remove_users_from_index
+from app.storage import release_files
+from app.user_directory import uncount_users
+
+
+# Borrado de usuarios en bloque (una cuenta o cientos en la misma transacción).
+# - El grafo de claves foráneas se refleja de la base de datos una vez por proceso y se guarda
+#   en caché, junto con el orden topológico de las tablas que dependen de 'user' (directa o
+#   indirectamente, incluidas las tablas heredadas sin modelo: bank_account, payroll_item...).
+# - Una sentencia por tabla, de hijas a padres. Las filas de cada tabla se eligen con una
+#   subconsulta sobre su tabla padre, así que no se leen ids intermedios.
+# - Los ids de usuario van en un único parámetro: ARRAY en Postgres, IN expandido en SQLite.
+# - Las columnas de autoría (NULLIFY_COLUMNS) se ponen a NULL en lugar de borrar la fila.
+# Como no pasa por el ORM, aquí se hace lo que hacían los eventos de User al borrar
+# (contadores y trigramas de búsqueda) y se liberan los archivos del almacén que usaban.
+
+# (tabla, columna): la fila se conserva sin autor
+NULLIFY_COLUMNS = {
+    ('traffic_fine', 'author_id'),
+    ('criminal_record', 'author_id'),
+    ('comment', 'author_id'),
+    ('business_fine', 'author_id'),
+    ('document', 'uploader_id'),
+    ('audit_entry', 'actor_id'),
+}
+
+# Columnas con nombres del almacén por hash (app/storage.py) en las tablas que se borran
+STORED_FILE_COLUMNS = {
+    'user': ('selfie_filename', 'dni_photo_filename'),
+    'business': ('photo_filename',),
+    'criminal_record_subject_photo': ('filename',),
+    'criminal_record_evidence_photo': ('filename',),
+}
+
+_plans = {}
+_plans_lock = threading.Lock()
+
+
+class DeletionPlan:
+    """Tablas afectadas al borrar usuarios, en orden de padres a hijas (empieza por 'user')."""
+
+    def __init__(self, metadata):
+        self.tables = metadata.tables
+        self.parents = {}   # tabla -> [(columna hija, columna referida del padre)]
+        self.nullify = []   # [(columna hija, columna referida del padre)]
+
+        children = {}
+        for table in metadata.tables.values():
+            for fk in table.foreign_keys:
+                parent = fk.column.table.name
+                if parent != table.name:
+                    children.setdefault(parent, []).append((fk.parent, fk.column))
+
+        pending, seen = ['user'], {'user'}
+        while pending:
+            for column, referred in children.get(pending.pop(), []):
+                child = column.table.name
+                if (child, column.name) in NULLIFY_COLUMNS and column.nullable:
+                    self.nullify.append((column, referred))
+                    continue
+                self.parents.setdefault(child, []).append((column, referred))
+                if child not in seen:
+                    seen.add(child)
+                    pending.append(child)
+
+        graph = {name: {referred.table.name for _, referred in self.parents.get(name, [])} for name in seen}
+        self.order = list(TopologicalSorter(graph).static_order())
+
+    def selector(self, name, ids):
+        """Condición que elige las filas de `name` que caen con los usuarios `ids`."""
+        table = self.tables[name]
+        if name == 'user':
+            return _in_ids(table.c.id, ids)
+        return or_(*(self.references(column, referred, ids) for column, referred in self.parents[name]))
+
+    def references(self, column, referred, ids):
+        """Condición sobre `column` (FK a `referred`) para las filas padre que caen con `ids`."""
+        if referred is self.tables['user'].c.id:
+            return _in_ids(column, ids)
+        return column.in_(select(referred).where(self.selector(referred.table.name, ids)))
+
+
+def _in_ids(column, ids):
+    if db.engine.dialect.name == 'postgresql':
+        return column == any_(bindparam('user_ids', value=ids, type_=ARRAY(Integer)))
+    return column.in_(bindparam('user_ids', value=ids, expanding=True))
+
+def deletion_plan():
+    """Plan de borrado del engine actual (se refleja la primera vez y queda en caché)."""
+    key = str(db.engine.url)
+    plan = _plans.get(key)
+    if plan is None:
+        with _plans_lock:
+            plan = _plans.get(key)
+            if plan is None:
+                metadata = MetaData()
+                metadata.reflect(bind=db.engine)
+                plan = _plans[key] = DeletionPlan(metadata)
+    return plan
+
+
+def delete_users(user_ids):
+    """
+    Borra los usuarios y todo lo que depende de ellos. Devuelve {tabla: filas afectadas}.
+    Los objetos User ya cargados en la sesión quedan obsoletos. El llamador hace commit.
+    """
+    ids = sorted({int(user_id) for user_id in user_ids})
+    if not ids:
+        return {}
+
+    db.session.flush()
+    plan = deletion_plan()
+
+    stored_names = []
+    for name in plan.order:
+        columns = STORED_FILE_COLUMNS.get(name)
+        if columns:
+            table = plan.tables[name]
+            rows = db.session.execute(
+                select(*(table.c[column] for column in columns)).where(plan.selector(name, ids))
+            )
+            stored_names.extend(value for row in rows for value in row if value)
+
+    # Lo que hacían los eventos before/after_delete de User
+    uncount_users(ids)
+    remove_users_from_index(db.session.connection(), ids)
+
+    affected = {}
+    for column, referred in plan.nullify:
+        result = db.session.execute(
+            update(column.table).where(plan.references(column, referred, ids)).values({column.name: None})
+        )
+        key = f"{column.table.name}.{column.name}"
+        affected[key] = affected.get(key, 0) + result.rowcount
+
+    for name in reversed(plan.order):
+        result = db.session.execute(delete(plan.tables[name]).where(plan.selector(name, ids)))
+        affected[name] = result.rowcount
+
+    release_files(stored_names)
+    current_app.logger.info(f"Usuarios eliminados: {len(ids)} ({affected})")
+    return affected
@@ -0,0 +1,212 @@
+from sqlalchemy import event, func, inspect, text
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import User, UserCounter
+
+
+# Listado administrativo de usuarios (government_users) sin cargar la tabla entera.
+# - Paginación por cursor sobre el id (?after=<id>) y filtros resueltos en SQL.
+# - Totales desde user_counter: un contador por grupo que se actualiza en la misma
+#   transacción que inserta, modifica o borra usuarios (eventos de mapper más abajo).
+#   Con un solo filtro el total es exacto y cuesta una lectura por clave primaria; con
+#   varios filtros o texto libre se cuenta hasta COUNT_CAP filas como máximo.
+
+PAGE_SIZE = 50
+COUNT_CAP = 1000
+
+ROLE_CHOICES = [('citizen', 'Ciudadanos'), ('official', 'Funcionarios')]
+DISCORD_CHOICES = [('linked', 'Vinculado'), ('unlinked', 'No vinculado')]
+STATUS_CHOICES = ['Pendiente', 'Aprobado', 'Suspendido']
+
+_COUNTED_COLUMNS = ('badge_id', 'department', 'official_status', 'discord_id')
+
+
+# --- CONTADORES ---
+
+def counter_keys(badge_id, department, official_status, discord_id):
+    keys = ['total', 'role:official' if badge_id else 'role:citizen']
+    if department:
+        keys.append(f'dept:{department}')
+    if official_status:
+        keys.append(f'status:{official_status}')
+    keys.append('discord:linked' if discord_id else 'discord:unlinked')
+    return keys
+
+def _apply(connection, deltas):
+    rows = [{'name': name, 'delta': delta} for name, delta in deltas.items() if delta]
+    if rows:
+        connection.execute(text(
+            "INSERT INTO user_counter (name, value) VALUES (:name, :delta) "
+            "ON CONFLICT (name) DO UPDATE SET value = user_counter.value + excluded.value"
+        ), rows)
+
+def _previous_value(state, name):
+    history = state.attrs[name].history
+    if history.deleted:
+        return history.deleted[0]
+    return history.unchanged[0] if history.unchanged else None
+
+def _load_previous_value(target, value, oldvalue, initiator):
+    pass
+
+# active_history: al asignar una columna contada se carga antes su valor anterior aunque el
+# objeto estuviera expirado (p.ej. tras un commit), para saber de qué grupo sale el usuario
+for _name in _COUNTED_COLUMNS:
+    event.listen(getattr(User, _name), 'set', _load_previous_value, active_history=True)
+
+@event.listens_for(User, 'after_insert')
+def _count_new_user(mapper, connection, target):
+    _apply(connection, {key: 1 for key in counter_keys(
+        target.badge_id, target.department, target.official_status, target.discord_id
+    )})
+
+@event.listens_for(User, 'after_update')
+def _recount_user(mapper, connection, target):
+    state = inspect(target)
+    if not any(state.attrs[name].history.has_changes() for name in _COUNTED_COLUMNS):
+        return
+    deltas = {}
+    for key in counter_keys(*(_previous_value(state, name) for name in _COUNTED_COLUMNS)):
+        deltas[key] = deltas.get(key, 0) - 1
+    for key in counter_keys(target.badge_id, target.department, target.official_status, target.discord_id):
+        deltas[key] = deltas.get(key, 0) + 1
+    _apply(connection, deltas)
+
+@event.listens_for(User, 'before_delete')
+def _uncount_user(mapper, connection, target):
+    # before_delete: la fila aún existe y los atributos expirados se pueden cargar
+    for name in _COUNTED_COLUMNS:
+        getattr(target, name)
+    state = inspect(target)
+    _apply(connection, {key: -1 for key in counter_keys(
+        *(_previous_value(state, name) for name in _COUNTED_COLUMNS)
+    )})
+
+def adjust_counters(deltas):
+    """Suma `deltas` ({contador: n}) para cambios en bloque que no pasan por los eventos del mapper."""
+    _apply(db.session.connection(), deltas)
+
+def uncount_users(user_ids):
+    """
+    Resta de los contadores a los usuarios indicados (un GROUP BY), para borrados en bloque
+    que no pasan por los eventos del mapper. Debe llamarse antes de borrar las filas.
+    """
+    rows = db.session.query(
+        User.badge_id != None, User.department, User.official_status, User.discord_id != None, func.count()
+    ).filter(User.id.in_(user_ids)).group_by(
+        User.badge_id != None, User.department, User.official_status, User.discord_id != None
+    ).all()
+
+    deltas = {}
+    for is_official, department, status, linked, count in rows:
+        for key in counter_keys(is_official, department, status, linked):
+            deltas[key] = deltas.get(key, 0) - count
+    _apply(db.session.connection(), deltas)
+    return deltas
+
+def recount_users():
+    """Recalcula todos los contadores desde la tabla user (un GROUP BY). El llamador hace commit."""
+    rows = db.session.query(
+        User.badge_id != None, User.department, User.official_status, User.discord_id != None, func.count()
+    ).group_by(User.badge_id != None, User.department, User.official_status, User.discord_id != None).all()
+
+    totals = {}
+    for is_official, department, status, linked, count in rows:
+        for key in counter_keys(is_official, department, status, linked):
+            totals[key] = totals.get(key, 0) + count
+    totals.setdefault('total', 0)
+
+    UserCounter.query.delete(synchronize_session=False)
+    db.session.add_all(UserCounter(name=name, value=value) for name, value in totals.items())
+    return totals
+
+def ensure_user_counters():
+    """Inicializa los contadores si faltan (primer arranque o base de datos anterior)."""
+    if db.session.get(UserCounter, 'total') is not None:
+        return False
+    try:
+        recount_users()
+        db.session.commit()
+    except IntegrityError:
+        # Otro worker los ha inicializado a la vez
+        db.session.rollback()
+        return False
+    return True
+
+def user_counts():
+    return dict(db.session.query(UserCounter.name, UserCounter.value).all())
+
+def department_choices():
+    return sorted(
+        name.split(':', 1)[1] for name, value in
+        db.session.query(UserCounter.name, UserCounter.value).filter(UserCounter.name.like('dept:%'))
+        if value > 0
+    )
+
+
+# --- LISTADO ---
+
+def parse_filters(args):
+    filters = {
+        'role': args.get('role', '') if args.get('role') in dict(ROLE_CHOICES) else '',
+        'dept': (args.get('dept') or '').strip(),
+        'status': args.get('status', '') if args.get('status') in STATUS_CHOICES else '',
+        'discord': args.get('discord', '') if args.get('discord') in dict(DISCORD_CHOICES) else '',
+        'q': (args.get('q') or '').strip(),
+    }
+    return {name: value for name, value in filters.items() if value}
+
+def _like_escape(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def _filtered(query, filters):
+    if filters.get('role') == 'citizen':
+        query = query.filter(User.badge_id == None)
+    elif filters.get('role') == 'official':
+        query = query.filter(User.badge_id != None)
+    if filters.get('dept'):
+        query = query.filter(User.department == filters['dept'])
+    if filters.get('status'):
+        query = query.filter(User.official_status == filters['status'])
+    if filters.get('discord') == 'linked':
+        query = query.filter(User.discord_id != None)
+    elif filters.get('discord') == 'unlinked':
+        query = query.filter(User.discord_id == None)
+    if filters.get('q'):
+        pattern = f"%{_like_escape(filters['q'])}%"
+        query = query.filter(
+            User.first_name.ilike(pattern, escape='\\') |
+            User.last_name.ilike(pattern, escape='\\') |
+            User.dni.ilike(pattern, escape='\\') |
+            User.discord_id.ilike(pattern, escape='\\')
+        )
+    return query
+
+def list_users(filters, after=None, limit=PAGE_SIZE):
+    """Página de usuarios ordenada por id. Devuelve (usuarios, cursor siguiente o None)."""
+    query = _filtered(User.query, filters)
+    if after:
+        query = query.filter(User.id > after)
+    users = query.order_by(User.id).limit(limit + 1).all()
+    if len(users) > limit:
+        users = users[:limit]
+        return users, users[-1].id
+    return users, None
+
+def _counter_key(filters):
+    if not filters:
+        return 'total'
+    if len(filters) > 1 or 'q' in filters:
+        return None
+    name, value = next(iter(filters.items()))
+    return f'{name}:{value}'
+
+def count_users(filters):
+    """Total del filtro: (número, exacto). Sin contador aplicable se cuenta hasta COUNT_CAP."""
+    key = _counter_key(filters)
+    if key:
+        return max(db.session.query(UserCounter.value).filter_by(name=key).scalar() or 0, 0), True
+    capped = _filtered(db.session.query(User.id), filters).limit(COUNT_CAP + 1).subquery()
+    count = db.session.query(func.count()).select_from(capped).scalar()
+    return min(count, COUNT_CAP), count <= COUNT_CAP
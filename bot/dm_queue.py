@@ -0,0 +1,110 @@
+import json
+import sqlite3
+import time
+
+
+class DMQueue:
+    """
+    Cola persistente (SQLite local) de DMs que no se pudieron entregar a la primera.
+
+    - Los mensajes de un mismo usuario se entregan en orden: sólo se intenta la cabeza
+      de cada usuario y, mientras tenga algo pendiente, los mensajes nuevos van detrás.
+    - Cada fallo reprograma la cabeza con backoff exponencial (o el retry_after de Discord).
+    - Tras `max_attempts` el mensaje se descarta y se contabiliza.
+    """
+
+    def __init__(self, path, max_attempts=8, base_delay=5, max_delay=900):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS dm_queue (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                discord_id INTEGER NOT NULL,
+                embed TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                created_at REAL NOT NULL,
+                last_error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS ix_dm_queue_user ON dm_queue (discord_id, id);
+            CREATE INDEX IF NOT EXISTS ix_dm_queue_due ON dm_queue (next_attempt_at);
+            CREATE TABLE IF NOT EXISTS dm_queue_stats (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL DEFAULT 0
+            );
+        ''')
+
+    def _backoff(self, attempts):
+        return min(self.max_delay, self.base_delay * (2 ** max(attempts - 1, 0)))
+
+    def _incr(self, key, amount=1):
+        self.conn.execute(
+            'INSERT INTO dm_queue_stats (key, value) VALUES (?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET value = value + excluded.value',
+            (key, amount)
+        )
+
+    # --- Encolado ---
+
+    def push(self, discord_id, embed_dict, attempts=0, delay=0, error=None):
+        now = time.time()
+        self.conn.execute(
+            'INSERT INTO dm_queue (discord_id, embed, attempts, next_attempt_at, created_at, last_error) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (int(discord_id), json.dumps(embed_dict), attempts, now + delay, now, error)
+        )
+        self._incr('queued')
+
+    def has_pending(self, discord_id):
+        row = self.conn.execute('SELECT 1 FROM dm_queue WHERE discord_id = ? LIMIT 1', (int(discord_id),)).fetchone()
+        return row is not None
+
+    # --- Drenado ---
+
+    def due_heads(self, limit=50):
+        """Primer mensaje pendiente de cada usuario, si ya toca reintentarlo."""
+        rows = self.conn.execute(
+            'SELECT q.id, q.discord_id, q.embed, q.attempts FROM dm_queue q '
+            'JOIN (SELECT discord_id, MIN(id) AS id FROM dm_queue GROUP BY discord_id) h ON h.id = q.id '
+            'WHERE q.next_attempt_at <= ? ORDER BY q.next_attempt_at LIMIT ?',
+            (time.time(), limit)
+        ).fetchall()
+        return [dict(row, embed=json.loads(row['embed'])) for row in rows]
+
+    def ack(self, item_id):
+        self.conn.execute('DELETE FROM dm_queue WHERE id = ?', (item_id,))
+        self._incr('delivered')
+
+    def drop(self, item_id, reason):
+        self.conn.execute('DELETE FROM dm_queue WHERE id = ?', (item_id,))
+        self._incr(f'dropped_{reason}')
+
+    def retry(self, item, error=None, retry_after=None):
+        attempts = item['attempts'] + 1
+        if attempts >= self.max_attempts:
+            self.drop(item['id'], 'exhausted')
+            return False
+        delay = max(retry_after or 0, self._backoff(attempts))
+        self.conn.execute(
+            'UPDATE dm_queue SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?',
+            (attempts, time.time() + delay, (error or '')[:255], item['id'])
+        )
+        return True
+
+    def record_drop(self, reason):
+        """Contabiliza un DM rechazado sin llegar a encolarlo (p.ej. usuario inexistente)."""
+        self._incr(f'dropped_{reason}')
+
+    # --- Métricas ---
+
+    def depth(self):
+        return self.conn.execute('SELECT COUNT(*) FROM dm_queue').fetchone()[0]
+
+    def stats(self):
+        counters = {row['key']: row['value'] for row in self.conn.execute('SELECT key, value FROM dm_queue_stats')}
+        dropped = sum(v for k, v in counters.items() if k.startswith('dropped_'))
+        return dict(counters, depth=self.depth(), dropped=dropped)
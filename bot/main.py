@@ -1,9 +1,14 @@
 import discord
 from discord.ext import commands
 import os
+import re
+import asyncio
+import time
+from collections import OrderedDict
 import aiohttp
 from aiohttp import web
 from dotenv import load_dotenv
+from dm_queue import DMQueue
 
 # Cargar variables
 load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env'))
@@ -24,6 +29,20 @@ TOKEN = os.getenv("DISCORD_TOKEN")
 WEB_APP_URL = os.getenv("WEB_APP_URL", "http://127.0.0.1:5000")
 BOT_PORT = int(os.getenv("BOT_PORT", 8080))
 
+# Envío masivo de DMs (/notify_batch)
+NOTIFY_CONCURRENCY = int(os.getenv("NOTIFY_CONCURRENCY", 5))
+NOTIFY_MAX_RETRIES = int(os.getenv("NOTIFY_MAX_RETRIES", 3))
+NOTIFY_BATCH_MAX = int(os.getenv("NOTIFY_BATCH_MAX", 500))
+
+# Cola persistente de DMs fallidos / diferidos
+DM_QUEUE_PATH = os.getenv("DM_QUEUE_PATH") or os.path.join(os.path.dirname(__file__), 'dm_queue.db')
+DM_QUEUE_MAX_ATTEMPTS = int(os.getenv("DM_QUEUE_MAX_ATTEMPTS", 8))
+DM_QUEUE_INTERVAL = float(os.getenv("DM_QUEUE_INTERVAL", 5))
+
+# Caché de usuarios / canales DM
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 5000))
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", 3600))
+
 intents = discord.Intents.default()
 intents.members = True 
 intents.message_content = True
@@ -41,14 +60,182 @@ class MyBot(commands.Bot):
 
 bot = MyBot()
 
+class DiscordUserCache:
+    """
+    LRU acotada discord_id -> (User, DMChannel) con caducidad por TTL.
+    Antes de ir a la API REST (fetch_user) prueba la caché interna del cliente (get_user).
+    """
+
+    def __init__(self, maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.client_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _lookup(self, discord_id):
+        entry = self._entries.get(discord_id)
+        if entry is None:
+            return None
+        if entry['expires_at'] < time.monotonic():
+            del self._entries[discord_id]
+            self.evictions += 1
+            return None
+        self._entries.move_to_end(discord_id)
+        return entry
+
+    def _store(self, discord_id, user, channel=None):
+        self._entries[discord_id] = {
+            'user': user,
+            'channel': channel,
+            'expires_at': time.monotonic() + self.ttl
+        }
+        self._entries.move_to_end(discord_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return self._entries[discord_id]
+
+    async def get_user(self, discord_id):
+        discord_id = int(discord_id)
+        entry = self._lookup(discord_id)
+        if entry:
+            self.hits += 1
+            return entry['user']
+
+        user = bot.get_user(discord_id)
+        if user:
+            self.client_hits += 1
+        else:
+            self.misses += 1
+            user = await bot.fetch_user(discord_id)
+        self._store(discord_id, user)
+        return user
+
+    async def get_dm_channel(self, discord_id):
+        discord_id = int(discord_id)
+        user = await self.get_user(discord_id)
+        entry = self._entries[discord_id]
+        if entry['channel'] is None:
+            entry['channel'] = user.dm_channel or await user.create_dm()
+        return entry['channel']
+
+    def invalidate(self, discord_id):
+        self._entries.pop(int(discord_id), None)
+
+    def stats(self):
+        lookups = self.hits + self.client_hits + self.misses
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'client_hits': self.client_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': (self.hits + self.client_hits) / lookups if lookups else 0.0
+        }
+
+user_cache = DiscordUserCache()
+
+async def send_dm(discord_id, embed):
+    """Envía un embed por DM usando la caché; si Discord rechaza el canal se descarta la entrada."""
+    channel = await user_cache.get_dm_channel(discord_id)
+    try:
+        await channel.send(embed=embed)
+    except (discord.NotFound, discord.Forbidden):
+        user_cache.invalidate(discord_id)
+        raise
+
+dm_queue = DMQueue(DM_QUEUE_PATH, max_attempts=DM_QUEUE_MAX_ATTEMPTS)
+_queue_task = None
+
 @bot.event
 async def on_ready():
+    global _queue_task
     print(f'🤖 Bot conectado como {bot.user}')
     # Iniciar servidor web interno para recibir órdenes de la web
     bot.loop.create_task(start_web_server())
+    # on_ready se repite en cada reconexión: el drenado de la cola sólo se arranca una vez
+    if _queue_task is None:
+        _queue_task = bot.loop.create_task(drain_dm_queue())
 
 # --- ENDPOINT: PROCESAR VINCULACIÓN ---
-# La web llamará a esto cuando el usuario complete el Login con Discord
+# La web llamará a esto cuando el usuario complete el Login con Discord.
+# Responde 202 de inmediato; la configuración corre en segundo plano y el resultado
+# se comunica al usuario por DM.
+
+# Referencias a las tareas en curso para que el GC no las cancele
+_setup_tasks = set()
+
+async def configure_guild(g_id, r_id, discord_id, first_name, last_name):
+    if not g_id: return "No configurado"
+    guild = bot.get_guild(g_id)
+    if not guild: return "Bot no está en el servidor"
+
+    member = guild.get_member(discord_id)
+    if not member:
+        try:
+            member = await guild.fetch_member(discord_id)
+        except discord.NotFound:
+            return "Usuario no encontrado en servidor"
+        except Exception as e:
+            return f"Error fetch: {e}"
+
+    # Nickname
+    new_nick = f"{first_name} {last_name}"
+    if member.nick != new_nick:
+        try:
+            await member.edit(nick=new_nick)
+        except discord.Forbidden:
+            print(f"⚠️ Sin permisos nick en {guild.name}")
+
+    # Role
+    if r_id:
+        role = guild.get_role(r_id)
+        if role and role not in member.roles:
+            try:
+                await member.add_roles(role)
+            except discord.Forbidden:
+                print(f"⚠️ Sin permisos rol en {guild.name}")
+
+    return "OK"
+
+async def run_account_setup(discord_id, first_name, last_name, guild_keys):
+    try:
+        # Gobierno (Always)
+        targets = [("Gobierno", GOBIERNO_GUILD_ID, ROLE_ID)]
+        if 'judicial' in guild_keys:
+            targets.append(("Judicial", JUDICIAL_GUILD_ID, JUDICIAL_ROLE_ID))
+        if 'congreso' in guild_keys:
+            targets.append(("Congreso", CONGRESO_GUILD_ID, CONGRESO_ROLE_ID))
+
+        # Cada servidor se configura en paralelo
+        outcomes = await asyncio.gather(
+            *(configure_guild(g_id, r_id, discord_id, first_name, last_name) for _, g_id, r_id in targets),
+            return_exceptions=True
+        )
+        results = [
+            f"{name}: {res if not isinstance(res, Exception) else f'Error: {res}'}"
+            for (name, _, _), res in zip(targets, outcomes)
+        ]
+        print(f"✅ Configuración de {discord_id} terminada: {results}")
+
+        # Notify User
+        try:
+            embed = discord.Embed(
+                title="✅ Configuración Completada",
+                description=f"Hola **{first_name}**, hemos configurado tu perfil en los servidores solicitados.\n\nResultados:\n" + "\n".join(results),
+                color=0x00ff00
+            )
+            await send_dm(discord_id, embed)
+        except Exception as e:
+            print(f"⚠️ No se pudo enviar DM de configuración a {discord_id}: {e}")
+
+    except Exception as e:
+        print(f"❌ Error en setup_account ({discord_id}): {e}")
+
 async def handle_setup_account(request):
     try:
         data = await request.json()
@@ -56,93 +243,189 @@ async def handle_setup_account(request):
         first_name = data.get('first_name')
         last_name = data.get('last_name')
         guild_keys = data.get('guilds', [])
+    except Exception as e:
+        print(f"❌ Error en setup_account: {e}")
+        return web.Response(status=400, text=str(e))
 
-        print(f"⚙️ Solicitud de configuración para ID: {discord_id} en {guild_keys}")
-        
-        results = []
-
-        async def configure_guild(g_id, r_id):
-            if not g_id: return "No configurado"
-            guild = bot.get_guild(g_id)
-            if not guild: return "Bot no está en el servidor"
-
-            member = guild.get_member(discord_id)
-            if not member:
-                try:
-                    member = await guild.fetch_member(discord_id)
-                except discord.NotFound:
-                    return "Usuario no encontrado en servidor"
-                except Exception as e:
-                    return f"Error fetch: {e}"
-
-            # Nickname
-            new_nick = f"{first_name} {last_name}"
-            if member.nick != new_nick:
-                try:
-                    await member.edit(nick=new_nick)
-                except discord.Forbidden:
-                    print(f"⚠️ Sin permisos nick en {guild.name}")
-
-            # Role
-            if r_id:
-                role = guild.get_role(r_id)
-                if role and role not in member.roles:
-                    try:
-                        await member.add_roles(role)
-                    except discord.Forbidden:
-                        print(f"⚠️ Sin permisos rol en {guild.name}")
-
-            return "OK"
+    print(f"⚙️ Solicitud de configuración para ID: {discord_id} en {guild_keys}")
 
-        # Gobierno (Always)
-        res = await configure_guild(GOBIERNO_GUILD_ID, ROLE_ID)
-        results.append(f"Gobierno: {res}")
+    task = asyncio.create_task(run_account_setup(discord_id, first_name, last_name, guild_keys))
+    _setup_tasks.add(task)
+    task.add_done_callback(_setup_tasks.discard)
 
-        if 'judicial' in guild_keys:
-            res = await configure_guild(JUDICIAL_GUILD_ID, JUDICIAL_ROLE_ID)
-            results.append(f"Judicial: {res}")
+    return web.Response(status=202, text="Setup accepted")
 
-        if 'congreso' in guild_keys:
-            res = await configure_guild(CONGRESO_GUILD_ID, CONGRESO_ROLE_ID)
-            results.append(f"Congreso: {res}")
+# --- ENTREGA CON COLA DE REINTENTOS ---
+def _retry_after(error):
+    """Segundos a esperar según la respuesta 429 de Discord (o None si no es un rate limit)."""
+    if isinstance(error, discord.RateLimited):
+        return error.retry_after
+    if isinstance(error, discord.HTTPException) and error.status == 429:
+        try:
+            return float(error.response.headers.get('Retry-After', 1))
+        except (AttributeError, TypeError, ValueError):
+            return 1.0
+    return None
 
-        # Notify User
+async def deliver_dm(discord_id, embed, max_retries=0):
+    """
+    Intenta entregar el DM. Si falla por algo transitorio (429, error HTTP, red) lo deja
+    en la cola persistente y devuelve 'queued'. Si el usuario ya tiene mensajes en cola,
+    el nuevo va detrás para respetar el orden.
+    Devuelve: sent, queued, not_found o forbidden.
+    """
+    discord_id = int(discord_id)
+    if dm_queue.has_pending(discord_id):
+        dm_queue.push(discord_id, embed.to_dict())
+        return 'queued'
+
+    for attempt in range(max_retries + 1):
         try:
-             user = await bot.fetch_user(discord_id)
-             if user:
-                embed = discord.Embed(
-                    title="✅ Configuración Completada",
-                    description=f"Hola **{first_name}**, hemos configurado tu perfil en los servidores solicitados.\n\nResultados:\n" + "\n".join(results),
-                    color=0x00ff00
-                )
-                await user.send(embed=embed)
-        except:
-            pass
-
-        return web.Response(text="Setup complete")
+            await send_dm(discord_id, embed)
+            return 'sent'
+        except discord.NotFound:
+            dm_queue.record_drop('not_found')
+            return 'not_found'
+        except discord.Forbidden:
+            # DMs cerrados o el usuario no comparte servidor con el bot
+            dm_queue.record_drop('forbidden')
+            return 'forbidden'
+        except Exception as e:
+            wait = _retry_after(e)
+            if wait is not None and attempt < max_retries:
+                print(f"⏳ Rate limit enviando DM a {discord_id}, reintentando en {wait:.2f}s")
+                await asyncio.sleep(wait)
+                continue
+            print(f"⏳ DM a {discord_id} diferido a la cola: {e}")
+            dm_queue.push(discord_id, embed.to_dict(), attempts=1,
+                          delay=max(wait or 0, dm_queue.base_delay), error=str(e)[:255])
+            return 'queued'
 
-    except Exception as e:
-        print(f"❌ Error en setup_account: {e}")
-        return web.Response(status=500, text=str(e))
+async def _retry_queued(item, semaphore):
+    async with semaphore:
+        embed = discord.Embed.from_dict(item['embed'])
+        try:
+            await send_dm(item['discord_id'], embed)
+            dm_queue.ack(item['id'])
+        except (discord.NotFound, discord.Forbidden):
+            dm_queue.drop(item['id'], 'permanent')
+        except Exception as e:
+            dm_queue.retry(item, error=str(e), retry_after=_retry_after(e))
+
+async def drain_dm_queue():
+    """Tarea de fondo: reintenta la cabeza de cada usuario con backoff exponencial."""
+    print(f"📥 Cola de DMs activa ({dm_queue.depth()} pendientes)")
+    semaphore = asyncio.Semaphore(NOTIFY_CONCURRENCY)
+    while not bot.is_closed():
+        try:
+            heads = dm_queue.due_heads(limit=50)
+            if heads:
+                await asyncio.gather(*(_retry_queued(item, semaphore) for item in heads))
+        except Exception as e:
+            print(f"❌ Error drenando cola de DMs: {e}")
+        await asyncio.sleep(DM_QUEUE_INTERVAL)
 
 # --- ENDPOINT: NOTIFICACIONES GENÉRICAS ---
+DELIVERY_HTTP_STATUS = {'sent': 200, 'queued': 202, 'not_found': 404, 'forbidden': 403}
+
 async def handle_notification(request):
     try:
         data = await request.json()
-        user = await bot.fetch_user(int(data.get('discord_id')))
-        if user:
-            embed = discord.Embed(description=data.get('message'), color=0x5865F2)
-            embed.set_footer(text="Gobierno de San Andreas")
-            await user.send(embed=embed)
-            return web.Response(text="OK")
-    except:
-        pass
-    return web.Response(status=200)
+        discord_id = int(data.get('discord_id'))
+    except Exception as e:
+        return web.json_response({'status': 'invalid', 'error': str(e)}, status=400)
+
+    embed = discord.Embed(description=data.get('message'), color=0x5865F2)
+    embed.set_footer(text="Gobierno de San Andreas")
+    status = await deliver_dm(discord_id, embed)
+
+    queue = dm_queue.stats()
+    return web.json_response(
+        {'status': status, 'queue_depth': queue['depth'], 'dropped': queue['dropped']},
+        status=DELIVERY_HTTP_STATUS[status]
+    )
+
+# --- ENDPOINT: NOTIFICACIONES EN LOTE ---
+_PLACEHOLDER_RE = re.compile(r'\{(\w+)\}')
+
+def _render_message(template, context):
+    """
+    Sustituye los {campo} de `context` en la plantilla. Sin contexto el mensaje se envía tal
+    cual: puede citar texto de usuario con llaves. Las llaves que no son un campo del
+    contexto se dejan como están.
+    """
+    if not context or not isinstance(context, dict):
+        return template
+    return _PLACEHOLDER_RE.sub(
+        lambda m: str(context[m.group(1)]) if m.group(1) in context else m.group(0), template
+    )
+
+async def _send_dm(discord_id, message, semaphore):
+    async with semaphore:
+        try:
+            discord_id = int(discord_id)
+        except (ValueError, TypeError):
+            return {'discord_id': str(discord_id), 'status': 'invalid'}
+
+        embed = discord.Embed(description=message, color=0x5865F2)
+        embed.set_footer(text="Gobierno de San Andreas")
+        status = await deliver_dm(discord_id, embed, max_retries=NOTIFY_MAX_RETRIES)
+        return {'discord_id': str(discord_id), 'status': status}
+
+async def handle_notification_batch(request):
+    """
+    Body: {"message": "Hola {first_name}...", "recipients": [{"discord_id": "...", "context": {...}}, ...]}
+    También acepta recipients como lista simple de discord_ids.
+    Devuelve el estado de cada destinatario.
+    """
+    try:
+        data = await request.json()
+    except Exception:
+        return web.json_response({'error': 'JSON inválido'}, status=400)
+
+    template = data.get('message')
+    recipients = data.get('recipients') or []
+    if not template or not isinstance(recipients, list):
+        return web.json_response({'error': 'Faltan message o recipients'}, status=400)
+    if len(recipients) > NOTIFY_BATCH_MAX:
+        return web.json_response({'error': f'Máximo {NOTIFY_BATCH_MAX} destinatarios por lote'}, status=413)
+
+    semaphore = asyncio.Semaphore(NOTIFY_CONCURRENCY)
+    tasks = []
+    for rcpt in recipients:
+        if isinstance(rcpt, dict):
+            discord_id = rcpt.get('discord_id')
+            message = _render_message(template, rcpt.get('context'))
+        else:
+            discord_id = rcpt
+            message = template
+        tasks.append(_send_dm(discord_id, message, semaphore))
+
+    results = await asyncio.gather(*tasks)
+    sent = sum(1 for r in results if r['status'] == 'sent')
+    queued = sum(1 for r in results if r['status'] == 'queued')
+    print(f"📬 Lote de notificaciones: {sent}/{len(results)} enviadas, {queued} en cola.")
+
+    queue = dm_queue.stats()
+    return web.json_response({
+        'sent': sent,
+        'queued': queued,
+        'failed': len(results) - sent - queued,
+        'queue_depth': queue['depth'],
+        'dropped': queue['dropped'],
+        'results': results
+    })
+
+# --- ENDPOINT: MÉTRICAS ---
+async def handle_stats(request):
+    return web.json_response({'user_cache': user_cache.stats(), 'dm_queue': dm_queue.stats()})
 
 async def start_web_server():
     app = web.Application()
     app.router.add_post('/setup_account', handle_setup_account) # Nueva ruta para vinculación multi-server
     app.router.add_post('/notify', handle_notification)
+    app.router.add_post('/notify_batch', handle_notification_batch)
+    app.router.add_get('/stats', handle_stats)
     runner = web.AppRunner(app)
     await runner.setup()
     site = web.TCPSite(runner, '0.0.0.0', BOT_PORT)
@@ -19,10 +19,13 @@ class Config:
     
     SQLALCHEMY_DATABASE_URI = uri or 'sqlite:///' + os.path.join(basedir, 'hermes_local.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Aplicar migraciones al importar run.py en lugar de con `python release.py` (sólo desarrollo local)
+    AUTO_MIGRATE = int(os.environ.get('AUTO_MIGRATE') or 0)
     
     # Configuración del Bot (URL interna para comunicación)
     # En local suele ser http://127.0.0.1:8080
     BOT_URL = os.environ.get('BOT_URL') or 'http://127.0.0.1:8080'
+    WEB_APP_URL = os.environ.get('WEB_APP_URL') or 'http://127.0.0.1:5000'
 
     # Discord Guilds & Roles
     DISCORD_BOT_TOKEN = os.environ.get('DISCORD_TOKEN')
@@ -33,3 +36,48 @@ class Config:
 
     JUDICIAL_ROLE_ID = os.environ.get('JUDICIAL_ROLE_ID') or '1473865577993994260'
     CONGRESO_ROLE_ID = os.environ.get('CONGRESO_ROLE_ID') or '1473835075375337740'
+
+    # Outbox de notificaciones (procesada por dispatcher.py)
+    OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE') or 100)
+    OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS') or 6)
+    OUTBOX_POLL_INTERVAL = float(os.environ.get('OUTBOX_POLL_INTERVAL') or 2)
+    OUTBOX_RETRY_BASE_SECONDS = int(os.environ.get('OUTBOX_RETRY_BASE_SECONDS') or 5)
+    OUTBOX_RETRY_MAX_SECONDS = int(os.environ.get('OUTBOX_RETRY_MAX_SECONDS') or 600)
+    OUTBOX_HTTP_TIMEOUT = float(os.environ.get('OUTBOX_HTTP_TIMEOUT') or 30)
+    # Destinatarios por llamada a /notify_batch. El bot envía 5 DMs a la vez y espera los 429:
+    # con ~3 s por DM en el peor caso, 50 caben en OUTBOX_HTTP_TIMEOUT. Una llamada que se pasa
+    # del timeout se reintenta entera y duplica los DMs que ya se habían entregado.
+    OUTBOX_RECIPIENTS_PER_CALL = int(os.environ.get('OUTBOX_RECIPIENTS_PER_CALL') or 50)
+    # Agrupación de avisos de servicio: ventana por destinatario y periodo del modo resumen
+    NOTIFY_COALESCE_WINDOW_SECONDS = int(os.environ.get('NOTIFY_COALESCE_WINDOW_SECONDS') or 60)
+    NOTIFY_DIGEST_INTERVAL_SECONDS = int(os.environ.get('NOTIFY_DIGEST_INTERVAL_SECONDS') or 3600)
+
+    # Cliente HTTP saliente (app/http_client.py)
+    HTTP_POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE') or 10)
+    HTTP_BREAKER_THRESHOLD = int(os.environ.get('HTTP_BREAKER_THRESHOLD') or 5)
+    HTTP_BREAKER_RESET_SECONDS = int(os.environ.get('HTTP_BREAKER_RESET_SECONDS') or 30)
+    # Espera máxima por un 429 (Retry-After); si el servidor pide más, la llamada no se reintenta
+    HTTP_MAX_RETRY_AFTER_SECONDS = float(os.environ.get('HTTP_MAX_RETRY_AFTER_SECONDS') or 5)
+
+    # Búsqueda de SAFinder: 'auto' (tsvector en Postgres, FTS5 en SQLite) o 'memory' (app/bm25.py)
+    SAFINDER_SEARCH_BACKEND = os.environ.get('SAFINDER_SEARCH_BACKEND') or 'auto'
+    SAFINDER_INDEX_PATH = os.environ.get('SAFINDER_INDEX_PATH') # Por defecto instance/safinder_bm25.idx
+
+    # Ingesta de PDFs de SAFinder (procesada por ingest.py)
+    INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS') or 2)
+    INGEST_CHUNK_PAGES = int(os.environ.get('INGEST_CHUNK_PAGES') or 25)
+    INGEST_POLL_INTERVAL = float(os.environ.get('INGEST_POLL_INTERVAL') or 3)
+
+    # Barrido de licencias vencidas (proceso sweeper, app/license_expiry.py)
+    LICENSE_SWEEP_INTERVAL_SECONDS = int(os.environ.get('LICENSE_SWEEP_INTERVAL_SECONDS') or 3600)
+
+    # Caché del typeahead de ciudadanos (app/typeahead.py), por proceso
+    TYPEAHEAD_CACHE_SIZE = int(os.environ.get('TYPEAHEAD_CACHE_SIZE') or 2000)
+    TYPEAHEAD_CACHE_TTL = int(os.environ.get('TYPEAHEAD_CACHE_TTL') or 300)
+    TYPEAHEAD_FILL = int(os.environ.get('TYPEAHEAD_FILL') or 50)
+
+    # Instrumentación SQL por petición (app/sql_monitor.py): cabecera X-SQL-Queries fuera de
+    # debug y nº de repeticiones de una misma sentencia a partir del cual se avisa de un N+1
+    SQL_MONITOR = int(os.environ.get('SQL_MONITOR') or 1)
+    SQL_MONITOR_HEADER = int(os.environ.get('SQL_MONITOR_HEADER') or 0)
+    SQL_N_PLUS_ONE_THRESHOLD = int(os.environ.get('SQL_N_PLUS_ONE_THRESHOLD') or 5)
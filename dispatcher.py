@@ -0,0 +1,13 @@
+from app import create_app
+from app.notifications import run_dispatcher
+from dotenv import load_dotenv
+
+load_dotenv()
+
+app = create_app()
+
+# Proceso independiente que drena la outbox de notificaciones hacia el bot.
+# Se lanza como 'dispatcher' en el Procfile.
+if __name__ == '__main__':
+    with app.app_context():
+        run_dispatcher()
@@ -0,0 +1,167 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Compara los planes de las consultas frecuentes antes y después de la migración de índices
+# 3f9c2a7d41e6. Crea una base de datos de prueba (SQLite temporal por defecto), la rellena,
+# baja a la revisión anterior, muestra EXPLAIN y tiempos, aplica la migración y repite.
+#
+#   python explain_indexes.py                      # SQLite temporal con 20.000 usuarios
+#   python explain_indexes.py --users 100000
+#   python explain_indexes.py --url postgresql://...   # base de datos VACÍA y desechable
+
+parser = argparse.ArgumentParser(description="EXPLAIN de las consultas frecuentes antes y después de la migración de índices")
+parser.add_argument('--users', type=int, default=20000)
+parser.add_argument('--url', help='Base de datos desechable (se borran y recrean las tablas)')
+parser.add_argument('--runs', type=int, default=20, help='Repeticiones para medir cada consulta')
+args = parser.parse_args()
+
+tmp_path = None
+if args.url:
+    os.environ['DATABASE_URL'] = args.url
+else:
+    fd, tmp_path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    os.environ['DATABASE_URL'] = 'sqlite:///' + tmp_path
+
+from flask_migrate import stamp, upgrade, downgrade
+from sqlalchemy import select
+
+from app import create_app, db
+from app.models import User, TrafficFine, License, Business, Document, NotificationSubscription
+from app.notifications import subscribed_to
+
+BEFORE = 'b8fb3476761c'
+MIGRATIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+DEPARTMENTS = ['SABES', 'Gobierno', 'Ejecutivo', 'Legislativo', 'Judicial']
+
+
+def seed(n_users):
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    users = []
+    for i in range(1, n_users + 1):
+        official = i % 50 == 0
+        users.append({
+            'id': i, 'first_name': f'Nombre{i}', 'last_name': f'Apellido{i}', 'dni': f'DNI{i:07d}',
+            'badge_id': f'B{i}' if official else None,
+            'department': rng.choice(DEPARTMENTS) if official else None,
+            'official_status': rng.choice(['Pendiente', 'Aprobado', 'Aprobado', 'Aprobado']) if official else 'Pendiente',
+            'discord_id': str(10**17 + i) if rng.random() < 0.6 else None,
+            'receive_notifications': rng.random() < 0.8,
+            'on_duty': False, 'notification_digest': False, 'created_at': now,
+        })
+    db.session.execute(User.__table__.insert(), users)
+
+    db.session.execute(TrafficFine.__table__.insert(), [
+        {'reason': 'Exceso de velocidad', 'date': now, 'user_id': rng.randint(1, n_users),
+         'status': rng.choice(['Pendiente', 'Pagada', 'Pagada'])}
+        for _ in range(n_users * 3)
+    ])
+    db.session.execute(License.__table__.insert(), [
+        {'type': 'Licencia', 'user_id': rng.randint(1, n_users),
+         'status': rng.choice(['Activa'] * 8 + ['Vencida', 'Pendiente']),
+         'expiration_date': (now + timedelta(days=rng.randint(-60, 60))).date()}
+        for _ in range(n_users * 2)
+    ])
+    db.session.execute(Business.__table__.insert(), [
+        {'name': f'Negocio {i}', 'type': 'Bar', 'status': 'Aprobado', 'owner_id': rng.randint(1, n_users), 'created_at': now}
+        for i in range(n_users // 10)
+    ])
+    db.session.execute(Document.__table__.insert(), [
+        {'title': f'Documento {i}', 'filename': f'doc{i}.pdf', 'status': 'Listo',
+         'created_at': now - timedelta(minutes=i), 'uploader_id': rng.randint(1, n_users)}
+        for i in range(n_users // 10)
+    ])
+    db.session.execute(NotificationSubscription.__table__.insert(), [
+        {'user_id': u['id'], 'department': 'SABES', 'event_type': 'duty'}
+        for u in users if rng.random() < 0.3
+    ])
+    db.session.commit()
+
+
+def hot_queries():
+    """Las consultas tal y como las hacen las vistas (misma forma de SQL)."""
+    return [
+        ('my_fines: multas pendientes del ciudadano',
+         TrafficFine.query.filter_by(user_id=1234, status='Pendiente')),
+        ('my_fines: funcionarios de Gobierno aprobados',
+         User.query.filter_by(department='Gobierno', official_status='Aprobado')),
+        ('official_licenses_pending',
+         License.query.filter_by(status='Pendiente')),
+        ('official_dashboard: pendientes del departamento',
+         User.query.filter(User.department == 'SABES', User.official_status == 'Pendiente', User.badge_id != None)),
+        ('official_dashboard: pendientes (Gobierno)',
+         User.query.filter(User.official_status == 'Pendiente', User.badge_id != None)),
+        ('toggle_duty: destinatarios del aviso',
+         select(User.discord_id).where(
+             User.discord_id.isnot(None), User.receive_notifications == True, subscribed_to('SABES', 'duty')
+         ).distinct()),
+        ('safinder: últimos documentos',
+         Document.query.order_by(Document.created_at.desc(), Document.id.desc()).limit(21)),
+        ('official_businesses: búsqueda por nombre',
+         Business.query.filter(Business.name.ilike('%gocio 12%')).order_by(Business.id).limit(26)),
+    ]
+
+
+def _driver_sql(query):
+    stmt = getattr(query, 'statement', query)
+    compiled = stmt.compile(dialect=db.engine.dialect)
+    params = compiled.params
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+    return str(compiled), params
+
+
+def report(title):
+    explain = 'EXPLAIN QUERY PLAN ' if db.engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    print(f"\n===== {title} =====")
+    results = {}
+    with db.engine.connect() as conn:
+        for label, query in hot_queries():
+            sql, params = _driver_sql(query)
+            plan = conn.exec_driver_sql(explain + sql, params).all()
+            start = time.perf_counter()
+            for _ in range(args.runs):
+                conn.exec_driver_sql(sql, params).all()
+            elapsed = (time.perf_counter() - start) * 1000 / args.runs
+            results[label] = elapsed
+            print(f"\n-- {label}  ({elapsed:.2f} ms)")
+            for row in plan:
+                print(f"   {row[-1]}")
+    return results
+
+
+def analyze():
+    with db.engine.connect() as conn:
+        conn.exec_driver_sql('ANALYZE')
+        conn.commit()
+
+
+app = create_app()
+with app.app_context():
+    try:
+        db.drop_all()
+        db.create_all()
+        print(f"Sembrando {args.users} usuarios...")
+        seed(args.users)
+
+        stamp(directory=MIGRATIONS, revision='head')
+        downgrade(directory=MIGRATIONS, revision=BEFORE)
+        analyze()
+        before = report(f'ANTES (revisión {BEFORE})')
+
+        upgrade(directory=MIGRATIONS)
+        analyze()
+        after = report('DESPUÉS (head)')
+
+        print("\n===== RESUMEN (ms por consulta) =====")
+        for label in before:
+            print(f"{before[label]:9.2f} -> {after[label]:9.2f}  {label}")
+    finally:
+        db.session.remove()
+        if tmp_path:
+            os.remove(tmp_path)
@@ -0,0 +1,13 @@
+from app import create_app
+from app.ingest import run_ingest_worker
+from dotenv import load_dotenv
+
+load_dotenv()
+
+app = create_app()
+
+# Proceso independiente que extrae e indexa los PDFs subidos a SAFinder.
+# Se lanza como 'ingest' en el Procfile.
+if __name__ == '__main__':
+    with app.app_context():
+        run_ingest_worker()
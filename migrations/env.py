@@ -11,7 +11,9 @@ config = context.config
 
 # Interpret the config file for Python logging.
 # This line sets up loggers basically.
-fileConfig(config.config_file_name)
+# disable_existing_loggers=False: con AUTO_MIGRATE=1 las migraciones corren en el proceso web y
+# no deben silenciar los loggers ya creados (p.ej. el de app/sql_monitor.py)
+fileConfig(config.config_file_name, disable_existing_loggers=False)
 logger = logging.getLogger('alembic.env')
 
 
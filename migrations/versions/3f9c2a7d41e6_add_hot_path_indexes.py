@@ -0,0 +1,68 @@
+"""Add composite and partial indexes for the hot query paths
+
+Revision ID: 3f9c2a7d41e6
+Revises: b8fb3476761c
+Create Date: 2026-10-18 01:10:00.000000
+
+Índices para las consultas más frecuentes (ver explain_indexes.py para comparar planes):
+- traffic_fine (user_id, status): my_fines.
+- license (status, expiration_date): official_licenses_pending y el barrido de vencidas.
+- user (department, official_status): official_dashboard, my_fines, government_users;
+  sustituye a ix_user_department.
+- user (badge_id) parcial para las solicitudes de funcionario pendientes (official_dashboard).
+- document (created_at, id): listado de SAFinder paginado por cursor.
+- business (name) GIN con pg_trgm (sólo Postgres): búsqueda ILIKE '%...%' de
+  official_businesses. En SQLite un LIKE con comodín inicial no puede usar índices.
+
+Los destinatarios de avisos (enqueue_broadcast) no llevan índice propio: la consulta parte de
+ix_subscription_department_event_user y accede a user por clave primaria.
+
+Las tablas creadas con db.create_all() ya tienen estos índices; if_not_exists permite
+aplicar la migración igualmente.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9c2a7d41e6'
+down_revision = 'b8fb3476761c'
+branch_labels = None
+depends_on = None
+
+
+PENDING_OFFICIALS = "official_status = 'Pendiente' AND badge_id IS NOT NULL"
+
+
+def upgrade():
+    op.create_index('ix_traffic_fine_user_status', 'traffic_fine', ['user_id', 'status'], if_not_exists=True)
+    op.create_index('ix_license_status_expiration', 'license', ['status', 'expiration_date'], if_not_exists=True)
+
+    op.create_index('ix_user_department_status', 'user', ['department', 'official_status'], if_not_exists=True)
+    op.drop_index('ix_user_department', table_name='user', if_exists=True)
+    op.create_index(
+        'ix_user_pending_officials', 'user', ['badge_id'], if_not_exists=True,
+        sqlite_where=sa.text(PENDING_OFFICIALS),
+        postgresql_where=sa.text(PENDING_OFFICIALS)
+    )
+
+    op.create_index('ix_document_created_at', 'document', ['created_at', 'id'], if_not_exists=True)
+
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.create_index(
+            'ix_business_name_trgm', 'business', ['name'], if_not_exists=True,
+            postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}
+        )
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_business_name_trgm', table_name='business', if_exists=True)
+
+    op.drop_index('ix_document_created_at', table_name='document', if_exists=True)
+    op.drop_index('ix_user_pending_officials', table_name='user', if_exists=True)
+    op.create_index('ix_user_department', 'user', ['department'], if_not_exists=True)
+    op.drop_index('ix_user_department_status', table_name='user', if_exists=True)
+    op.drop_index('ix_license_status_expiration', table_name='license', if_exists=True)
+    op.drop_index('ix_traffic_fine_user_status', table_name='traffic_fine', if_exists=True)
@@ -0,0 +1,93 @@
+"""Fold the boot-time schema patches from run.py into a revision
+
+Revision ID: 5d2e8c9a1b70
+Revises: c4e7b2a9f610
+Create Date: 2026-10-18 02:30:00.000000
+
+Hasta ahora cada worker de Gunicorn comprobaba columnas con inspect() al importar run.py y
+añadía las que faltaban; en Postgres además ejecutaba siempre
+ALTER TABLE license ALTER COLUMN type TYPE VARCHAR(200) (bloqueo ACCESS EXCLUSIVE).
+Esta revisión recoge esos parches para aplicarlos una sola vez desde `python release.py`.
+
+Cada paso comprueba el esquema antes de tocarlo: las bases de datos que ya pasaron por el
+antiguo arranque de run.py no cambian. La bajada no deshace nada (las columnas forman parte
+del modelo desde antes de que existieran las migraciones).
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d2e8c9a1b70'
+down_revision = 'c4e7b2a9f610'
+branch_labels = None
+depends_on = None
+
+
+# Departamentos de app/notifications.py (NOTIFICATION_DEPARTMENTS) en el momento de la revisión
+NOTIFICATION_DEPARTMENTS = ['SABES', 'Gobierno', 'Ejecutivo', 'Legislativo', 'Judicial']
+
+
+def _add_missing_columns(inspector, table, columns):
+    existing = {col['name'] for col in inspector.get_columns(table)}
+    for name, definition in columns:
+        if name not in existing:
+            op.execute(f'ALTER TABLE "{table}" ADD COLUMN {name} {definition}')
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    postgres = bind.dialect.name == 'postgresql'
+    false, true = ('FALSE', 'TRUE') if postgres else ('0', '1')
+
+    _add_missing_columns(inspector, 'user', [
+        ('on_duty', f'BOOLEAN DEFAULT {false}'),
+        ('receive_notifications', f'BOOLEAN DEFAULT {true}'),
+        ('notification_digest', f'BOOLEAN DEFAULT {false}'),
+    ])
+    _add_missing_columns(inspector, 'notification_outbox', [
+        ('category', 'VARCHAR(30)'),
+        ('event', 'VARCHAR(30)'),
+        ('subject', 'VARCHAR(200)'),
+    ])
+    _add_missing_columns(inspector, 'appointment', [
+        ('created_at', 'TIMESTAMP DEFAULT NOW()' if postgres else 'DATETIME DEFAULT CURRENT_TIMESTAMP'),
+    ])
+    _add_missing_columns(inspector, 'business', [
+        ('status', "VARCHAR(20) DEFAULT 'Pendiente'"),
+    ])
+
+    # SQLite no limita la longitud de VARCHAR; en Postgres sólo se altera si sigue siendo corta
+    if postgres:
+        license_type = next(col for col in inspector.get_columns('license') if col['name'] == 'type')
+        length = getattr(license_type['type'], 'length', None)
+        if length is not None and length < 200:
+            op.alter_column('license', 'type', type_=sa.String(200), existing_type=license_type['type'])
+
+    document_columns = {col['name'] for col in inspector.get_columns('document')}
+    if 'snippet' not in document_columns:
+        op.execute('ALTER TABLE document ADD COLUMN snippet VARCHAR(400)')
+        op.execute('UPDATE document SET snippet = SUBSTR(text_content, 1, 300) WHERE snippet IS NULL')
+    # Columnas de ingesta en segundo plano (los documentos existentes ya están procesados)
+    _add_missing_columns(inspector, 'document', [
+        ('status', "VARCHAR(20) DEFAULT 'Listo'"),
+        ('pages_total', 'INTEGER'),
+        ('pages_done', 'INTEGER DEFAULT 0'),
+    ])
+
+    op.create_index('ix_document_filename', 'document', ['filename'], if_not_exists=True)
+    op.create_index('ix_business_fine_business_id', 'business_fine', ['business_id'], if_not_exists=True)
+    op.create_index('ix_license_business_id', 'license', ['business_id'], if_not_exists=True)
+
+    # Backfill de suscripciones: los usuarios que ya recibían avisos quedan suscritos a todos los departamentos
+    if bind.execute(sa.text('SELECT 1 FROM notification_subscription LIMIT 1')).first() is None:
+        for dept in NOTIFICATION_DEPARTMENTS:
+            bind.execute(sa.text(
+                "INSERT INTO notification_subscription (user_id, department, event_type, created_at) "
+                "SELECT id, :dept, 'duty', CURRENT_TIMESTAMP FROM \"user\" WHERE receive_notifications = :enabled"
+            ), {'dept': dept, 'enabled': True})
+
+
+def downgrade():
+    pass
@@ -0,0 +1,39 @@
+"""Add audit_entry for bulk administrative actions
+
+Revision ID: 8a4f1c6e2d93
+Revises: 5d2e8c9a1b70
+Create Date: 2026-10-18 03:20:00.000000
+
+Una fila por acción en bloque (aprobar/rechazar licencias, aceptar/denegar funcionarios)
+con la lista de ids afectados. Las bases de datos vacías se crean con db.create_all() antes
+de marcar la revisión base, así que la tabla puede existir ya: if_not_exists.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a4f1c6e2d93'
+down_revision = '5d2e8c9a1b70'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('audit_entry',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('actor_id', sa.Integer(), nullable=True),
+    sa.Column('action', sa.String(length=50), nullable=False),
+    sa.Column('target_ids', sa.Text(), nullable=False),
+    sa.Column('target_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['actor_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    if_not_exists=True
+    )
+    op.create_index('ix_audit_entry_created_at', 'audit_entry', ['created_at'], if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_audit_entry_created_at', table_name='audit_entry', if_exists=True)
+    op.drop_table('audit_entry', if_exists=True)
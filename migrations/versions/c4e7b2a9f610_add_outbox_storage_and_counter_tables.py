@@ -0,0 +1,94 @@
+"""Add the notification, file storage, cache and counter tables
+
+Revision ID: c4e7b2a9f610
+Revises: 3f9c2a7d41e6
+Create Date: 2026-10-18 02:10:00.000000
+
+Tablas nuevas de los modelos que no tenían migración propia:
+- notification_outbox y notification_subscription: avisos a Discord (app/notifications.py).
+- stored_file: archivos subidos guardados por hash (app/storage.py).
+- cache_version: invalidación de cachés locales entre procesos (app/typeahead.py).
+- user_counter: totales de usuarios por grupo (app/user_directory.py). release.py los
+  inicializa después de las migraciones.
+
+Las bases de datos vacías se crean con db.create_all() antes de marcar la revisión base,
+así que las tablas pueden existir ya: if_not_exists.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e7b2a9f610'
+down_revision = '3f9c2a7d41e6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('notification_outbox',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('discord_id', sa.String(length=50), nullable=False),
+    sa.Column('message', sa.Text(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('category', sa.String(length=30), nullable=True),
+    sa.Column('event', sa.String(length=30), nullable=True),
+    sa.Column('subject', sa.String(length=200), nullable=True),
+    sa.Column('attempts', sa.Integer(), nullable=True),
+    sa.Column('last_error', sa.String(length=255), nullable=True),
+    sa.Column('next_attempt_at', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('sent_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    if_not_exists=True
+    )
+    op.create_index('ix_notification_outbox_status_next_attempt', 'notification_outbox',
+                    ['status', 'next_attempt_at'], if_not_exists=True)
+
+    op.create_table('notification_subscription',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('department', sa.String(length=64), nullable=False),
+    sa.Column('event_type', sa.String(length=30), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'department', 'event_type', name='uq_subscription_user_department_event'),
+    if_not_exists=True
+    )
+    op.create_index('ix_subscription_department_event_user', 'notification_subscription',
+                    ['department', 'event_type', 'user_id'], if_not_exists=True)
+
+    op.create_table('stored_file',
+    sa.Column('sha256', sa.String(length=64), nullable=False),
+    sa.Column('path', sa.String(length=120), nullable=False),
+    sa.Column('size', sa.Integer(), nullable=False),
+    sa.Column('ref_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('sha256'),
+    if_not_exists=True
+    )
+
+    op.create_table('cache_version',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name'),
+    if_not_exists=True
+    )
+
+    op.create_table('user_counter',
+    sa.Column('name', sa.String(length=80), nullable=False),
+    sa.Column('value', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name'),
+    if_not_exists=True
+    )
+
+
+def downgrade():
+    op.drop_table('user_counter', if_exists=True)
+    op.drop_table('cache_version', if_exists=True)
+    op.drop_table('stored_file', if_exists=True)
+    op.drop_index('ix_subscription_department_event_user', table_name='notification_subscription', if_exists=True)
+    op.drop_table('notification_subscription', if_exists=True)
+    op.drop_index('ix_notification_outbox_status_next_attempt', table_name='notification_outbox', if_exists=True)
+    op.drop_table('notification_outbox', if_exists=True)
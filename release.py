@@ -0,0 +1,13 @@
+from app import create_app
+from app.schema import run_release
+from dotenv import load_dotenv
+
+load_dotenv()
+
+app = create_app()
+
+# Fase 'release' del Procfile: se ejecuta una vez por despliegue, antes de arrancar los
+# procesos. Aplica las migraciones y prepara los índices (ver app/schema.py).
+if __name__ == '__main__':
+    with app.app_context():
+        run_release()
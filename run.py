@@ -1,145 +1,23 @@
-from app import create_app, db
+from app import create_app
+from app.schema import check_schema, run_release
 from dotenv import load_dotenv
-import os
-from flask_migrate import upgrade
-from sqlalchemy import text, inspect
-from sqlalchemy.exc import ProgrammingError, InvalidRequestError
-
-# Importar modelos para que SQLAlchemy sepa qué tablas crear
-from app.models import (
-    User, TrafficFine, Comment, License, CriminalRecord,
-    Appointment, Business, Document
-)
 
 load_dotenv()
 
 app = create_app()
 
-# --- BLOQUE DE AUTO-INICIALIZACIÓN ---
-# Este código se ejecuta una vez cada vez que Gunicorn arranca la aplicación.
+# --- COMPROBACIÓN DE ARRANQUE ---
+# Cada worker de Gunicorn importa este módulo: aquí sólo se comprueba la revisión del esquema.
+# Las migraciones, índices y el usuario admin se aplican una vez por despliegue con
+# `python release.py` (fase release del Procfile). AUTO_MIGRATE=1 lo hace al arrancar (sólo local).
 with app.app_context():
-    try:
-        print("🔄 Verificando estado de la Base de Datos...")
-        
-        # 2. Crear Tablas (Si no existen, incluyendo Business)
-        try:
-            db.create_all()
-            print("✅ Tablas verificadas.")
-        except Exception as e:
-             print(f"❌ Error genérico en create_all: {e}")
-
-        # 3. Defensive Migration: Check for missing columns (Postgres/SQLite compatible)
+    if app.config['AUTO_MIGRATE']:
         try:
-            inspector = inspect(db.engine)
-            user_columns = [col['name'] for col in inspector.get_columns('user')]
-
-            # Check for 'on_duty'
-            if 'on_duty' not in user_columns:
-                print("⚠️ Columna 'on_duty' faltante en tabla 'user'. Agregando...")
-                with db.engine.connect() as conn:
-                    # Generic SQL that works for both if the default is handled carefully
-                    # Postgres: BOOLEAN DEFAULT FALSE
-                    # SQLite: BOOLEAN DEFAULT 0 (False)
-                    # We use SQLAlchemy text() for raw execution.
-                    # Note: SQLite doesn't support 'FALSE' keyword in some versions, but 0 works for both as boolean.
-                    # However, Postgres implies TRUE/FALSE.
-                    # Let's check dialect.
-                    if db.engine.dialect.name == 'postgresql':
-                        conn.execute(text('ALTER TABLE "user" ADD COLUMN on_duty BOOLEAN DEFAULT FALSE'))
-                    else:
-                        conn.execute(text('ALTER TABLE "user" ADD COLUMN on_duty BOOLEAN DEFAULT 0'))
-                    conn.commit()
-                print("✅ Columna 'on_duty' agregada.")
-
-            # Check for 'receive_notifications'
-            if 'receive_notifications' not in user_columns:
-                print("⚠️ Columna 'receive_notifications' faltante en tabla 'user'. Agregando...")
-                with db.engine.connect() as conn:
-                    if db.engine.dialect.name == 'postgresql':
-                        conn.execute(text('ALTER TABLE "user" ADD COLUMN receive_notifications BOOLEAN DEFAULT TRUE'))
-                    else:
-                        conn.execute(text('ALTER TABLE "user" ADD COLUMN receive_notifications BOOLEAN DEFAULT 1'))
-                    conn.commit()
-                print("✅ Columna 'receive_notifications' agregada.")
-
-            # Check for 'created_at' in Appointment (mentioned in comments)
-            appointment_columns = [col['name'] for col in inspector.get_columns('appointment')]
-            if 'created_at' not in appointment_columns:
-                print("⚠️ Columna 'created_at' faltante en tabla 'appointment'. Agregando...")
-                with db.engine.connect() as conn:
-                    # TIMESTAMP for Postgres, DATETIME for SQLite.
-                    # Using generic SQL might be tricky.
-                    # Postgres: TIMESTAMP DEFAULT NOW()
-                    # SQLite: DATETIME DEFAULT CURRENT_TIMESTAMP
-                    if db.engine.dialect.name == 'postgresql':
-                         conn.execute(text('ALTER TABLE appointment ADD COLUMN created_at TIMESTAMP DEFAULT NOW()'))
-                    else:
-                         conn.execute(text('ALTER TABLE appointment ADD COLUMN created_at DATETIME DEFAULT CURRENT_TIMESTAMP'))
-                    conn.commit()
-                print("✅ Columna 'created_at' agregada a Appointment.")
-
-            # Check for 'status' in Business
-            business_columns = [col['name'] for col in inspector.get_columns('business')]
-            if 'status' not in business_columns:
-                print("⚠️ Columna 'status' faltante en tabla 'business'. Agregando...")
-                with db.engine.connect() as conn:
-                    if db.engine.dialect.name == 'postgresql':
-                        conn.execute(text("ALTER TABLE business ADD COLUMN status VARCHAR(20) DEFAULT 'Pendiente'"))
-                    else:
-                        conn.execute(text("ALTER TABLE business ADD COLUMN status VARCHAR(20) DEFAULT 'Pendiente'"))
-                    conn.commit()
-                print("✅ Columna 'status' agregada a Business.")
-
-            # Check if license type column needs to be widened
-            try:
-                license_columns = inspector.get_columns('license')
-                for col in license_columns:
-                    if col['name'] == 'type':
-                        # In Postgres, the length might be inside the type object.
-                        # We can attempt a safe ALTER TABLE that works on Postgres and SQLite.
-                        # However, SQLite does not support ALTER COLUMN.
-                        if db.engine.dialect.name == 'postgresql':
-                            # Let's just run it defensively, if it's already 200, this is a no-op or fast.
-                            with db.engine.connect() as conn:
-                                conn.execute(text('ALTER TABLE license ALTER COLUMN type TYPE VARCHAR(200)'))
-                                conn.commit()
-                            print("✅ Columna 'type' en License ajustada a VARCHAR(200).")
-                        break
-            except Exception as inner_e:
-                print(f"⚠️ Could not verify/alter license table: {inner_e}")
-
+            run_release()
         except Exception as e:
-            print(f"❌ Error en Defensive Migration: {e}")
-
-
-        # 4. Crear Super Admin '000' (Si no existe)
-        admin = User.query.filter_by(badge_id="000").first()
-        if not admin:
-            print("🚀 Creando Usuario Admin (000/000)...")
-            
-            # Crear ciudadano base para el admin
-            admin = User(
-                first_name="Admin",
-                last_name="Gobierno",
-                dni="00000000A",
-                badge_id="000",
-                department="Gobierno",
-                official_rank="Lider",
-                official_status="Aprobado",
-                selfie_filename="default.jpg",
-                dni_photo_filename="default.jpg"
-            )
-            admin.set_password("000")
-            db.session.add(admin)
-            
-            print("✅ Usuario Admin creado exitosamente.")
-
-        db.session.commit()
-        print("✨ Inicialización completada.")
-
-    except Exception as e:
-        print(f"⚠️ Advertencia crítica durante la inicialización: {e}")
-        # No detenemos la app
+            print(f"⚠️ Advertencia crítica durante la inicialización: {e}")
+    else:
+        check_schema()
 
 if __name__ == '__main__':
     app.run(debug=True)
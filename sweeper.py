@@ -0,0 +1,15 @@
+import sys
+
+from app import create_app
+from app.license_expiry import run_license_sweeper
+from dotenv import load_dotenv
+
+load_dotenv()
+
+app = create_app()
+
+# Proceso independiente que vence las licencias caducadas y encola los avisos.
+# Se lanza como 'sweeper' en el Procfile; con --once hace una sola pasada (p.ej. desde cron).
+if __name__ == '__main__':
+    with app.app_context():
+        run_license_sweeper(once='--once' in sys.argv)
@@ -0,0 +1,97 @@
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from app import create_app, db
+from app.models import (
+    User, TrafficFine, Comment, License, CriminalRecord,
+    CriminalRecordSubjectPhoto, CriminalRecordEvidencePhoto, Business, BusinessFine, Document
+)
+
+
+# Cada prueba usa su propia base de datos SQLite temporal con el esquema de los modelos.
+
+@pytest.fixture
+def app(tmp_path):
+    class TestConfig(Config):
+        TESTING = True
+        WTF_CSRF_ENABLED = False
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + str(tmp_path / 'test.db')
+        UPLOAD_FOLDER = str(tmp_path / 'uploads')
+        SAFINDER_SEARCH_BACKEND = 'auto'
+
+    app = create_app(TestConfig)
+    with app.app_context():
+        from app.search import ensure_search_index
+        from app.citizen_search import ensure_citizen_search_index
+        from app.user_directory import ensure_user_counters
+
+        db.create_all()
+        ensure_search_index()
+        ensure_citizen_search_index()
+        ensure_user_counters()
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def make_user(dni, password='clave', **fields):
+    user = User(first_name=fields.pop('first_name', 'Nombre'), last_name=fields.pop('last_name', dni),
+                dni=dni, **fields)
+    if password:  # None: sin contraseña, para crear muchos usuarios sin el coste del hash
+        user.set_password(password)
+    db.session.add(user)
+    db.session.flush()
+    return user
+
+@pytest.fixture
+def officials():
+    """Líder de SABES y dos agentes que firman multas, antecedentes y comentarios."""
+    leader = make_user('L1', badge_id='100', department='SABES', official_rank='Lider', official_status='Aprobado')
+    agents = [
+        make_user(f'A{i}', badge_id=f'20{i}', department='SABES', official_status='Aprobado')
+        for i in range(2)
+    ]
+    db.session.commit()
+    return leader, agents
+
+def login_official(client, badge_id, password='clave'):
+    return client.post('/official/login', data={'badge_id': badge_id, 'password': password})
+
+def login_citizen(client, dni, password='clave'):
+    return client.post('/login', data={'dni': dni, 'password': password})
+
+def seed_citizen_history(citizen, authors, n=6):
+    """Multas, antecedentes con fotos, comentarios, licencias y negocios con licencias y multas."""
+    now = datetime.utcnow()
+    for i in range(n):
+        author = authors[i % len(authors)]
+        db.session.add(TrafficFine(reason=f'Multa {i}', user_id=citizen.id, author_id=author.id,
+                                   status='Pendiente' if i % 2 else 'Pagada', date=now - timedelta(days=i)))
+        db.session.add(Comment(content=f'Comentario {i}', user_id=citizen.id, author_id=author.id))
+        db.session.add(License(type=f'Licencia {i}', user_id=citizen.id, status='Activa'))
+
+        record = CriminalRecord(crime=f'Delito {i}', user_id=citizen.id, author_id=author.id, date=now.date())
+        db.session.add(record)
+        db.session.flush()
+        db.session.add(CriminalRecordSubjectPhoto(filename=f's{i}.jpg', record_id=record.id))
+        db.session.add(CriminalRecordEvidencePhoto(filename=f'e{i}.jpg', record_id=record.id))
+
+        business = Business(name=f'Negocio {i}', type='Bar', status='Aprobado', owner_id=citizen.id)
+        db.session.add(business)
+        db.session.flush()
+        db.session.add(License(type=f'Apertura {i}', user_id=citizen.id, business_id=business.id, status='Activa'))
+        db.session.add(BusinessFine(reason=f'Inspección {i}', business_id=business.id, author_id=author.id))
+
+        db.session.add(Document(title=f'Documento {i}', filename=f'doc{i}.pdf', text_content=f'texto {i}',
+                                uploader_id=author.id, created_at=now - timedelta(minutes=i)))
+    db.session.commit()
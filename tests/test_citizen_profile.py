@@ -0,0 +1,41 @@
+from app import db
+from app.sql_monitor import assert_max_queries, record_queries
+
+from conftest import make_user, login_official, seed_citizen_history
+
+
+# GET /official/citizen/<id> ejecuta 9 sentencias: usuario, licencias, negocios, licencias de
+# negocios, comentarios, antecedentes (+ 2 de fotos) y multas. Una de margen.
+PROFILE_MAX_QUERIES = 10
+
+
+def test_profile_query_count_is_fixed(client, officials):
+    leader, agents = officials
+    citizen = make_user('C1')
+    seed_citizen_history(citizen, agents, n=8)
+    citizen_id = citizen.id
+    login_official(client, leader.badge_id)
+    db.session.remove()  # La petición carga todo desde la base de datos, no del identity map
+
+    with assert_max_queries(PROFILE_MAX_QUERIES, threshold=3):
+        response = client.get(f'/official/citizen/{citizen_id}')
+    assert response.status_code == 200
+    assert b'Delito 7' in response.data
+    assert b'Apertura 7' in response.data
+
+
+def test_profile_query_count_does_not_grow_with_history(client, officials):
+    leader, agents = officials
+    small, large = make_user('C1'), make_user('C2')
+    seed_citizen_history(small, agents, n=1)
+    seed_citizen_history(large, agents, n=12)
+    citizen_ids = [small.id, large.id]
+    login_official(client, leader.badge_id)
+
+    counts = []
+    for citizen_id in citizen_ids:
+        db.session.remove()
+        with record_queries() as recorder:
+            assert client.get(f'/official/citizen/{citizen_id}').status_code == 200
+        counts.append(recorder.count)
+    assert counts[0] == counts[1]
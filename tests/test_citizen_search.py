@@ -0,0 +1,46 @@
+from config import Config
+from app import create_app, db
+from app.citizen_search import search_citizens, count_citizens, SQLITE_CANDIDATE_LIMIT
+
+from conftest import make_user
+
+
+def test_pages_come_from_one_ordered_candidate_set(app):
+    # Mismos trigramas compartidos con la consulta; el orden final lo decide la longitud del
+    # nombre, que es más corto en los últimos usuarios creados
+    for i in range(120):
+        make_user(f'{40000 + i}X', first_name='Juan', last_name='G' + 'a' * (120 - i), password=None)
+    db.session.commit()
+
+    everything = [user.id for user in search_citizens('juan', limit=200)]
+    paged = []
+    for page in range(13):
+        paged += [user.id for user in search_citizens('juan', limit=10, offset=page * 10)]
+
+    assert len(everything) == 120
+    assert paged == everything
+
+
+def test_prefix_matches_rank_ahead_of_a_capped_candidate_set(app):
+    # Más candidatos que SQLITE_CANDIDATE_LIMIT con los mismos trigramas; el único que empieza
+    # por la consulta es el último creado
+    for i in range(SQLITE_CANDIDATE_LIMIT + 5):
+        make_user(f'{50000 + i}X', first_name='Garcia', last_name='Juan', password=None)
+    target = make_user('59999X', first_name='Juan', last_name='Garcia', password=None)
+    db.session.commit()
+
+    assert search_citizens('juan garcia', limit=1)[0].id == target.id
+    assert count_citizens('juan garcia') == (SQLITE_CANDIDATE_LIMIT, False)
+    assert count_citizens(target.dni) == (1, True)
+
+
+def test_gram_index_is_tracked_per_database(app, tmp_path):
+    # Otra base de datos sin ensure_citizen_search_index(): crear usuarios no debe tocar user_search_gram
+    class OtherConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + str(tmp_path / 'other.db')
+
+    with create_app(OtherConfig).app_context():
+        db.create_all()
+        make_user('C1')
+        db.session.commit()
+        db.session.remove()
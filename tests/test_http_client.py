@@ -0,0 +1,68 @@
+import requests
+
+from app import db, http_client
+from app.http_client import OutboundClient
+
+from conftest import make_user, login_citizen, login_official
+
+URL = 'https://discord.com/api/v10/users/@me'
+
+
+class FakeSession:
+    """Devuelve las respuestas indicadas en orden y cuenta las llamadas."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def request(self, method, url, timeout=None, **kwargs):
+        self.calls += 1
+        return self.responses.pop(0)
+
+
+def make_response(status, headers=None):
+    resp = requests.Response()
+    resp.status_code = status
+    resp.headers.update(headers or {})
+    return resp
+
+
+def make_client(monkeypatch, session):
+    sleeps = []
+    monkeypatch.setattr(http_client.time, 'sleep', sleeps.append)
+    client = OutboundClient(max_retry_after=5)
+    client._sessions['https://discord.com'] = session
+    return client, sleeps
+
+
+def test_rate_limit_waits_for_retry_after(monkeypatch):
+    session = FakeSession(make_response(429, {'Retry-After': '2.5'}), make_response(200))
+    client, sleeps = make_client(monkeypatch, session)
+
+    assert client.get(URL, endpoint='discord_api').status_code == 200
+    assert sleeps == [2.5]
+    assert session.calls == 2
+
+
+def test_long_rate_limit_returns_without_retrying(monkeypatch):
+    session = FakeSession(make_response(429, {'Retry-After': '30'}), make_response(200))
+    client, sleeps = make_client(monkeypatch, session)
+
+    assert client.get(URL, endpoint='discord_api').status_code == 429
+    assert sleeps == []
+    assert session.calls == 1
+    assert client.stats()['discord_api']['calls'] == 1
+
+
+def test_stats_endpoint_is_for_officials(client, officials):
+    leader, _ = officials
+    make_user('C1')
+    db.session.commit()
+
+    login_citizen(client, 'C1')
+    assert client.get('/api/http_client/stats').status_code == 403
+    client.get('/logout')
+    login_official(client, leader.badge_id)
+    response = client.get('/api/http_client/stats')
+    assert response.status_code == 200
+    assert 'circuits' in response.get_json()
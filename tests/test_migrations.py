@@ -0,0 +1,31 @@
+import os
+import shutil
+
+from flask_migrate import upgrade
+from sqlalchemy import inspect
+
+from config import Config
+from app import create_app, db
+from app.schema import MIGRATIONS_DIR, current_revision, head_revision
+
+REPO_DB = os.path.join(os.path.dirname(MIGRATIONS_DIR), 'hermes_local.db')
+
+
+def test_upgrade_alone_builds_the_model_schema(tmp_path):
+    # hermes_local.db está en la revisión base: sin create_all(), las migraciones solas
+    # deben dejar todas las tablas y columnas de los modelos
+    path = tmp_path / 'hermes.db'
+    shutil.copy(REPO_DB, path)
+
+    class TestConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{path}'
+
+    with create_app(TestConfig).app_context():
+        upgrade(directory=MIGRATIONS_DIR)
+        assert current_revision() == head_revision()
+
+        inspector = inspect(db.engine)
+        for table in db.metadata.sorted_tables:
+            columns = {column['name'] for column in inspector.get_columns(table.name)}
+            assert columns == set(table.columns.keys()), table.name
+        db.session.remove()
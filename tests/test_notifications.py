@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+
+from app import db
+from app.models import NotificationOutbox, TrafficFine
+from app.notifications import dispatch_pending
+from app.routes import notify_discord_bot
+
+from conftest import make_user, login_official
+
+
+class FakeBot:
+    """Responde a /notify_batch como el bot y guarda cada llamada."""
+
+    def __init__(self):
+        self.calls = []
+
+    def post(self, url, endpoint=None, json=None, timeout=None):
+        self.calls.append(json)
+        results = [{'discord_id': r['discord_id'], 'status': 'sent'} for r in json['recipients']]
+        return FakeResponse({'results': results})
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+
+def test_large_groups_are_split_across_calls(app):
+    app.config['OUTBOX_RECIPIENTS_PER_CALL'] = 50
+    past = datetime.utcnow() - timedelta(seconds=1)
+    db.session.add_all(
+        NotificationOutbox(discord_id=str(1000 + i), message='Aviso', next_attempt_at=past) for i in range(120)
+    )
+    db.session.commit()
+
+    bot = FakeBot()
+    assert dispatch_pending(bot, batch_size=200) == (120, 0, 0)
+    assert [len(call['recipients']) for call in bot.calls] == [50, 50, 20]
+    assert NotificationOutbox.query.filter_by(status='Enviada').count() == 120
+
+
+def test_notify_leaves_the_commit_to_the_caller(app):
+    citizen = make_user('C1', discord_id='555')
+    db.session.commit()
+
+    db.session.add(TrafficFine(reason='Exceso', user_id=citizen.id))
+    notify_discord_bot(citizen, 'Aviso')
+    db.session.rollback()
+    assert NotificationOutbox.query.count() == 0
+    assert TrafficFine.query.count() == 0
+
+
+def test_fine_and_notice_are_saved_together(client, officials):
+    leader, _ = officials
+    citizen_id = make_user('C1', discord_id='555').id
+    db.session.commit()
+    login_official(client, leader.badge_id)
+
+    client.post(f'/official/citizen/{citizen_id}/add_traffic_fine', data={'reason': 'Exceso'})
+    db.session.remove()
+    assert TrafficFine.query.filter_by(user_id=citizen_id).count() == 1
+    assert [e.discord_id for e in NotificationOutbox.query.all()] == ['555']
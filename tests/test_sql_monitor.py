@@ -0,0 +1,95 @@
+import logging
+
+import pytest
+from sqlalchemy import bindparam, select
+
+from app import db
+from app.models import User, TrafficFine, Document
+from app.search import index_document
+from app.sql_monitor import assert_max_queries, normalize_sql, record_queries, logger as sql_logger
+
+from conftest import make_user, login_citizen, login_official, seed_citizen_history
+
+
+def test_normalize_sql_collapses_literals_and_in_lists():
+    assert normalize_sql("SELECT * FROM user WHERE id IN (?, ?, ?) AND dni = 'X1'") == \
+        normalize_sql("SELECT * FROM user WHERE id IN (?) AND dni = 'Y22'") == \
+        'SELECT * FROM user WHERE id IN (...) AND dni = ?'
+    assert normalize_sql('SELECT * FROM user\n  WHERE id = 42 LIMIT 10') == 'SELECT * FROM user WHERE id = ? LIMIT ?'
+
+
+def test_expanding_in_lists_share_one_shape(app):
+    user_ids = [make_user(f'C{i}').id for i in range(4)]
+    db.session.commit()
+    stmt = select(User.id).where(User.id.in_(bindparam('ids', expanding=True)))
+
+    with record_queries() as recorder:
+        for size in (1, 2, 4):
+            db.session.execute(stmt, {'ids': user_ids[:size]}).all()
+        User.query.filter(User.id.in_(user_ids[:2])).all()
+
+    assert recorder.count == 4
+    in_shapes = [shape for shape in recorder.statements if 'IN (...)' in shape]
+    assert len(in_shapes) == 2
+    assert [recorder.statements[shape]['count'] for shape in in_shapes] == [3, 1]
+
+
+def test_assert_max_queries_catches_n_plus_one_in_my_fines(client):
+    # my_fines.html lee fine.author por cada multa pendiente: una consulta por autor distinto
+    citizen = make_user('C1')
+    authors = [make_user(f'A{i}', badge_id=f'30{i}', department='SABES') for i in range(6)]
+    for i, author in enumerate(authors):
+        db.session.add(TrafficFine(reason=f'Multa {i}', user_id=citizen.id, author_id=author.id, status='Pendiente'))
+    db.session.commit()
+    login_citizen(client, 'C1')
+    db.session.remove()
+
+    with pytest.raises(AssertionError, match=r'posible N\+1: 6x SELECT'):
+        with assert_max_queries(50, threshold=3):
+            assert client.get('/my_fines').status_code == 200
+
+
+def test_business_registry_query_count_is_fixed(client, officials):
+    leader, agents = officials
+    for i in range(4):
+        seed_citizen_history(make_user(f'C{i}'), agents, n=5)
+    login_official(client, leader.badge_id)
+    db.session.remove()
+
+    with assert_max_queries(6, threshold=3):
+        response = client.get('/official/businesses')
+    assert response.status_code == 200
+    assert b'Negocio 4' in response.data
+
+
+@pytest.mark.parametrize('path', ['/official/safinder', '/official/safinder?q=texto'])
+def test_safinder_query_count_is_fixed(client, officials, path):
+    leader, agents = officials
+    seed_citizen_history(make_user('C1'), agents + [leader], n=12)
+    for doc in Document.query.all():
+        index_document(doc)
+    db.session.commit()
+    login_official(client, leader.badge_id)
+    db.session.remove()
+
+    with assert_max_queries(8, threshold=3):
+        response = client.get(path)
+    assert response.status_code == 200
+    assert b'Documento 11' in response.data  # fuera de la lista de recientes
+
+
+def test_request_summary_is_logged_outside_debug(client, officials):
+    leader, _ = officials
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    sql_logger.addHandler(handler)
+    try:
+        login_official(client, leader.badge_id)
+        client.get('/official/businesses')
+    finally:
+        sql_logger.removeHandler(handler)
+
+    assert not client.application.debug
+    assert any(r.getMessage().startswith('sql_request') and '"main.official_businesses"' in r.getMessage()
+               for r in records)
@@ -0,0 +1,257 @@
+"""
+Benchmark del camino de notificaciones (toggle de servicio y aprobación de licencias).
+
+Levanta un bot de pruebas (aiohttp) que imita /notify, /notify_batch y /setup_account de
+bot/main.py con latencia y 429 configurables, siembra N usuarios vinculados en una base
+SQLite temporal y recorre las rutas de Flask con el test client.
+
+Uso:
+    python verification/bench_notifications.py --users 2000 --iterations 20 --latency-ms 20 --rate-limit 0.05 --retry-after-ms 1000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from aiohttp import web
+
+from config import Config
+
+
+# --- BOT DE PRUEBAS ---
+
+class StubBot:
+    """
+    Imita a bot/main.py: cada DM tarda `latency_ms` (la API de Discord), /notify_batch envía
+    `concurrency` DMs a la vez (NOTIFY_CONCURRENCY) y ante un 429 espera `retry_after_ms`
+    y reintenta hasta `max_retries` veces (NOTIFY_MAX_RETRIES); si sigue limitado el DM pasa
+    a la cola persistente del bot y el destinatario vuelve como 'queued'. /notify no
+    reintenta: un 429 va directo a la cola (202).
+    """
+
+    def __init__(self, latency_ms, rate_limit, port, concurrency=5, retry_after_ms=1000, max_retries=3):
+        self.latency = latency_ms / 1000.0
+        self.rate_limit = rate_limit
+        self.port = port
+        self.concurrency = concurrency
+        self.retry_after = retry_after_ms / 1000.0
+        self.max_retries = max_retries
+        self.delivered = 0
+        self.queued = 0
+        self.rate_limited = 0
+        self.requests = 0
+        self.batch_ms = []
+        self._lock = threading.Lock()
+        self._loop = None
+        self._runner = None
+
+    def _count(self, **fields):
+        with self._lock:
+            for name, amount in fields.items():
+                setattr(self, name, getattr(self, name) + amount)
+
+    async def _deliver(self, max_retries):
+        # Como deliver_dm: 'sent', o 'queued' si el rate limit dura más que los reintentos
+        for attempt in range(max_retries + 1):
+            await asyncio.sleep(self.latency)
+            if random.random() >= self.rate_limit:
+                self._count(delivered=1)
+                return 'sent'
+            self._count(rate_limited=1)
+            if attempt < max_retries:
+                await asyncio.sleep(self.retry_after)
+        self._count(queued=1)
+        return 'queued'
+
+    async def handle_notify(self, request):
+        await request.json()
+        self._count(requests=1)
+        status = await self._deliver(0)
+        return web.json_response({'status': status}, status=200 if status == 'sent' else 202)
+
+    async def handle_notify_batch(self, request):
+        data = await request.json()
+        self._count(requests=1)
+        start = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def send(rcpt):
+            discord_id = rcpt.get('discord_id') if isinstance(rcpt, dict) else rcpt
+            async with semaphore:
+                return {'discord_id': str(discord_id), 'status': await self._deliver(self.max_retries)}
+
+        results = await asyncio.gather(*(send(rcpt) for rcpt in data.get('recipients', [])))
+        with self._lock:
+            self.batch_ms.append((time.perf_counter() - start) * 1000)
+        return web.json_response({'results': results})
+
+    async def handle_setup_account(self, request):
+        await request.json()
+        self._count(requests=1)
+        return web.Response(status=202, text="Setup accepted")
+
+    def start(self):
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            app = web.Application()
+            app.router.add_post('/notify', self.handle_notify)
+            app.router.add_post('/notify_batch', self.handle_notify_batch)
+            app.router.add_post('/setup_account', self.handle_setup_account)
+            self._runner = web.AppRunner(app)
+            self._loop.run_until_complete(self._runner.setup())
+            site = web.TCPSite(self._runner, '127.0.0.1', self.port)
+            self._loop.run_until_complete(site.start())
+            ready.set()
+            self._loop.run_forever()
+
+        threading.Thread(target=run, daemon=True).start()
+        ready.wait()
+
+    def stop(self):
+        if self._loop:
+            asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+# --- UTILIDADES ---
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+def report(name, samples):
+    print(f"  {name:<28} n={len(samples):<5} p50={percentile(samples, 50):8.2f} ms  "
+          f"p99={percentile(samples, 99):8.2f} ms  max={max(samples or [0]):8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de notificaciones con bot de pruebas")
+    parser.add_argument('--users', type=int, default=1000, help="Usuarios vinculados a Discord")
+    parser.add_argument('--iterations', type=int, default=10, help="Toggles de servicio / aprobaciones de licencia")
+    parser.add_argument('--latency-ms', type=float, default=10, help="Latencia de Discord por DM en el bot de pruebas")
+    parser.add_argument('--rate-limit', type=float, default=0.0, help="Probabilidad de 429 por envío de DM (0-1)")
+    parser.add_argument('--retry-after-ms', type=float, default=1000, help="Espera que pide cada 429")
+    parser.add_argument('--concurrency', type=int, default=5, help="DMs simultáneos del bot (NOTIFY_CONCURRENCY)")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--max-rounds', type=int, default=500, help="Rondas máximas del dispatcher")
+    args = parser.parse_args()
+
+    db_dir = tempfile.mkdtemp(prefix='bench_notif_')
+    db_path = os.path.join(db_dir, 'bench.db')
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + db_path
+        WTF_CSRF_ENABLED = False
+        BOT_URL = f"http://127.0.0.1:{args.port}"
+        NOTIFY_COALESCE_WINDOW_SECONDS = 0
+        OUTBOX_RETRY_BASE_SECONDS = 0
+        OUTBOX_MAX_ATTEMPTS = 10
+        HTTP_BREAKER_THRESHOLD = 1000
+
+    from app import create_app, db
+    from app.models import User, License, NotificationOutbox
+    from app.notifications import set_subscriptions, dispatch_pending, NOTIFICATION_DEPARTMENTS
+
+    app = create_app(BenchConfig)
+    stub = StubBot(args.latency_ms, args.rate_limit, args.port,
+                   concurrency=args.concurrency, retry_after_ms=args.retry_after_ms)
+    stub.start()
+
+    # --- Semilla ---
+    with app.app_context():
+        db.create_all()
+        officer = User(first_name='Bench', last_name='Oficial', dni='BENCH-OF', badge_id='B-1',
+                       department='SABES', official_rank='Lider', official_status='Aprobado')
+        officer.set_password('bench')
+        db.session.add(officer)
+
+        citizens = [
+            User(first_name=f'Ciudadano{i}', last_name='Bench', dni=f'BENCH-{i}', discord_id=str(10 ** 17 + i))
+            for i in range(args.users)
+        ]
+        db.session.add_all(citizens)
+        db.session.flush()
+        for citizen in citizens:
+            set_subscriptions(citizen, NOTIFICATION_DEPARTMENTS, 'duty')
+
+        licenses = [
+            License(type='Credencial Oficial de Aviación y Pilotaje', status='Pendiente', user_id=citizens[i % len(citizens)].id)
+            for i in range(args.iterations)
+        ]
+        db.session.add_all(licenses)
+        db.session.commit()
+        license_ids = [lic.id for lic in licenses]
+
+    print(f"Sembrados {args.users} usuarios vinculados en {db_path}")
+
+    # --- Rutas ---
+    client = app.test_client()
+    client.post('/official/login', data={'badge_id': 'B-1', 'password': 'bench'})
+
+    toggle_ms, license_ms = [], []
+    for _ in range(args.iterations):
+        start = time.perf_counter()
+        client.post('/official/toggle_duty')
+        toggle_ms.append((time.perf_counter() - start) * 1000)
+
+    for license_id in license_ids:
+        start = time.perf_counter()
+        client.post(f'/official/licenses/action/{license_id}/approve')
+        license_ms.append((time.perf_counter() - start) * 1000)
+
+    # --- Dispatcher ---
+    dispatch_ms = []
+    with app.app_context():
+        enqueued = NotificationOutbox.query.count()
+        rounds = 0
+        while rounds < args.max_rounds:
+            start = time.perf_counter()
+            sent, retried, failed = dispatch_pending()
+            dispatch_ms.append((time.perf_counter() - start) * 1000)
+            rounds += 1
+            if not (sent or retried or failed):
+                break
+
+        counts = dict(
+            db.session.query(NotificationOutbox.status, db.func.count())
+            .group_by(NotificationOutbox.status).all()
+        )
+
+    stub.stop()
+
+    print("\nLatencia de peticiones web:")
+    report('POST /official/toggle_duty', toggle_ms)
+    report('POST licencia approve', license_ms)
+    report('dispatch_pending (lote)', dispatch_ms)
+    report('bot /notify_batch', stub.batch_ms)
+    timeout_ms = app.config['OUTBOX_HTTP_TIMEOUT'] * 1000
+    print(f"  Llamadas /notify_batch por encima de OUTBOX_HTTP_TIMEOUT ({timeout_ms:.0f} ms): "
+          f"{sum(1 for ms in stub.batch_ms if ms > timeout_ms)}")
+
+    print("\nEntrega:")
+    print(f"  Encoladas en outbox:     {enqueued}")
+    print(f"  Estados outbox:          {counts}")
+    print(f"  Entregadas por el bot:   {stub.delivered}")
+    print(f"  A la cola del bot:       {stub.queued}")
+    print(f"  429 inyectados:          {stub.rate_limited}")
+    print(f"  Llamadas web -> bot:     {stub.requests}")
+    print(f"  Descartadas (Fallida):   {counts.get('Fallida', 0)}")
+    print(f"  Pendientes al terminar:  {counts.get('Pendiente', 0)}  ({rounds} rondas)")
+    print(f"\nFecha: {datetime.utcnow():%Y-%m-%d %H:%M:%S} UTC")
+
+
+if __name__ == '__main__':
+    main()